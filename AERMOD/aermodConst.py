@@ -2,6 +2,10 @@ secondsInYear = 31556952
 secondsInDay = 86400
 receptorSpacing = 200 # in meters
 receptorLayerScales = [5,20,100] # distance from edge of road (m)
+# a source gets one receptor layer and one more for every threshold
+# that the position of its log flux in the log flux range of all
+# sources reaches (used with flux adaptive receptor layers)
+receptorLayerThresholds = [1/3,2/3]
 sourceHeight = 1.4 # meters above ground
 receptorHeight = 1.5 # meters
 feet2meters = 0.3048 # conversion factor from feet to meters
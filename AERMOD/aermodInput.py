@@ -1,56 +1,98 @@
 #!/usr/bin/env python3
 
+import numpy as np
 import pandas as pd
 import geopandas as gpd
 import networkx as nx
 from shapely.geometry import Point,LineString
 from shapely.wkt import loads
 from shapely.strtree import STRtree
+from shapely import points,prepare,contains_xy
 import math
 import argparse
-import multiprocessing as mp
-from itertools import chain
 import hashlib
 import os
+import sys
 from aermodConst import *
 
 home = os.path.dirname(__file__)
+sys.path.append(os.path.join(os.path.abspath(home),'..','common'))
+from linkKeys import linkKeyFromID,unpackLinkKey
+from instrument import log,count,progress
+
 aermodTemplate = open(os.path.join(home,'AERMOD_input_template.txt')).read()
 
-# functions for parallel receptor checking
-output = mp.SimpleQueue()
-
-def checkReceptorGroup(tree,data):
-    indices = []
-    for idx,row in data.iterrows():
-        if tree.nearest(row.location).contains(row.location):
-            print('Dropping',row.receptorID)
-            indices.append(idx)
-    output.put(indices)
-
-
-def checkAllReceptors(tree,receptors,numGroups = None):
-    numReceptors = receptors.index.size
-    if numGroups is None: numGroups = mp.cpu_count()
-    groupSize = 1 + int(numReceptors/numGroups)
-    args = []
-    for start in range(0,numReceptors,groupSize):
-        if start >= numReceptors: break
-        stop = start + groupSize
-        if stop > numReceptors: stop = numReceptors
-        args.append((tree,receptors.iloc[range(start,stop)]))
-        
-    procs = [mp.Process(target = checkReceptorGroup,args = arg)
-             for arg in args]
-    
-    for p in procs: p.start()
-    for p in procs:
-        if p.is_alive():
-            print('Joining',p.name)
-            p.join(timeout = 10)
-            
-    indices = [output.get() for p in procs]
-    return list(chain(*indices))
+def receptorsInSources(tree,locations):
+    # the sorted positions of the locations that fall inside any of the
+    # source buffers of the tree in one bulk query; every buffer that
+    # contains a location counts, not only the nearest one
+    positions,_ = tree.query(locations,predicate = 'within')
+    return np.unique(positions)
+
+
+def receptorCounts(sources):
+    # the number of receptors per side and layer of every source
+    length = np.hypot(sources.x2.values - sources.x1.values,
+                      sources.y2.values - sources.y1.values)
+    return (length/receptorSpacing).astype(np.int64) + 1
+
+
+def fluxLayerCounts(flux,thresholds = receptorLayerThresholds):
+    # the number of receptor layers of every source from the position
+    # of its log flux in the log flux range of all sources: one layer
+    # and one more for every threshold that the position reaches, but
+    # no more than the layers of receptorLayerScales
+    logFlux = np.log(np.asarray(flux,dtype = float))
+    if not len(logFlux): return np.zeros(0,dtype = np.int64)
+    logFluxDiff = logFlux.max() - logFlux.min()
+    if logFluxDiff > 0:
+        position = (logFlux - logFlux.min())/logFluxDiff
+    else:
+        position = np.ones(len(logFlux))
+    numLayers = 1 + np.searchsorted(np.sort(thresholds),position,
+                                    side = 'right')
+    return np.minimum(numLayers,len(receptorLayerScales))
+
+
+def receptorLayers(sources,numLayers = None):
+    # the receptors of the straight line sources in closed form: the
+    # equidistant points centered along the source at receptorSpacing
+    # on either side of it at the distances of receptorLayerScales
+    # from its edge, in the order of the source, the layer, the point
+    # along the source and the side (right first); numLayers limits
+    # every source to its first layers
+    x1,y1 = sources.x1.values,sources.y1.values
+    dx,dy = sources.x2.values - x1,sources.y2.values - y1
+    length = np.sqrt(dx*dx + dy*dy)
+    numReceptors = (length/receptorSpacing).astype(np.int64) + 1
+    startPos = 0.5*(length - receptorSpacing*(numReceptors - 1))
+    if numLayers is None: numLayers = len(receptorLayerScales)
+
+    counts = 2*numLayers*numReceptors
+    source = np.repeat(np.arange(len(sources)),counts)
+    k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts,
+                                            counts)
+    perLayer = 2*numReceptors[source]
+    layerID = k//perLayer
+    receptorIdx = (k % perLayer)//2
+    offsetIdx = k % 2
+
+    # the distance from the centerline, positive to the right
+    dist = np.asarray(receptorLayerScales,dtype = float)[layerID] + \
+        0.5*sources.width.values[source]
+    dist = np.where(offsetIdx == 0,dist,-dist)
+    pos = startPos[source] + receptorIdx*receptorSpacing
+    ux,uy = dx[source]/length[source],dy[source]/length[source]
+    x = x1[source] + pos*ux + dist*uy
+    y = y1[source] + pos*uy - dist*ux
+    return pd.DataFrame({
+        'receptorID':[
+            f'{sourceID}_{layer}_{idx}_{offset}' for sourceID,layer,idx,offset
+            in zip(sources.sourceID.values[source].tolist(),layerID.tolist(),
+                   receptorIdx.tolist(),offsetIdx.tolist())
+        ],
+        'geometry':points(x,y)
+    })
 
 
 class AermodScenario(object):
@@ -94,15 +136,19 @@ class AermodScenario(object):
         # filter on and pollutant
         emissions = emissions.query(f'pollutantID == {self.pollutantID}')
 
-        # aggregate to link
-        emissions = emissions.groupby('linkID').emquant.sum().reset_index()
+        # aggregate to link on the integer link keys
+        emissions = emissions.assign(
+            linkID = linkKeyFromID(emissions.linkID)
+        ).groupby('linkID').emquant.sum().reset_index()
 
-        # iterate and add the emission flux to every link
-        for idx,row in emissions.iterrows():
-            a,b = map(int,row['linkID'].split('-'))
+        # unpack the node IDs of all links at once and add the
+        # emission flux to every link
+        aNodes,bNodes = unpackLinkKey(emissions.linkID)
+        for a,b,emquant in zip(aNodes.tolist(),bNodes.tolist(),
+                               emissions.emquant.values):
             link = self.network[a][b]
             area = link['geometry'].length*link['width']
-            link['flux'] = row['emquant']/(area*secondsInDay)
+            link['flux'] = emquant/(area*secondsInDay)
             
 
     def makeSources(self):
@@ -114,11 +160,11 @@ class AermodScenario(object):
         for a,b,link in self.network.edges(data = True):
             flux = link.get('flux')
             if not flux: continue
-            points = [Point(p) for p in link['geometry'].coords]
-            for index in range(len(points) - 1):
+            vertices = [Point(p) for p in link['geometry'].coords]
+            for index in range(len(vertices) - 1):
                 sourceID = f'{a}_{b}_{index}'
-                start = points[index]
-                end = points[index + 1]
+                start = vertices[index]
+                end = vertices[index + 1]
                 # discard very short (< 1 meter) segments
                 if start.distance(end) < 1: continue
                 geom = LineString((start,end))
@@ -147,129 +193,71 @@ class AermodScenario(object):
             lambda ID: hashlib.md5(ID.encode()).hexdigest()[:12]
         )
             
-        print('Finished making sources')
-
-
-    def addReceptorLayers(self,source):
-        # link length and number of receptors along the link
-        length = source.geometry.length
-        numReceptors = int(length/receptorSpacing) + 1
-        # starting position of receptors along the link
-        startPos = 0.5*(length - receptorSpacing*(numReceptors - 1))
-        receptors = []
-        for layerID,scale in enumerate(receptorLayerScales): 
-            # receptor distance from link centerline
-            dist = scale + 0.5*source.width
-
-            print('Adding',numReceptors,'for layer',layerID,
-                  'source',source.sourceID)
-
-
-            # the link shifted normally to itself on either side
-            offsets = [source.geometry.parallel_offset(dist),
-                       source.geometry.parallel_offset(-dist)]
-
-            for receptorIdx in range(numReceptors):
-                # generate equidistant points along the parallel offsets
-                for offsetIdx,offset in enumerate(offsets):
-                    location = offset.interpolate(
-                        startPos + receptorIdx*receptorSpacing
-                    )
-
-                    receptorID = '{}_{}_{}_{}'.format(
-                        source.sourceID,
-                        layerID,
-                        receptorIdx,
-                        offsetIdx
-                    )
-
-                    receptors.append({
-                        'receptorID':receptorID,
-                        'location':location
-                    })
-
-        return receptors
-    
+        count('sources',len(self.lineSources))
+        log.info(f'Finished making {len(self.lineSources)} sources')
+
 
     def makeGridReceptors(self):
         # add gridded receptors with xy spacing of receptorSpacing
+        # inside the study area
         xmin,ymin,xmax,ymax = self.studyArea.bounds
         numX = int((xmax - xmin)/receptorSpacing) + 1
         numY = int((ymax - ymin)/receptorSpacing) + 1
         xoffset = 0.5*(xmax - xmin - receptorSpacing*(numX - 1))
         yoffset = 0.5*(ymax - ymin - receptorSpacing*(numY - 1))
-        receptors = []
-        for xIdx in range(numX):
-            x = xmin + xoffset + xIdx*receptorSpacing
-            for yIdx in range(numY):
-                y = ymin + yoffset + yIdx*receptorSpacing
-                location = Point((x,y))
-                # skip if the receptor is outside the study area
-                if not self.studyArea.contains(location):
-                    continue
-
-                # add otherwise
-                receptorID = f'grid_{xIdx}_{yIdx}'
-                print('adding grid receptor',receptorID)
-                receptors.append({
-                    'receptorID':receptorID,
-                    'location':location
-                })
-
-        self.receptors = self.receptors.append(
-            receptors,ignore_index = True
-        )
+        xIdx,yIdx = np.meshgrid(np.arange(numX),np.arange(numY),
+                                indexing = 'ij')
+        x = xmin + xoffset + xIdx.ravel()*receptorSpacing
+        y = ymin + yoffset + yIdx.ravel()*receptorSpacing
+        prepare(self.studyArea)
+        inside = contains_xy(self.studyArea,x,y)
+        receptors = pd.DataFrame({
+            'receptorID':[f'grid_{i}_{j}' for i,j in zip(
+                xIdx.ravel()[inside].tolist(),yIdx.ravel()[inside].tolist()
+            )],
+            'geometry':points(x[inside],y[inside])
+        })
+
+        count('gridReceptors',len(receptors))
+        self.receptors = pd.concat([self.receptors,receptors],
+                                   ignore_index = True)
 
 
     def makeLinkReceptors(self):
-        numSources = len(self.lineSources)
-        receptors = []
-        for idx,(sourceID,source) in enumerate(self.lineSources.iterrows()):
-            print('Processing source',idx,'out of',numSources)
-            receptors.extend(self.addReceptorLayers(source))
-
-        self.receptors = pd.DataFrame(
-            receptors,
-            columns = ['receptorID','geometry']
-        )
+        self.receptors = receptorLayers(self.lineSources)
+        count('linkReceptors',len(self.receptors))
 
         
-    def makeSourceReceptors(self):
-        # iterate over the links that have an emission rate; compute
-        # the number of receptor layers using the log scale of the
-        # link areal emissions rate.  The links with the maxFlux
-        # should have 3 layers.  The distances of the receptor layers
-        # from the roadway are defined in aermodConst.py
-        maxLogFlux = math.log(self.lineSources.flux.max())
-        minLogFlux = math.log(self.lineSources.flux.min())
-        logFluxDiff = maxLogFlux - minLogFlux
-
-        numSources = len(self.lineSources)
-        receptors = []
-        for idx,(sourceID,source) in enumerate(self.lineSources.iterrows()):
-            print('Processing source',idx + 1,'out of',numSources)
-            logFlux = math.log(source.flux)
-            numReceptorLayers = 1 + int(
-                len(receptorLayerScales)*(logFlux - minLogFlux)/logFluxDiff
-            )
-            if numReceptorLayers > len(receptorLayerScales):
-                numReceptorLayers = len(receptorLayerScales)
-                
-            # print('Processing source',idx+1,'out of',numSources,
-            #       numReceptorLayers,'layers')
-            receptors.extend(self.addReceptorLayers(source))
-
-        self.receptors = pd.DataFrame(
-            receptors,columns = ['receptorID','geometry']
-        )
+    def makeSourceReceptors(self,thresholds = receptorLayerThresholds):
+        # the receptor layers of the links that have an emission rate;
+        # the number of layers of a source grows with its log flux so
+        # that the sources with the highest flux have all layers (see
+        # fluxLayerCounts).  The distances of the receptor layers from
+        # the roadway are defined in aermodConst.py
+        numLayers = fluxLayerCounts(self.lineSources.flux.values,
+                                    thresholds)
+        self.receptors = receptorLayers(self.lineSources,numLayers)
+        fullLayers = 2*len(receptorLayerScales)*\
+            receptorCounts(self.lineSources).sum()
+        for layers,numSources in zip(*np.unique(numLayers,
+                                                return_counts = True)):
+            log.info(f'{numSources} sources with {layers} receptor layers')
+        count('fullLayerReceptors',int(fullLayers))
+        count('sourceReceptors',len(self.receptors))
+        log.info(f'Made {len(self.receptors)} source receptors instead of '
+                 f'{fullLayers} in all layers, '
+                 f'{100*(1 - len(self.receptors)/max(fullLayers,1)):.1f}% '
+                 f'fewer')
 
 
     def dropReceptorsInSources(self):
-        idsToDrop = set(checkAllReceptors(self.tree,self.receptors))
+        positions = receptorsInSources(self.tree,
+                                       self.receptors.geometry.values)
+        count('droppedReceptors',len(positions))
         # remove the receptors that fall into sources
-        self.receptors = self.receptors[
-            ~self.receptors.receptorID.isin(idsToDrop)
-        ]
+        keep = np.ones(len(self.receptors),dtype = bool)
+        keep[positions] = False
+        self.receptors = self.receptors[keep]
 
 
     def saveReceptors(self):
@@ -320,7 +308,7 @@ class AermodScenario(object):
             self.studyArea = self.lineSources.unary_union.convex_hull.buffer(
                 receptorSpacing
             )
-            print('Read sources.geojson')
+            log.info('Read sources.geojson')
             return True
         except:
             return False
@@ -332,7 +320,7 @@ class AermodScenario(object):
             self.receptors = self.receptors.to_crs(
                 epsg = self.epsg
             )
-            print('Read receptors.geojson')
+            log.info('Read receptors.geojson')
             return True
         except:
             return False
@@ -399,7 +387,9 @@ class AermodScenario(object):
         
         numSources = len(self.lineSources)
         numGroups = 1 + int(numSources/groupSize)
+        count('sourceGroups',numGroups)
         for groupIdx in range(numGroups):
+            progress('Writing source group',groupIdx + 1,numGroups)
             start = groupIdx*groupSize
             end = start + groupSize
             self.assembleAndWriteInput(start,end)
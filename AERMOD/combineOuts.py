@@ -7,10 +7,22 @@ source groups'''
 # files
 
 pollutant = 'pm25'
+import os
+import sys
 from glob import glob
 from collections import defaultdict
+from argparse import ArgumentParser
 from aermodConst import exponents
 import numpy as np
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..','common'))
+import instrument
+from instrument import log,stage,count,progress
+
+parser = ArgumentParser()
+instrument.addArguments(parser)
+args = parser.parse_args()
+instrument.configure(args)
 
 concentrations = defaultdict(float)
 
@@ -24,9 +36,12 @@ def processOut(outFile):
 
 outFiles =  glob(f'*.out')
 numFiles = len(outFiles)
-for idx,outFile in enumerate(outFiles):
-    print('Processing',outFile,idx + 1,'out of',numFiles)
-    processOut(outFile)
+with stage('readOuts'):
+    for idx,outFile in enumerate(outFiles):
+        progress('Processing output',idx + 1,numFiles)
+        processOut(outFile)
+    count('outFiles',numFiles)
+    count('receptors',len(concentrations))
 
 # make and save the a dataframe
 rows = []
@@ -37,5 +52,6 @@ for (x,y),c in concentrations.items():
     })
 
 import pandas as pd
-print('Writing results')
-pd.DataFrame(rows).to_csv('receptorConc.csv',index = False)
+log.info('Writing results')
+with stage('writeResults'):
+    pd.DataFrame(rows).to_csv('receptorConc.csv',index = False)
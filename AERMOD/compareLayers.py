@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+'''this script compares the concentrations of a run with flux adaptive
+receptor layers (makeSourcesReceptors.py --adaptiveLayers) with those
+of the run of the same sources with all receptor layers; the
+concentration at a receptor that the adaptive run does not have is
+taken from the nearest receptor that it has'''
+
+import os
+import sys
+import json
+import numpy as np
+import pandas as pd
+from argparse import ArgumentParser
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..','common'))
+import instrument
+from instrument import log,stage,count
+
+def compareLayers(receptors,fullConc,adaptiveConc):
+    # the receptor reduction and the concentration errors of the
+    # adaptive run; receptors has the receptorID and geometry of all
+    # receptors of the full run, the concentration tables have the
+    # receptorID and concentrat columns written by restoreIDs.py
+    from shapely import STRtree
+    full = fullConc.set_index('receptorID').concentrat
+    adaptive = adaptiveConc.set_index('receptorID').concentrat
+    geometry = pd.Series(np.asarray(receptors.geometry),
+                         index = receptors.receptorID.values)
+    shared = full.index.intersection(adaptive.index)
+    dropped = full.index.difference(adaptive.index)
+
+    # the concentration of the dropped receptors at the nearest kept
+    # receptor; of equidistant receptors the first one is taken
+    tree = STRtree(geometry.reindex(adaptive.index).values)
+    positions,nearest = tree.query_nearest(geometry.reindex(dropped).values)
+    positions,first = np.unique(positions,return_index = True)
+    estimate = adaptive.values[nearest[first]]
+    error = estimate - full.reindex(dropped).values
+    estimated = full.copy()
+    estimated[dropped] = estimate
+    return {
+        'fullReceptors':len(full),
+        'adaptiveReceptors':len(adaptive),
+        'receptorReduction':1 - len(adaptive)/len(full),
+        'sharedMaxAbsError':float(np.abs(
+            adaptive[shared].values - full[shared].values
+        ).max()) if len(shared) else 0.,
+        'droppedMeanAbsError':float(np.abs(error).mean())
+        if len(error) else 0.,
+        'droppedMaxAbsError':float(np.abs(error).max())
+        if len(error) else 0.,
+        'droppedRelativeError':float(np.abs(error).sum()/
+                                     full[dropped].sum())
+        if len(error) else 0.,
+        'fullMeanConc':float(full.mean()),
+        'estimatedMeanConc':float(estimated.mean())
+    }
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('fullDir',help = 'directory of the run with all '
+                        'receptor layers')
+    parser.add_argument('adaptiveDir',help = 'directory of the run with '
+                        'flux adaptive receptor layers')
+    parser.add_argument('--epsg',default = 3665,type = int)
+    parser.add_argument('--output',help = 'optional path of the JSON '
+                        'comparison')
+    instrument.addArguments(parser)
+    args = parser.parse_args()
+    instrument.configure(args)
+
+    import geopandas as gpd
+    with stage('readRuns'):
+        receptors = gpd.read_file(
+            os.path.join(args.fullDir,'receptors.geojson')
+        ).to_crs(epsg = args.epsg)
+        fullConc,adaptiveConc = [
+            pd.read_csv(os.path.join(directory,'receptorConc.csv'))
+            for directory in (args.fullDir,args.adaptiveDir)
+        ]
+        count('receptors',len(receptors))
+
+    with stage('compareLayers'):
+        result = compareLayers(receptors,fullConc,adaptiveConc)
+
+    log.info(f'{result["adaptiveReceptors"]} receptors instead of '
+             f'{result["fullReceptors"]}, '
+             f'{100*result["receptorReduction"]:.1f}% fewer')
+    log.info(f'Dropped receptors: mean absolute error '
+             f'{result["droppedMeanAbsError"]:.4g}, maximum '
+             f'{result["droppedMaxAbsError"]:.4g}, relative '
+             f'{100*result["droppedRelativeError"]:.1f}%')
+    log.info(f'Mean concentration {result["estimatedMeanConc"]:.4g} '
+             f'instead of {result["fullMeanConc"]:.4g}')
+    if args.output:
+        with open(args.output,'w') as f:
+            json.dump(result,f,indent = 1)
+
+
+if __name__ == '__main__':
+    main()
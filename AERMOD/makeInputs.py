@@ -3,9 +3,15 @@
 '''this script takes the scenarioID and laneWidth and an optional zip
 code and constructs the sources and receptors shapefiles'''
 
+import os
+import sys
 import argparse
 from aermodInput import AermodScenario
 from aermodConst import feet2meters
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..','common'))
+import instrument
+from instrument import stage
 
 parser = argparse.ArgumentParser()
 parser.add_argument('title',help = 'project title')
@@ -20,13 +26,18 @@ parser.add_argument('--laneWidthInFeet',type = int,
                     help = 'optionally override the default 12 foot lanes')
 parser.add_argument('--epsg',type = int,default = 3665,
                     help = 'optionally override the default epsg:3665, the unit must be "meter"')
+instrument.addArguments(parser)
 
 args = parser.parse_args()
+instrument.configure(args)
 scenario = AermodScenario(args.epsg,args.laneWidthInFeet)
-scenario.readSources()
-scenario.readReceptors()
+with stage('readSourcesReceptors'):
+    scenario.readSources()
+    scenario.readReceptors()
 scenario.processAERMETfiles(args.aermetOutputDirectory)
-scenario.constructAermodInputs(
-    args.title,args.sourceGroupSize,args.population,args.dayOfTheMonth
-)
+with stage('constructAermodInputs'):
+    scenario.constructAermodInputs(
+        args.title,args.sourceGroupSize,args.population,
+        args.dayOfTheMonth
+    )
 
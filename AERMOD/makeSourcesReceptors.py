@@ -3,31 +3,59 @@
 '''this script takes the scenarioID and year code and constructs the
 sources and receptors shapefiles'''
 
+import os
 import argparse
-from aermodConst import feet2meters
+from aermodConst import feet2meters,receptorLayerThresholds
 import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..','common'))
+import instrument
+from instrument import log,stage
 
 parser = argparse.ArgumentParser()
 parser.add_argument('linkGeometriesPath',help = 'path to the dataset with link geometries, A and B nodeIDs and number of lanes')
 parser.add_argument('emissionsPath',help = 'path to the emissions dataset')
 parser.add_argument('--epsg',help = 'optional projected EPSG to use, if omitted 3665 will be used')
+parser.add_argument('--adaptiveLayers',action = 'store_true',
+                    help = 'give the sources with a lower emission flux '
+                    'fewer receptor layers')
+parser.add_argument('--layerThresholds',nargs = '+',type = float,
+                    default = receptorLayerThresholds,metavar = 'FRACTION',
+                    help = 'fractions of the log flux range of the sources '
+                    'at which a source gets another receptor layer with '
+                    '--adaptiveLayers')
+instrument.addArguments(parser)
 
 args = parser.parse_args()
+instrument.configure(args)
 from aermodInput import AermodScenario
 scenario = AermodScenario(args.epsg,12)
 
 if not scenario.readSources():
-    print('Making sources')
-    scenario.getLinkGeometries(args.linkGeometriesPath)
-    scenario.constructNetwork()
-    scenario.mergeEmissionRate(args.emissionsPath)
-    scenario.makeSources()
-    scenario.saveSources()
+    log.info('Making sources')
+    with stage('getLinkGeometries'):
+        scenario.getLinkGeometries(args.linkGeometriesPath)
+    with stage('constructNetwork'):
+        scenario.constructNetwork()
+    with stage('mergeEmissionRate'):
+        scenario.mergeEmissionRate(args.emissionsPath)
+    with stage('makeSources'):
+        scenario.makeSources()
+    with stage('saveSources'):
+        scenario.saveSources()
     
 if scenario.readReceptors():
-    print('Receptors already constructed')
+    log.info('Receptors already constructed')
 else:
-    scenario.makeLinkReceptors()
-    scenario.makeGridReceptors()
-    scenario.dropReceptorsInSources()
-    scenario.saveReceptors()
+    if args.adaptiveLayers:
+        with stage('makeSourceReceptors'):
+            scenario.makeSourceReceptors(args.layerThresholds)
+    else:
+        with stage('makeLinkReceptors'):
+            scenario.makeLinkReceptors()
+    with stage('makeGridReceptors'):
+        scenario.makeGridReceptors()
+    with stage('dropReceptorsInSources'):
+        scenario.dropReceptorsInSources()
+    with stage('saveReceptors'):
+        scenario.saveReceptors()
@@ -1,20 +1,28 @@
 #!/usr/bin/env python3
 
+import os
+import sys
 import pandas as pd
 import geopandas as gpd
 from argparse import ArgumentParser
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..','common'))
+import instrument
+from instrument import log
 
 parser = ArgumentParser()
 parser.add_argument('--epsg',default = 3665,type = int)
+instrument.addArguments(parser)
 args = parser.parse_args()
+instrument.configure(args)
 
 concPath = 'receptorConc.csv'
-print(f'Reading {concPath}')
+log.info(f'Reading {concPath}')
 conc = pd.read_csv(concPath,converters = {'x':str,'y':str})
 conc['x'] = conc.x.str.strip('0')
 conc['y'] = conc.y.str.strip('0')
 
-print('Reading receptors.geojson')
+log.info('Reading receptors.geojson')
 receptors = gpd.read_file('receptors.geojson')
 receptors = receptors.to_crs(epsg = args.epsg)
 receptors['x'] = receptors.geometry.apply(
@@ -28,16 +36,16 @@ receptors['y'] = receptors.geometry.apply(
 #assert set(receptors.y) == set(conc.y)
 
 # merge the receptorID
-print('Merging receptorIDs')
+log.info('Merging receptorIDs')
 nBefore = len(conc)
 conc = conc.merge(receptors[['receptorID','x','y']],on = ['x','y'])
 nAfter = len(conc)
 if nBefore != nAfter:
-    print(f'{nBefore - nAfter} receptors were matched, exiting...')
+    log.warning(f'{nBefore - nAfter} receptors were matched, exiting...')
 
 # upload concentrations with receptorID (drop the un-needed 'x','y'
 # columns)
-print(f'Saving concentration to {concPath}')
+log.info(f'Saving concentration to {concPath}')
 conc.drop(columns = ['x','y'])[
     ['receptorID','concentrat','paf']
 ].to_csv(concPath,index = False)
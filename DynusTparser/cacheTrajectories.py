@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+
+'''script that parses the DynusT outputs in the working directory once
+into the trajectory cache from which reaggregate.py maps the link
+volumes for any aggregation interval and speed bin'''
+
+import os
+import sys
+import time
+from argparse import ArgumentParser
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..','common'))
+import instrument
+from instrument import log,stage,count
+
+parser = ArgumentParser()
+parser.add_argument('--cache',default = 'trajectoryCache',
+                    help = 'directory of the trajectory cache')
+parser.add_argument('--chunkMB',type = float,default = 32,
+                    help = 'decompressed megabytes of trajectories parsed '
+                    'at once')
+parser.add_argument('--workers',type = int,default = 1,
+                    help = 'number of processes that decompress the bzip2 '
+                    'blocks of the DynusT outputs')
+instrument.addArguments(parser)
+args = parser.parse_args()
+instrument.configure(args)
+
+import trajectories
+from trajectoryCache import TrajectoryCache
+
+start = time.perf_counter()
+chunkBytes = int(args.chunkMB*2**20)
+with stage('cacheTrajectories'):
+    with stage('readVehicles'):
+        vehicles = trajectories.readVehicles(chunkBytes = chunkBytes,
+                                             workers = args.workers)
+        count('vehicles',len(vehicles))
+    with stage('convert'):
+        numRows,numNodes = TrajectoryCache.convert(
+            vehicles,path = args.cache,chunkBytes = chunkBytes,
+            workers = args.workers
+        )
+
+log.info(f'Cached {numRows} trajectories with {numNodes} nodes in '
+         f'{args.cache} in {round(time.perf_counter() - start,2)} s')
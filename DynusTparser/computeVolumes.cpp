@@ -135,19 +135,16 @@ public:
 	   << " for vehicle " << ID << endl;
     }
     
-    // assign the trajectory, nodeArrivalTimes, delay and tolls
+    // assign the trajectory, nodeArrivalTimes, delay and tolls; the
+    // signal delays are the increments of the cumulative delays
+    double prevdelay = 0.;
     for (int i = 0; i < traversedNodes; ++i) {
       trajectory.push_back(lexical_cast<int>(allVals[i]));
       double time = lexical_cast<double>(allVals[i + traversedNodes]);
       nodeArrivalTimes.push_back(startTime + time);
       double delay = lexical_cast<double>(allVals[i + 3*traversedNodes]);
-      double prevdelay;
-      if (signalDelays.empty()) {
-	signalDelays.push_back(delay);
-      } else {
-	signalDelays.push_back(delay - prevdelay);
-	prevdelay = delay;
-      }
+      signalDelays.push_back(delay - prevdelay);
+      prevdelay = delay;
     }
     // parse toll if exists
     if (allVals.size()/traversedNodes == 5) {
@@ -1,42 +1,143 @@
 #!/usr/bin/env python3
 
+'''script that converts the DynaStudio links shapefile into links.csv;
+the county of a link is the county nearest to its midpoint, found with
+a bulk spatial join against the Census county layer, which is
+downloaded once and clipped to the network'''
+
+import os
 import sys
-if len(sys.argv) != 2:
-    print('Usage:',sys.argv[0],'pathToDynaStudioShapeFile')
-    sys.exit(1)
+import tempfile
+import urllib.request
+import numpy as np
+import pandas as pd
+from argparse import ArgumentParser
+home = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(home,'..','common'))
+import instrument
+from instrument import log,stage,count
 
 epsg = 3082 # this projected EPSG is in meters
-import geopandas as gpd
-shp = gpd.read_file(sys.argv[1]).to_crs(epsg = epsg)
-
-# get the county FIPS
-counties = gpd.read_file('https://www2.census.gov/geo/tiger/GENZ2019/shp/cb_2019_us_county_5m.zip')
-from shapely.strtree import STRtree
-counties = counties.to_crs(epsg = epsg)
-tree = STRtree(counties.geometry)
-fipsLookup = dict((r.geometry.wkt,r.GEOID) for r in counties.itertuples())
-                          
-shp['point'] = [l.interpolate(0.5,normalized = True) for l in shp.geometry]
-shp['countyID'] = shp.point.apply(
-    lambda p: fipsLookup[tree.nearest(p).wkt]
-)                                  
-
-# add the linkID column
-shp['linkID'] = [f'{r.A_NODE}-{r.B_NODE}' for r in shp.itertuples()]
-
-# map the roadTypeID
-shp['roadTypeID'] = shp['#LTYPE'].apply(
-    lambda ID: 4 if ID in [1,2,6,7,8,9,10] else 5
-)
-
+countiesURL = 'https://www2.census.gov/geo/tiger/GENZ2019/shp/' \
+    'cb_2019_us_county_5m.zip'
+countiesPath = os.path.join(home,'cb_2019_us_county_5m.zip')
+# the network bounds are widened by this many units of the county
+# layer (degrees for the Census layer) before the layer is clipped
+margin = 0.5
+# the #LTYPE of the links with roadTypeID 4, the others are 5
+roadType4 = [1,2,6,7,8,9,10]
 milesInMeter = 0.000621371
-shp['length'] = shp.geometry.length*milesInMeter
 
-# rename columns
-shp = shp.rename(columns = {'#SPEED':'speedLimit','#LANES':'numLanes'})
+def downloadCounties(path = countiesPath,url = countiesURL):
+    # download the county layer unless it is already cached
+    if os.path.exists(path): return
+    log.info(f'Downloading {url} to {path}')
+    fd,tmp = tempfile.mkstemp(dir = os.path.dirname(os.path.abspath(path)))
+    os.close(fd)
+    try:
+        urllib.request.urlretrieve(url,tmp)
+        os.replace(tmp,path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+def readCounties(path,bounds = None):
+    # the projected counties of the layer, only those that intersect
+    # the (minx,miny,maxx,maxy) bounds in the CRS of the layer if given
+    import geopandas as gpd
+    counties = gpd.read_file(path,bbox = bounds,columns = ['GEOID'])
+    return counties[['GEOID','geometry']].to_crs(epsg = epsg)
+
+
+def nearestCounties(points,counties):
+    # the GEOID of the county nearest to every point; of equidistant
+    # counties the first one is taken
+    import geopandas as gpd
+    joined = gpd.sjoin_nearest(
+        gpd.GeoDataFrame(geometry = points,crs = counties.crs),counties,
+        how = 'left'
+    )
+    return joined[~joined.index.duplicated()].GEOID.values
+
+
+def assignCounties(points,path = countiesPath):
+    # the GEOID of the county nearest to every projected point; the
+    # layer is clipped to the bounds of the points, the points inside
+    # or on the boundary of a clipped county are looked up with a bulk
+    # intersects query and the nearest county to the others is
+    # searched in the whole layer
+    import pyogrio
+    from geopandas import GeoSeries
+    points = GeoSeries(points,crs = f'epsg:{epsg}')
+    crs = pyogrio.read_info(path)['crs']
+    bounds = points.to_crs(crs).total_bounds + \
+        np.array([-margin,-margin,margin,margin])
+    counties = readCounties(path,tuple(bounds))
+    count('counties',len(counties))
+    countyIDs = np.full(len(points),None,dtype = object)
+    pointIdx,countyIdx = counties.sindex.query(points.values,
+                                               predicate = 'intersects')
+    # a point on the boundary of two counties takes the first one in
+    # the layer
+    order = np.lexsort((countyIdx,pointIdx))
+    pointIdx,countyIdx = pointIdx[order],countyIdx[order]
+    pointIdx,first = np.unique(pointIdx,return_index = True)
+    countyIDs[pointIdx] = counties.GEOID.values[countyIdx[first]]
+    outside = np.flatnonzero(countyIDs == None)
+    if len(outside):
+        log.info(f'{len(outside)} link midpoints are outside the counties')
+        countyIDs[outside] = nearestCounties(points.values[outside],
+                                             readCounties(path))
+    return countyIDs
+
+
+def midpoints(lines):
+    # the points halfway along the lines
+    from shapely import line_interpolate_point
+    return line_interpolate_point(np.asarray(lines),0.5,normalized = True)
+
+
+def linkTable(shp,countyIDs):
+    # the links.csv columns of the projected links shapefile
+    return pd.DataFrame({
+        'linkID':(shp.A_NODE.astype(str) + '-' +
+                  shp.B_NODE.astype(str)).values,
+        'roadTypeID':np.where(shp['#LTYPE'].isin(roadType4),4,5),
+        'countyID':countyIDs,
+        'length':shp.geometry.length.values*milesInMeter,
+        'speedLimit':shp['#SPEED'].values,
+        'numLanes':shp['#LANES'].values
+    })
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('pathToDynaStudioShapeFile')
+    parser.add_argument('--counties',default = countiesPath,
+                        help = 'path to the county layer with a GEOID '
+                        'column; the Census 2019 county boundaries are '
+                        'downloaded to it if it does not exist')
+    parser.add_argument('--output',default = 'links.csv')
+    instrument.addArguments(parser)
+    args = parser.parse_args()
+    instrument.configure(args)
+
+    import geopandas as gpd
+    with stage('readLinks'):
+        shp = gpd.read_file(args.pathToDynaStudioShapeFile).to_crs(
+            epsg = epsg
+        )
+        count('links',len(shp))
+
+    # get the county FIPS
+    with stage('countyLookup'):
+        if args.counties == countiesPath: downloadCounties(args.counties)
+        countyIDs = assignCounties(midpoints(shp.geometry),args.counties)
+
+    with stage('output'):
+        linkTable(shp,countyIDs).to_csv(args.output,index = False)
 
-# output
-shp[
-    ['linkID','roadTypeID','countyID','length','speedLimit','numLanes']
-].to_csv('links.csv',index = False)
 
+if __name__ == '__main__':
+    main()
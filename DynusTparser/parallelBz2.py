@@ -0,0 +1,164 @@
+'''decompress a bzip2 file block by block in a pool of processes: the
+file is scanned for the bit aligned magic numbers that start its blocks
+and end its streams, every block is wrapped into a stream of its own
+and the decompressed blocks are yielded in the order of the file'''
+
+import os
+import bz2
+import mmap
+import multiprocessing as mp
+from functools import partial
+from collections import deque
+
+# the 48 bit magic numbers that start a block and end a stream
+blockMagic = 0x314159265359
+endMagic = 0x177245385090
+# a bzip2 block is at most 900k bytes before compression and a bit more
+# after it, so a block never spans more than a few candidate boundaries
+maxExtensions = 4
+
+def shiftedMagic(magic,shift):
+    # the 7 bytes of the magic number starting at bit shift of the first
+    return (magic << (8 - shift)).to_bytes(7,'big')
+
+
+def findMagic(data,magic,start,stop):
+    # the bit offsets of the magic number in data that start in the
+    # bytes [start,stop); the bytes that it covers completely are
+    # searched for and the partial bytes are compared afterwards
+    found = []
+    for shift in range(8):
+        pattern = shiftedMagic(magic,shift)
+        first = 0 if shift == 0 else 1
+        fixed = pattern[first:6]
+        end = stop + 5
+        pos = data.find(fixed,start + first,end)
+        while pos != -1:
+            byte = pos - first
+            value = int.from_bytes(data[byte:byte + 7].ljust(7,b'\0'),'big')
+            if (value >> (8 - shift)) & (2**48 - 1) == magic:
+                found.append(8*byte + shift)
+            pos = data.find(fixed,pos + 1,end)
+    return found
+
+
+def scanBlocks(data,windowBytes = 2**24):
+    # yield the (bit offset,is a block) of the magic numbers in the
+    # order of the file, one window at a time; a stream ends 80 to 87
+    # bits before the header of the next stream or the end of the file
+    if data[:3] != b'BZh':
+        raise ValueError('not a bzip2 file')
+    for start in range(0,len(data),windowBytes):
+        stop = min(start + windowBytes,len(data))
+        magics = [(bit,True) for bit in
+                  findMagic(data,blockMagic,start,stop)]
+        ends = [stop] if stop == len(data) else []
+        header = data.find(b'BZh',max(start,1),stop)
+        while header != -1:
+            ends.append(header)
+            header = data.find(b'BZh',header + 1,stop)
+        for end in ends:
+            magics += [(bit,False) for bit in
+                       findMagic(data,endMagic,max(end - 11,0),end - 9)]
+        yield from sorted(magics)
+
+
+def blockStream(data,start,stop):
+    # the block between the bit offsets [start,stop) of data as a
+    # single block stream whose combined CRC is the CRC of the block
+    first,last = start//8,(stop + 7)//8
+    numBits = stop - start
+    value = int.from_bytes(data[first:last],'big')
+    value = (value >> (8*last - stop)) & ((1 << numBits) - 1)
+    crc = (value >> (numBits - 80)) & (2**32 - 1)
+    value = (value << 80) | (endMagic << 32) | crc
+    padding = -(numBits + 80) % 8
+    return b'BZh9' + (value << padding).to_bytes(
+        (numBits + 80 + padding)//8,'big'
+    )
+
+
+def decompressBlock(data,bounds):
+    # decompress the block that starts at bounds[0] and ends at the
+    # first of the following bounds for which it is complete; a magic
+    # number can turn up by chance inside a block.  Returns the
+    # decompressed bytes and the bit offset the block ends at
+    for stop in bounds[1:]:
+        decompressor = bz2.BZ2Decompressor()
+        try:
+            out = decompressor.decompress(blockStream(data,bounds[0],stop))
+        except (OSError,ValueError):
+            continue
+        if decompressor.eof: return out,stop
+    raise ValueError(f'no bzip2 block at bit {bounds[0]}')
+
+
+# the memory mapped file of a worker of the pool
+shared = {}
+
+def initWorker(path):
+    with open(path,'rb') as f:
+        shared['data'] = mmap.mmap(f.fileno(),0,access = mmap.ACCESS_READ)
+
+
+def decompressShared(bounds):
+    return decompressBlock(shared['data'],bounds)
+
+
+def blockBounds(data,windowBytes):
+    # yield the bounds of the candidate blocks: the bit offset of a
+    # block magic followed by the offsets of up to maxExtensions + 1
+    # following magic numbers
+    pending = deque()
+    magics = scanBlocks(data,windowBytes)
+    exhausted = False
+    while True:
+        while not exhausted and len(pending) < maxExtensions + 2:
+            try:
+                pending.append(next(magics))
+            except StopIteration:
+                exhausted = True
+        if not pending: return
+        bit,isBlock = pending.popleft()
+        if not isBlock: continue
+        if not pending: raise ValueError('truncated bzip2 file')
+        yield [bit] + [other for other,_ in pending]
+
+
+def decompressAhead(pool,candidates,numAhead):
+    # yield the start of every candidate block and the function that
+    # waits for its decompression, with numAhead of them submitted
+    running = deque()
+    for bounds in candidates:
+        running.append(
+            (bounds[0],pool.apply_async(decompressShared,(bounds,)).get)
+        )
+        if len(running) > numAhead: yield running.popleft()
+    yield from running
+
+
+def readBlocks(path,workers = os.cpu_count(),windowBytes = 2**24):
+    # yield the decompressed blocks of the bzip2 file in order; at most
+    # a few blocks per worker are decompressed ahead of the consumer
+    with open(path,'rb') as f:
+        data = mmap.mmap(f.fileno(),0,access = mmap.ACCESS_READ)
+    try:
+        candidates = blockBounds(data,windowBytes)
+        pool = None
+        if workers > 1:
+            pool = mp.Pool(workers,initializer = initWorker,
+                           initargs = (path,))
+            blocks = decompressAhead(pool,candidates,4*workers)
+        else:
+            blocks = ((bounds[0],partial(decompressBlock,data,bounds))
+                      for bounds in candidates)
+        # the candidates that start inside the previous block are
+        # chance magic numbers
+        covered = 0
+        for start,result in blocks:
+            if start < covered: continue
+            out,covered = result()
+            yield out
+    finally:
+        if pool is not None: pool.terminate()
+        data.close()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+'''script that computes linkVMT.csv and numberOfTrips.csv for any
+aggregation interval and speed bin from the trajectory cache written
+by cacheTrajectories.py instead of parsing the DynusT outputs'''
+
+import os
+import sys
+import time
+from argparse import ArgumentParser
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..','common'))
+import instrument
+from instrument import log,stage,count
+
+parser = ArgumentParser()
+parser.add_argument('aggInt',type = float,
+                    help = 'length of the aggregation intervals in minutes')
+parser.add_argument('speedBin',type = int,
+                    help = 'size of the speed bins in mph')
+parser.add_argument('--cache',default = 'trajectoryCache',
+                    help = 'directory of the trajectory cache')
+parser.add_argument('--chunkNodes',type = int,default = 2**22,
+                    help = 'number of trajectory nodes mapped at once')
+instrument.addArguments(parser)
+args = parser.parse_args()
+instrument.configure(args)
+
+import trajectories
+from trajectoryCache import TrajectoryCache
+
+start = time.perf_counter()
+with stage('reaggregate'):
+    with stage('readInputs'):
+        links = trajectories.readLinks()
+        cache = TrajectoryCache(args.cache)
+        # if elecIDs.txt is present, skip the vehicles listed in it
+        removeIDs = []
+        if os.path.exists('elecIDs.txt'):
+            log.info('Removing electrified vehicles')
+            removeIDs = trajectories.readElecIDs()
+        vehicles = cache.vehicles(removeIDs)
+        count('vehicles',len(vehicles))
+
+    with stage('mapVolumes'):
+        volumes, = trajectories.reduceChunks(
+            ((trajectories.mapVolumes(traversals,args.aggInt,
+                                      args.speedBin),)
+             for traversals in cache.traversals(links,removeIDs,
+                                                args.chunkNodes)),
+            [trajectories.volumeKeys]
+        )
+    with stage('writeOutputs'):
+        trajectories.outputVolumes(volumes,links)
+        trajectories.outputNumberOfTrips(vehicles)
+        count('volumeRows',len(volumes))
+
+log.info(f'Mapped {len(vehicles)} vehicles in '
+         f'{round(time.perf_counter() - start,2)} s')
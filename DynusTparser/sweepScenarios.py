@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+
+'''script that computes linkVMT and numberOfTrips.csv for many
+electrification scenarios from the trajectory cache written by
+cacheTrajectories.py: the volumes of all vehicles are mapped once and
+every scenario subtracts the volumes of the trajectories of the
+vehicles that it removes, so that its cost grows with the number of
+removed vehicles rather than with the size of the trajectories'''
+
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+from argparse import ArgumentParser
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..','common'))
+import instrument
+from instrument import log,stage,count,progress
+
+parser = ArgumentParser()
+parser.add_argument('aggInt',type = float,
+                    help = 'length of the aggregation intervals in minutes')
+parser.add_argument('speedBin',type = int,
+                    help = 'size of the speed bins in mph')
+parser.add_argument('--idSets',nargs = '+',default = [],metavar = 'PATH',
+                    help = 'files with the IDs of the removed vehicles, one '
+                    'per line like elecIDs.txt; the scenario is named '
+                    'after the file')
+parser.add_argument('--penetration',nargs = '+',type = float,default = [],
+                    metavar = 'RATE',
+                    help = 'fractions of the vehicles removed at random')
+parser.add_argument('--seeds',nargs = '+',type = int,default = [0],
+                    help = 'seeds of the random samples of every '
+                    'penetration rate; the samples of a seed are nested')
+parser.add_argument('--vehTypes',nargs = '+',type = int,
+                    help = 'sample only vehicles of these vehTypes; the '
+                    'penetration rates are fractions of them')
+parser.add_argument('--cache',default = 'trajectoryCache',
+                    help = 'directory of the trajectory cache')
+parser.add_argument('--outputDir',default = 'scenarios',
+                    help = 'directory of the scenario outputs')
+parser.add_argument('--outputFormat',default = 'csv',
+                    choices = ['csv','parquet','arrow'],
+                    help = 'format of linkVMT; parquet and arrow store the '
+                    'ID columns as narrow integers')
+parser.add_argument('--chunkNodes',type = int,default = 2**22,
+                    help = 'number of trajectory nodes mapped at once')
+instrument.addArguments(parser)
+args = parser.parse_args()
+instrument.configure(args)
+
+import trajectories
+from trajectoryCache import TrajectoryCache
+from tableIO import writeTable
+
+def sampleScenarios(vehicles):
+    # the scenarios that remove the penetration rates of the eligible
+    # vehicles; the vehicles are removed in the order of a random
+    # permutation per seed so the higher rates include the lower ones
+    eligible = vehicles
+    if args.vehTypes is not None:
+        eligible = vehicles[vehicles.vehType.isin(args.vehTypes)]
+    for seed in args.seeds:
+        order = np.random.default_rng(seed).permutation(eligible.ID.values)
+        for rate in args.penetration:
+            yield f'penetration{rate:g}_seed{seed}', \
+                order[:int(round(rate*len(order)))]
+
+
+def mapVolumes(traversals):
+    # the volumes of the traversals with the number of pieces of
+    # traversals summed into every volume; a volume without pieces is
+    # not written
+    for t in traversals:
+        yield trajectories.mapVolumes(t,args.aggInt,
+                                      args.speedBin).assign(pieces = 1),
+
+
+def writeScenario(directory,table,trips,removeIDs):
+    os.makedirs(directory,exist_ok = True)
+    path = os.path.join(directory,f'linkVMT.{args.outputFormat}')
+    if args.outputFormat == 'csv':
+        trajectories.writeRows(table,path)
+    else:
+        writeTable(table,path)
+    trips.rename('numTrips').reset_index().to_csv(
+        os.path.join(directory,'numberOfTrips.csv'),index = False
+    )
+    # the removed vehicles reproduce the scenario as elecIDs.txt
+    with open(os.path.join(directory,'elecIDs.txt'),'w') as f:
+        f.writelines(f'{ID}\n' for ID in removeIDs)
+
+
+start = time.perf_counter()
+with stage('sweepScenarios'):
+    with stage('readInputs'):
+        links = trajectories.readLinks()
+        cache = TrajectoryCache(args.cache)
+        vehicles = cache.vehicles()
+        count('vehicles',len(vehicles))
+        scenarios = [
+            (os.path.splitext(os.path.basename(path))[0],
+             trajectories.readElecIDs(path))
+            for path in args.idSets
+        ] + list(sampleScenarios(vehicles))
+        count('scenarios',len(scenarios))
+        if not scenarios:
+            log.error('No scenarios, use --idSets or --penetration')
+            sys.exit(1)
+
+    with stage('mapBaseline'):
+        baseline, = trajectories.reduceChunks(
+            mapVolumes(cache.traversals(links,(),args.chunkNodes)),
+            [trajectories.volumeKeys]
+        )
+        baseline['linkKey'] = baseline.linkID
+        baseline = trajectories.linkVMT(baseline,links)
+        baselineIndex = pd.MultiIndex.from_frame(
+            baseline[['linkKey'] + trajectories.volumeKeys[1:]]
+        )
+        if args.outputFormat != 'csv':
+            # stored as a category once rather than by every scenario
+            baseline['linkID'] = baseline.linkID.astype('category')
+        baselineTrips = vehicles.groupby('vehType').size()
+        vehTypes = vehicles.set_index('ID').vehType
+        count('volumeRows',len(baseline))
+
+    summary = []
+    for idx,(name,removeIDs) in enumerate(scenarios):
+        with stage('scenario'):
+            removeIDs = np.unique(np.asarray(removeIDs,dtype = np.int64))
+            removed = vehTypes.reindex(removeIDs).dropna()
+            rows = cache.rows(removed.index.values)
+            count('removedVehicles',len(removed))
+            count('removedTrajectories',len(rows))
+            # subtract the volumes of the removed trajectories
+            removedVolumes, = trajectories.reduceChunks(
+                mapVolumes(cache.rowTraversals(rows,links,args.chunkNodes)),
+                [trajectories.volumeKeys]
+            )
+            values = baseline.value.values.copy()
+            pieces = baseline.pieces.values.copy()
+            if len(removedVolumes):
+                positions = baselineIndex.get_indexer(
+                    pd.MultiIndex.from_frame(
+                        removedVolumes[trajectories.volumeKeys]
+                    )
+                )
+                values[positions] -= removedVolumes.value.values
+                pieces[positions] -= removedVolumes.pieces.values
+            keep = pieces > 0
+            table = baseline[trajectories.volumeKeys][keep].assign(
+                vmt = values[keep]*baseline.length.values[keep]
+            )
+            trips = baselineTrips.sub(
+                removed.astype(np.int64).value_counts(),fill_value = 0
+            ).astype(np.int64)
+            writeScenario(os.path.join(args.outputDir,name),table,
+                          trips[trips > 0],removed.index.values)
+            summary.append({'scenario':name,'removedVehicles':len(removed),
+                            'vmt':table.vmt.sum()})
+            progress('Scenario',idx + 1,len(scenarios))
+
+    pd.DataFrame(summary).to_csv(os.path.join(args.outputDir,
+                                              'scenarios.csv'),index = False)
+
+log.info(f'Computed {len(scenarios)} scenarios of {len(vehicles)} vehicles '
+         f'in {round(time.perf_counter() - start,2)} s')
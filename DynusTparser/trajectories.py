@@ -0,0 +1,440 @@
+'''stream the DynusT vehicle roster and vehicle trajectories in chunks
+of whole vehicle blocks, parse every chunk into flat NumPy arrays and
+map the trajectories onto the link volumes by time interval and speed
+bin, the link VMT, delays, signal delays and tolls and the number of
+trips the way volumes.exe (computeVolumes.cpp) does'''
+
+import os
+import sys
+import bz2
+import warnings
+import numpy as np
+import pandas as pd
+
+home = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(home,'..','common'))
+from instrument import log,count,progress
+from linkKeys import packLinkKey,linkKeyFromID,linkIDFromKey
+import parallelBz2
+
+# the bytes that separate the values
+isSpace = np.zeros(256,dtype = bool)
+isSpace[[9,10,11,12,13,32]] = True
+space = ord(' ')
+
+# the linkData metrics and their units in the order they are written
+metrics = {'vmt':'mile','delay':'min','signalDelay':'min','toll':'dollar'}
+
+def parseValues(text,numValues):
+    # parse the whitespace separated numbers of the bytes; blank bytes
+    # would parse into a single -1
+    if numValues == 0: return np.zeros(0)
+    with warnings.catch_warnings():
+        # unparsable text is a deprecation warning rather than an error
+        warnings.simplefilter('error',DeprecationWarning)
+        try:
+            values = np.fromstring(text,sep = ' ')
+        except DeprecationWarning:
+            values = None
+    if values is None or len(values) != numValues:
+        raise ValueError(f'expected {numValues} numbers')
+    return values
+
+
+def fixedWidth(data,lineStarts,lineEnds,start,width):
+    # the numbers in the columns [start,start + width) of the lines of
+    # the byte array; the columns past the end of a line are blank
+    positions = lineStarts[:,None] + np.arange(start,start + width)
+    field = np.where(positions < lineEnds[:,None],
+                     data[np.minimum(positions,len(data) - 1)],space)
+    field = np.hstack((field.astype(np.uint8),
+                       np.full((len(field),1),space,dtype = np.uint8)))
+    return parseValues(field.tobytes(),len(lineStarts))
+
+
+def decompressed(path,chunkBytes,workers):
+    # the decompressed pieces of the bzip2 file; with more than one
+    # worker its blocks are decompressed in parallel
+    if workers > 1:
+        yield from parallelBz2.readBlocks(path,workers)
+        return
+    with bz2.open(path,'rb') as f:
+        while True:
+            data = f.read(chunkBytes)
+            if not data: return
+            yield data
+
+
+def readBytes(path,chunkBytes,separator,workers = 1):
+    # yield the decompressed file in chunks of at least chunkBytes that
+    # end right before the last separator they contain; every chunk but
+    # the first starts with the separator
+    pieces,size = [],0
+    for data in decompressed(path,chunkBytes,workers):
+        pieces.append(data)
+        size += len(data)
+        if size < chunkBytes: continue
+        buf = b''.join(pieces)
+        cut = buf.rfind(separator)
+        if cut <= 0:
+            pieces = [buf]
+            continue
+        yield buf[:cut]
+        pieces,size = [buf[cut:]],len(buf) - cut
+    buf = b''.join(pieces)
+    if buf: yield buf
+
+
+def readVehicles(path = 'output_vehicle.dat.bz2',chunkBytes = 2**25,
+                 workers = 1):
+    # the fixed width vehicle headers on the even lines of the roster
+    # after the first two lines indexed by the vehicle ID; a repeated
+    # ID replaces the earlier vehicle
+    frames = []
+    lineNumber = 0
+    for buf in readBytes(path,chunkBytes,b'\n',workers):
+        # the chunks after the first start with the newline that ends
+        # the last line of the previous chunk
+        data = np.frombuffer(buf,dtype = np.uint8)
+        newlines = np.flatnonzero(data == 10)
+        lineStarts = newlines + 1
+        lineEnds = np.append(newlines[1:],len(data))
+        if lineNumber == 0:
+            lineStarts = np.insert(lineStarts,0,0)
+            lineEnds = np.insert(lineEnds,0,newlines[0] if len(newlines)
+                                 else len(data))
+        # the newline at the end of the file does not start a line
+        if len(lineStarts) and lineStarts[-1] == len(data):
+            lineStarts,lineEnds = lineStarts[:-1],lineEnds[:-1]
+        numbers = lineNumber + np.arange(len(lineStarts))
+        lineNumber += len(lineStarts)
+        headers = (numbers >= 2) & (numbers % 2 == 0)
+        lineStarts,lineEnds = lineStarts[headers],lineEnds[headers]
+        frames.append(pd.DataFrame(dict(
+            (column,fixedWidth(data,lineStarts,lineEnds,start,width))
+            for column,start,width in [
+                ('ID',0,9),('upstreamNode',9,7),('startTime',23,8),
+                ('vehType',37,6),('originLinkFrac',95,12)
+            ]
+        )))
+    vehicles = pd.concat(frames)
+    for column in ['ID','upstreamNode','vehType']:
+        vehicles[column] = vehicles[column].astype(np.int64)
+    return vehicles.drop_duplicates(
+        'ID',keep = 'last'
+    ).set_index('ID').sort_index()
+
+
+def readElecIDs(path = 'elecIDs.txt'):
+    # the vehicle IDs up to the first token that is not an integer
+    IDs = []
+    with open(path) as f:
+        for token in f.read().split():
+            try:
+                IDs.append(int(token))
+            except ValueError:
+                break
+    return IDs
+
+
+def readLinks(path = 'links.csv'):
+    # the length in miles and the free flow travel time in minutes of
+    # the links indexed by the packed link keys
+    links = pd.read_csv(path,skipinitialspace = True)
+    links = pd.DataFrame({
+        'length':links.length.values,
+        'fft':links.length.values/links.speedLimit.values*60
+    },index = linkKeyFromID(links.linkID))
+    return links[~links.index.duplicated(keep = 'last')]
+
+
+def parseChunk(buf,incomplete):
+    # the vehicle IDs, the number of traversed nodes, the offsets and
+    # the number of values of the vehicle blocks of the chunk and the
+    # flat array of their values; incomplete tells whether the chunk
+    # starts after the "###" line of the vehicles still in the network
+    data = np.frombuffer(buf,dtype = np.uint8).copy()
+    newlines = np.flatnonzero(data == 10)
+    lineStarts = newlines[newlines + 4 < len(data)] + 1
+    lineEnds = np.append(newlines,len(data))[
+        np.searchsorted(newlines,lineStarts)
+    ]
+    headers = (data[lineStarts] == ord('V')) & \
+        (data[lineStarts + 1] == ord('e')) & \
+        (data[lineStarts + 2] == ord('h'))
+    hashes = ~headers & (data[lineStarts + 1] == ord('#')) & \
+        (data[lineStarts + 2] == ord('#')) & (data[lineStarts + 3] == ord('#'))
+    headerEnds = lineEnds[headers]
+    hashStarts,hashEnds = lineStarts[hashes],lineEnds[hashes]
+    headers = lineStarts[headers]
+
+    # the vehicles after a "###" line are still in the network
+    blockIncomplete = np.full(len(headers),incomplete)
+    if len(hashStarts):
+        blockIncomplete |= headers > hashStarts[0]
+        incomplete = True
+
+    vehIDs = fixedWidth(data,headers,headerEnds,5,9).astype(np.int64)
+    numNodes = fixedWidth(data,headers,headerEnds,161,4).astype(np.int64)
+
+    # blank the headers, the "###" lines and the lines before the first
+    # header so that only the values of the blocks are left
+    firstHeader = headers[0] if len(headers) else len(data)
+    marks = np.zeros(len(data) + 1,dtype = np.int8)
+    for starts,ends in [(headers,headerEnds),(hashStarts,hashEnds),
+                        ([0],[firstHeader])]:
+        np.add.at(marks,starts,1)
+        np.add.at(marks,ends,-1)
+    data[np.cumsum(marks[:-1],dtype = np.int8) > 0] = space
+
+    separators = isSpace[data]
+    tokenStarts = np.flatnonzero(
+        ~separators & np.insert(separators[:-1],0,True)
+    )
+    values = parseValues(data.tobytes(),len(tokenStarts))
+    offsets = np.searchsorted(tokenStarts,headers)
+    sizes = np.diff(np.append(offsets,len(values)))
+
+    # discard the unreached node of the vehicles in the network; those
+    # that have not reached any node are skipped
+    drop = blockIncomplete & (numNodes > 1) & (sizes >= numNodes)
+    numNodes = np.where(blockIncomplete & ~drop,0,numNodes - drop)
+    values = np.delete(values,(offsets + numNodes)[drop])
+    sizes = sizes - drop
+    offsets = offsets - np.cumsum(drop) + drop
+    return dict(vehID = vehIDs,numNodes = numNodes,offset = offsets,
+                size = sizes,values = values),incomplete
+
+
+def readTrajectories(path = 'VehTrajectory.dat.bz2',chunkBytes = 2**25,
+                     workers = 1):
+    # yield the parsed chunks of whole vehicle blocks of the trajectory
+    # file after its first six lines
+    incomplete = False
+    first = True
+    for buf in readBytes(path,chunkBytes,b'\nVeh',workers):
+        if first:
+            # the header lines are all in the first chunk
+            cut = 0
+            for _ in range(6):
+                cut = buf.find(b'\n',cut) + 1
+                if cut == 0: return
+            buf = b'\n' + buf[cut:]
+            first = False
+        chunk,incomplete = parseChunk(buf,incomplete)
+        yield chunk
+
+
+def chunkNodes(chunk,vehicles):
+    # the flat arrays of the nodes traversed by the vehicle blocks of
+    # the chunk: the position of the vehicle in the roster, the index
+    # of the node in the trajectory, the node ID and the time since the
+    # start, the cumulative delay and the toll at the node; every
+    # vehicle is assumed to have a single block
+    positions = vehicles.index.get_indexer(chunk['vehID'])
+    numNodes,sizes = chunk['numNodes'],chunk['size']
+    valid = (positions >= 0) & (numNodes > 0)
+    inconsistent = valid & (sizes % np.maximum(numNodes,1) != 0)
+    if inconsistent.any():
+        log.warning(f'{inconsistent.sum()} trajectories have inconsistent '
+                    f'block sizes, e.g. vehicle '
+                    f'{chunk["vehID"][inconsistent][0]}')
+    # the blocks without the nodes and times and delays are skipped
+    valid &= sizes >= 4*numNodes
+    count('trajectories',int(valid.sum()))
+    count('skippedBlocks',int(len(valid) - valid.sum()))
+    positions,numNodes = positions[valid],numNodes[valid]
+    offsets,sizes = chunk['offset'][valid],sizes[valid]
+    values = chunk['values']
+
+    blockStarts = np.cumsum(numNodes) - numNodes
+    within = np.arange(numNodes.sum()) - np.repeat(blockStarts,numNodes)
+    index = np.repeat(offsets,numNodes) + within
+    stride = np.repeat(numNodes,numNodes)
+    hasTolls = np.repeat(sizes//numNodes == 5,numNodes)
+    return dict(
+        vehicle = np.repeat(positions,numNodes),within = within,
+        node = values[index].astype(np.int64),
+        time = values[index + stride],
+        delay = values[index + 3*stride],
+        toll = np.where(hasTolls,
+                        values[np.where(hasTolls,index + 4*stride,0)],0.)
+    )
+
+
+def traverse(vehicles,vehicle,within,bNodes,times,links):
+    # the links traversed by the vehicles at the positions vehicle of
+    # the vehicles frame to the nodes bNodes at the times since their
+    # start; within is the index of the node in the trajectory
+    count('traversals',len(bNodes))
+    # the A node of the first traversal is the upstream node of the
+    # origin link of which only a fraction is traveled
+    first = within == 0
+    startTime = vehicles.startTime.values[vehicle]
+    arrival = startTime + times
+    aNodes = np.where(first,vehicles.upstreamNode.values[vehicle],
+                      np.roll(bNodes,1))
+    linkKeys = packLinkKey(aNodes,bNodes)
+    linkIndex = links.index.get_indexer(linkKeys)
+    return dict(
+        vehicle = vehicle,first = first,linkID = linkKeys,
+        vehType = vehicles.vehType.values[vehicle],
+        frac = np.where(first,vehicles.originLinkFrac.values[vehicle],1.),
+        previous = np.where(first,startTime,np.roll(arrival,1)),
+        arrival = arrival,
+        length = np.where(linkIndex >= 0,links.length.values[linkIndex],0.),
+        fft = np.where(linkIndex >= 0,links.fft.values[linkIndex],0.)
+    )
+
+
+def mapVolumes(traversals,aggInt,speedBin):
+    # split the traversals between the time intervals they span in
+    # proportion to the time spent in every interval
+    frac,length = traversals['frac'],traversals['length']
+    start = traversals['previous'] - 0.00001
+    end = traversals['arrival'] - 0.00001
+    duration = end - start
+    with np.errstate(divide = 'ignore',invalid = 'ignore'):
+        speed = np.minimum(
+            np.ceil(60*frac*length/(speedBin*duration)),80//speedBin
+        )
+    startInterval = 1 + (start/aggInt).astype(np.int64)
+    endInterval = 1 + (end/aggInt).astype(np.int64)
+    numIntervals = np.where(
+        duration != 0,np.maximum(endInterval - startInterval + 1,0),0
+    )
+    rows = np.repeat(np.arange(len(start)),numIntervals)
+    step = np.arange(len(rows)) - np.repeat(
+        np.cumsum(numIntervals) - numIntervals,numIntervals
+    )
+    intervalID = startInterval[rows] + step
+    upper = np.minimum(end[rows],intervalID*aggInt)
+    lower = np.where(step == 0,start[rows],
+                     np.minimum(end[rows],(intervalID - 1)*aggInt))
+    return pd.DataFrame({
+        'linkID':traversals['linkID'][rows],
+        'vehType':traversals['vehType'][rows],
+        'timeIntervalID':intervalID,
+        'avgSpeedBinID':speed[rows].astype(np.int64),
+        'value':(upper - lower)/duration[rows]*frac[rows]
+    })
+
+
+def mapLinkData(traversals,delays,tolls):
+    # the signal delays are the increments of the cumulative delays;
+    # the delays and the tolls of a link replace those of an earlier
+    # traversal of the same link by the same vehicle
+    t = traversals
+    signalDelay = np.where(t['first'],delays,delays - np.roll(delays,1))
+    linkData = [pd.DataFrame({'metric':'vmt','linkID':t['linkID'],
+                              'vehType':t['vehType'],
+                              'value':t['length']*t['frac']})]
+    for metric,value in [
+            ('delay',t['arrival'] - t['previous'] - t['frac']*t['fft']),
+            ('signalDelay',signalDelay),('toll',tolls)
+    ]:
+        positive = value > 0.
+        linkData.append(pd.DataFrame({
+            'metric':metric,'vehicle':t['vehicle'][positive],
+            'linkID':t['linkID'][positive],
+            'vehType':t['vehType'][positive],'value':value[positive]
+        }).drop_duplicates(['vehicle','linkID'],keep = 'last').drop(
+            columns = 'vehicle'
+        ))
+    return pd.concat(linkData)
+
+
+def mapChunk(chunk,vehicles,links,aggInt,speedBin):
+    # the link volumes by time interval and speed bin and the link data
+    # of the vehicle blocks of the chunk
+    nodes = chunkNodes(chunk,vehicles)
+    traversals = traverse(vehicles,nodes['vehicle'],nodes['within'],
+                          nodes['node'],nodes['time'],links)
+    return mapVolumes(traversals,aggInt,speedBin), \
+        mapLinkData(traversals,nodes['delay'],nodes['toll'])
+
+
+volumeKeys = ['linkID','vehType','timeIntervalID','avgSpeedBinID']
+linkDataKeys = ['metric','linkID','vehType']
+
+def reduceValues(partials,keys):
+    # sum the values and any other columns by the keys
+    frame = partials[0] if len(partials) == 1 else pd.concat(partials)
+    return frame.groupby(keys,sort = False).sum().reset_index()
+
+
+def reduceChunks(chunks,keys):
+    # sum the values of the tuples of frames of the chunks by the keys
+    # of every frame reducing the partial sums whenever they outgrow
+    # twice the reduced accumulator
+    partials = [[] for _ in keys]
+    numBuffered = [0]*len(keys)
+    numReduced = [1]*len(keys)
+    for idx,frames in enumerate(chunks):
+        for i,frame in enumerate(frames):
+            partials[i].append(reduceValues([frame],keys[i]))
+            numBuffered[i] += len(partials[i][-1])
+            if numBuffered[i] > 2*numReduced[i]:
+                partials[i] = [reduceValues(partials[i],keys[i])]
+                numBuffered[i] = numReduced[i] = len(partials[i][0])
+        progress('Mapped chunk',idx + 1)
+    return tuple(
+        reduceValues(partials[i],keys[i]) if partials[i]
+        else pd.DataFrame(columns = keys[i] + ['value'])
+        for i in range(len(keys))
+    )
+
+
+def mapTrajectories(vehicles,links,aggInt,speedBin,
+                    path = 'VehTrajectory.dat.bz2',chunkBytes = 2**25,
+                    workers = 1):
+    # map the trajectories chunk by chunk
+    return reduceChunks(
+        (mapChunk(chunk,vehicles,links,aggInt,speedBin)
+         for chunk in readTrajectories(path,chunkBytes,workers)),
+        [volumeKeys,linkDataKeys]
+    )
+
+
+def writeRows(frame,path):
+    # write the frame with its last column formatted like the doubles
+    # written by volumes.exe (6 significant digits); formatting the rows
+    # at once is much faster than to_csv with a float_format
+    template = ','.join(['%s']*(frame.shape[1] - 1) + ['%g']) + '\n'
+    with open(path,'w') as f:
+        f.write(','.join(frame.columns) + '\n')
+        f.writelines([template % row for row in zip(
+            *(frame[column].tolist() for column in frame.columns)
+        )])
+
+
+def linkVMT(volumes,links):
+    # the volumes sorted by the link, vehType, interval and speed bin
+    # with the "A-B" link IDs, the link length and the vmt
+    volumes = volumes.sort_values(volumeKeys,ignore_index = True)
+    linkIndex = links.index.get_indexer(volumes.linkID.values)
+    volumes['length'] = np.where(linkIndex >= 0,
+                                 links.length.values[linkIndex],0.)
+    volumes['vmt'] = volumes.value.values*volumes.length.values
+    volumes['linkID'] = linkIDFromKey(volumes.linkID.values)
+    return volumes
+
+
+def outputVolumes(volumes,links,path = 'linkVMT.csv'):
+    writeRows(linkVMT(volumes,links)[volumeKeys + ['vmt']],path)
+
+
+def outputLinkData(linkData,path = 'linkData.csv'):
+    # the metrics in the order of volumes.exe, every metric sorted by
+    # the link and the vehType
+    linkData['metric'] = pd.Categorical(linkData.metric,
+                                        categories = list(metrics))
+    linkData = linkData.sort_values(linkDataKeys,ignore_index = True)
+    linkData['linkID'] = linkIDFromKey(linkData.linkID.values)
+    linkData['unit'] = linkData.metric.map(metrics).astype(str)
+    writeRows(linkData[['linkID','vehType','metric','unit','value']],path)
+
+
+def outputNumberOfTrips(vehicles,path = 'numberOfTrips.csv'):
+    trips = vehicles.groupby('vehType').size().rename('numTrips')
+    trips.reset_index().to_csv(path,index = False)
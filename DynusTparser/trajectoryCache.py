@@ -0,0 +1,221 @@
+'''the TrajectoryCache class keeps the parsed DynusT trajectories in a
+compressed sparse row layout of memory mapped .npy columns: a header
+row per trajectory, the offsets of the nodes of every trajectory and
+the flat node ID and node time columns, so that the link volumes can
+be mapped for any aggregation interval and speed bin without parsing
+VehTrajectory.dat.bz2 again'''
+
+import os
+import json
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+
+from instrument import count,progress
+import trajectories
+
+class TrajectoryCache(object):
+    version = 1
+    name = 'trajectoryCache'
+    # the header columns of the trajectories
+    headerTypes = {
+        'ID':np.dtype(np.int64),
+        'upstreamNode':np.dtype(np.int32),
+        'vehType':np.dtype(np.int16),
+        'startTime':np.dtype(np.float64),
+        'originLinkFrac':np.dtype(np.float64)
+    }
+    # the node times are kept as int32 multiples of the first of these
+    # resolutions that represents all of them exactly, otherwise as
+    # float64
+    timeScales = [10**k for k in range(7)]
+
+    def __init__(self,path = name):
+        with open(os.path.join(path,'index.json')) as f:
+            index = json.load(f)
+        if index['version'] != self.version:
+            raise ValueError(f'{path} has version {index["version"]}')
+        self.timeScale = index['timeScale']
+        load = lambda column: np.load(os.path.join(path,column + '.npy'),
+                                      mmap_mode = 'r')
+        # the trajectories of the vehicles of the roster that have none
+        # are empty
+        self.header = pd.DataFrame(dict(
+            (column,load(column)) for column in self.headerTypes
+        ))
+        self.offsets = load('offsets')
+        self.nodes = load('nodes')
+        self.times = load('times')
+        # the rows of the vehicle IDs, indexed when first needed
+        self.rowIndex = None
+
+    def nodeTimes(self,index):
+        # the times since the start of the trajectory of the nodes at
+        # the slice or array index in minutes, identical to the parsed
+        # ones
+        times = self.times[index]
+        if self.timeScale is None: return np.asarray(times)
+        return times.astype(np.float64)/self.timeScale
+
+    def vehicles(self,removeIDs = ()):
+        # the vehicles of the roster without removeIDs
+        vehicles = self.header.drop_duplicates('ID')
+        return vehicles[~vehicles.ID.isin(removeIDs)]
+
+    def rows(self,IDs):
+        # the sorted rows of the trajectories of the vehicles IDs
+        if self.rowIndex is None:
+            self.rowIndex = pd.Index(self.header.ID.values)
+        rows = self.rowIndex.get_indexer_non_unique(np.asarray(IDs))[0]
+        return np.unique(rows[rows >= 0])
+
+    def rowTraversals(self,rows,links,chunkNodes = 2**22):
+        # yield the traversals of chunks of the trajectories of the rows
+        # of about chunkNodes nodes; only the nodes of the rows are read
+        offsets = np.asarray(self.offsets)
+        starts = offsets[rows]
+        lengths = offsets[rows + 1] - starts
+        ends = np.append(0,np.cumsum(lengths))
+        bounds = np.unique(np.append(
+            np.searchsorted(ends,np.arange(0,ends[-1],chunkNodes)),
+            len(rows)
+        ))
+        for first,last in zip(bounds[:-1],bounds[1:]):
+            counts = lengths[first:last]
+            within = np.arange(ends[last] - ends[first]) - \
+                np.repeat(ends[first:last] - ends[first],counts)
+            index = np.repeat(starts[first:last],counts) + within
+            yield trajectories.traverse(
+                self.header,np.repeat(rows[first:last],counts),within,
+                self.nodes[index].astype(np.int64),self.nodeTimes(index),
+                links
+            )
+
+    def traversals(self,links,removeIDs = (),chunkNodes = 2**22):
+        # yield the traversals of chunks of whole trajectories of about
+        # chunkNodes nodes; the trajectories of removeIDs are skipped
+        offsets = np.asarray(self.offsets)
+        keep = ~self.header.ID.isin(removeIDs).values
+        bounds = np.unique(np.append(
+            np.searchsorted(offsets,np.arange(0,offsets[-1],chunkNodes)),
+            len(offsets) - 1
+        ))
+        for first,last in zip(bounds[:-1],bounds[1:]):
+            start,stop = offsets[first],offsets[last]
+            lengths = np.diff(offsets[first:last + 1])
+            rows = np.repeat(np.arange(first,last),lengths)
+            within = np.arange(stop - start) - \
+                np.repeat(offsets[first:last] - start,lengths)
+            kept = keep[rows]
+            yield trajectories.traverse(
+                self.header,rows[kept],within[kept],
+                self.nodes[start:stop][kept].astype(np.int64),
+                self.nodeTimes(slice(start,stop))[kept],links
+            )
+
+    @classmethod
+    def convert(cls,vehicles,trajectoryPath = 'VehTrajectory.dat.bz2',
+                path = name,chunkBytes = 2**25,workers = 1):
+        # parse the trajectories of the roster and write the cache; the
+        # columns are appended chunk by chunk to raw files that become
+        # the .npy columns once the number of rows is known
+        directory = os.path.dirname(os.path.abspath(path))
+        tmp = tempfile.mkdtemp(prefix = 'tmp',dir = directory)
+        try:
+            columns = list(cls.headerTypes) + ['lengths','nodes','times']
+            raw = dict((column,open(os.path.join(tmp,column + '.bin'),'wb'))
+                       for column in columns)
+            dtypes = dict(cls.headerTypes,lengths = np.dtype(np.int64),
+                          nodes = np.dtype(np.int32),
+                          times = np.dtype(np.float64))
+            scales = list(cls.timeScales)
+            numRows = numNodes = 0
+            cached = np.zeros(len(vehicles),dtype = bool)
+
+            def append(positions,lengths,nodes,times):
+                header = vehicles.iloc[positions]
+                values = dict(
+                    (column,header[column].values)
+                    for column in cls.headerTypes if column != 'ID'
+                )
+                values.update(ID = header.index.values,lengths = lengths,
+                              nodes = nodes,times = times)
+                for column,dtype in dtypes.items():
+                    if dtype.kind == 'i' and len(values[column]):
+                        info = np.iinfo(dtype)
+                        if values[column].min() < info.min or \
+                           values[column].max() > info.max:
+                            raise ValueError(
+                                f'{column} does not fit into {dtype}'
+                            )
+                    raw[column].write(
+                        np.asarray(values[column],dtype = dtype).tobytes()
+                    )
+
+            for idx,chunk in enumerate(
+                    trajectories.readTrajectories(trajectoryPath,chunkBytes,
+                                                  workers)
+            ):
+                nodes = trajectories.chunkNodes(chunk,vehicles)
+                starts = np.flatnonzero(nodes['within'] == 0)
+                positions = nodes['vehicle'][starts]
+                times = nodes['time']
+                # drop the resolutions that do not represent the times
+                scales = [
+                    scale for scale in scales
+                    if np.abs(times).max(initial = 0)*scale < 2**31 and
+                    np.array_equal(np.round(times*scale)/scale,times)
+                ]
+                append(positions,np.diff(np.append(starts,len(times))),
+                       nodes['node'],times)
+                cached[positions] = True
+                numRows += len(starts)
+                numNodes += len(times)
+                progress('Cached chunk',idx + 1)
+            # the vehicles without a trajectory count as trips
+            missing = np.flatnonzero(~cached)
+            append(missing,np.zeros(len(missing),dtype = np.int64),
+                   np.zeros(0,dtype = np.int64),np.zeros(0))
+            numRows += len(missing)
+            count('cachedTrajectories',numRows)
+            count('cachedNodes',numNodes)
+
+            timeScale = scales[0] if scales else None
+            for column in columns:
+                raw[column].close()
+            for column,dtype in dtypes.items():
+                binPath = os.path.join(tmp,column + '.bin')
+                size = os.path.getsize(binPath)//dtype.itemsize
+                values = np.memmap(binPath,dtype = dtype,mode = 'r',
+                                   shape = (size,)) if size else \
+                    np.zeros(0,dtype = dtype)
+                if column == 'lengths':
+                    column,values = 'offsets',np.append(0,np.cumsum(values))
+                    dtype,size = values.dtype,len(values)
+                if column == 'times' and timeScale is not None:
+                    dtype = np.dtype(np.int32)
+                with open(os.path.join(tmp,column + '.npy'),'wb') as out:
+                    np.lib.format.write_array_header_1_0(out,{
+                        'descr':np.lib.format.dtype_to_descr(dtype),
+                        'fortran_order':False,'shape':(size,)
+                    })
+                    for start in range(0,size,2**22):
+                        block = values[start:start + 2**22]
+                        if column == 'times' and timeScale is not None:
+                            block = np.round(block*timeScale)
+                        out.write(np.asarray(block,dtype = dtype).tobytes())
+                del values
+                os.remove(binPath)
+            with open(os.path.join(tmp,'index.json'),'w') as f:
+                json.dump({'version':cls.version,'timeScale':timeScale,
+                           'numTrajectories':numRows,'numNodes':numNodes},f)
+
+            # replace the old cache; mkdtemp makes the directory private
+            os.chmod(tmp,0o755)
+            if os.path.exists(path): shutil.rmtree(path)
+            os.replace(tmp,path)
+        except BaseException:
+            shutil.rmtree(tmp,ignore_errors = True)
+            raise
+        return numRows,numNodes
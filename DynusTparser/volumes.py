@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+'''script that computes linkVMT.csv, linkData.csv and numberOfTrips.csv
+from the DynusT outputs in the working directory like volumes.exe, with
+the trajectories streamed and mapped onto the links in NumPy chunks'''
+
+import os
+import sys
+import time
+from argparse import ArgumentParser
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..','common'))
+import instrument
+from instrument import log,stage,count
+
+parser = ArgumentParser()
+parser.add_argument('aggInt',type = float,
+                    help = 'length of the aggregation intervals in minutes')
+parser.add_argument('speedBin',type = int,
+                    help = 'size of the speed bins in mph')
+parser.add_argument('--chunkMB',type = float,default = 32,
+                    help = 'decompressed megabytes of trajectories parsed '
+                    'and mapped at once')
+parser.add_argument('--workers',type = int,default = 1,
+                    help = 'number of processes that decompress the bzip2 '
+                    'blocks of the DynusT outputs')
+instrument.addArguments(parser)
+args = parser.parse_args()
+instrument.configure(args)
+
+import trajectories
+
+start = time.perf_counter()
+chunkBytes = int(args.chunkMB*2**20)
+with stage('volumes'):
+    with stage('readLinks'):
+        links = trajectories.readLinks()
+        count('links',len(links))
+    with stage('readVehicles'):
+        vehicles = trajectories.readVehicles(chunkBytes = chunkBytes,
+                                             workers = args.workers)
+    # if elecIDs.txt is present, remove the vehicles listed in it
+    if os.path.exists('elecIDs.txt'):
+        log.info('Removing electrified vehicles')
+        vehicles = vehicles.drop(trajectories.readElecIDs(),
+                                 errors = 'ignore')
+    count('vehicles',len(vehicles))
+
+    with stage('mapTrajectories'):
+        volumes,linkData = trajectories.mapTrajectories(
+            vehicles,links,args.aggInt,args.speedBin,chunkBytes = chunkBytes,
+            workers = args.workers
+        )
+    with stage('writeOutputs'):
+        trajectories.outputVolumes(volumes,links)
+        trajectories.outputNumberOfTrips(vehicles)
+        trajectories.outputLinkData(linkData)
+        count('volumeRows',len(volumes))
+
+log.info(f'Mapped {len(vehicles)} vehicles in '
+         f'{round(time.perf_counter() - start,2)} s')
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+
+'''compute the running exhaust emissions for a batch of (year,
+dayOfTheWeek,ratesPath) scenarios reading the link VMT, the links
+and the vehicle mix only once'''
+
+import os
+import sys
+import time
+import yaml
+import pandas as pd
+from smart_open import open
+from argparse import ArgumentParser
+from rateCube import RateCube
+home = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(home,'..','common'))
+from tableIO import readTable,writeTable
+import instrument
+from instrument import log,stage,count
+from computeEmissions import mergeLinks,readLinks,checkIntervals, \
+    selectRates,selectVMX,selectNormalizedRates,joinRates,weightedRates, \
+    vectorizedEmissions,cubeEmissions,vmxWeights,reduceEmissions, \
+    outputEmissions
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('vmxPath',help = 'path to the vehicle mix CSV')
+    parser.add_argument('scenariosPath',
+                        help = 'CSV with year,dayOfTheWeek,ratesPath and '
+                        'optional tag and rateIndex columns, one row per '
+                        'scenario')
+    parser.add_argument('--engine',default = 'vectorized',
+                        choices = ['vectorized','cube'])
+    parser.add_argument('--linkVMT',default = 'linkVMT.csv',
+                        help = 'path to the link VMT (.csv, .parquet or '
+                        '.arrow)')
+    parser.add_argument('--links',default = 'links.csv',
+                        help = 'path to the links metadata')
+    parser.add_argument('--outputFormat',default = 'csv',
+                        choices = ['csv','parquet','arrow'])
+    instrument.addArguments(parser)
+    args = parser.parse_args()
+    instrument.configure(args)
+
+    scenarios = pd.read_csv(args.scenariosPath)
+    if 'tag' not in scenarios.columns: scenarios['tag'] = ''
+    scenarios['tag'] = scenarios.tag.fillna('').astype(str)
+    # the index of normalized rates, empty for the long rates
+    if 'rateIndex' not in scenarios.columns: scenarios['rateIndex'] = ''
+    scenarios['rateIndex'] = scenarios.rateIndex.fillna('').astype(str)
+    # scenarios with the same year and day need distinct tags, a later
+    # one would overwrite the output of an earlier one
+    scenarios['outPath'] = [
+        f'emissions_{year}_{dayOfTheWeek}' + (f'_{tag}' if tag else '') +
+        f'.{args.outputFormat}' for year,dayOfTheWeek,tag in
+        zip(scenarios.year,scenarios.dayOfTheWeek,scenarios.tag)
+    ]
+    duplicated = scenarios.outPath[scenarios.outPath.duplicated()]
+    if len(duplicated):
+        log.error(f'Several scenarios write {", ".join(duplicated.unique())}'
+                  ', give them distinct tags')
+        sys.exit(1)
+    # process the scenarios that share a rates file one after another
+    # so that only one rates file is held in memory
+    scenarios = scenarios.sort_values(['ratesPath','rateIndex'],
+                                      kind = 'stable')
+
+    # read the vmt and the links metadata and pack the linkIDs into
+    # integer keys once
+    start = time.perf_counter()
+    with stage('sharedInputs'):
+        vmt = mergeLinks(readTable(args.linkVMT),readLinks(args.links))
+        checkIntervals(set(vmt.timeIntervalID))
+        count('vmtRows',len(vmt))
+        # sort into the group order once for all scenarios
+        vmt = vmt.sort_values(
+            ['vehType','timeIntervalID','avgSpeedBinID',
+             'roadTypeID','countyID'],kind = 'stable'
+        )
+
+        # read the vehType to sourceType map and the vehicle mix
+        vehTypeMap = yaml.load(open('vehTypeMap.yaml').read(),
+                               Loader = yaml.Loader)
+        allVMX = readTable(args.vmxPath)
+    log.info(f'Read the shared inputs in '
+             f'{round(time.perf_counter() - start,2)} s')
+
+    ratesPath = indexPath = allRates = allIndex = None
+    vmxCache = {}
+    for scenario in scenarios.itertuples():
+        scenarioStart = time.perf_counter()
+        year = scenario.year
+        dayOfTheWeek = scenario.dayOfTheWeek
+        if scenario.ratesPath != ratesPath or \
+           scenario.rateIndex != indexPath:
+            ratesPath = scenario.ratesPath
+            indexPath = scenario.rateIndex
+            log.info(f'Reading {ratesPath}')
+            with stage('readRates'):
+                allRates = readTable(ratesPath)
+                if indexPath: allIndex = readTable(indexPath)
+
+        with stage('selectInputs'):
+            rateIndex = None
+            if indexPath:
+                rates,rateIndex = selectNormalizedRates(allRates,allIndex,
+                                                        year)
+            else:
+                rates = selectRates(allRates,year)
+            combineFuels = set(rates.fuelTypeID) == {0}
+            vmxKey = (year,dayOfTheWeek,combineFuels)
+            if vmxKey not in vmxCache:
+                vmxCache[vmxKey] = selectVMX(allVMX,*vmxKey)
+            vmx = vmxCache[vmxKey]
+
+        with stage('emissions'):
+            if args.engine == 'cube':
+                if rateIndex is not None:
+                    rates = joinRates(rates,rateIndex)
+                emissions = cubeEmissions(
+                    vmt,RateCube.fromRates(rates,year),
+                    vmxWeights(vmx,vehTypeMap)
+                )
+            else:
+                emissions = vectorizedEmissions(
+                    vmt,weightedRates(rates,vmx,vehTypeMap,rateIndex)
+                )
+
+        with stage('writeEmissions'):
+            emissions = outputEmissions(reduceEmissions([emissions]))
+            outPath = scenario.outPath
+            writeTable(emissions,outPath)
+            count('scenarios')
+            count('emissionRows',len(emissions))
+        log.info(f'Wrote {outPath} in '
+                 f'{round(time.perf_counter() - scenarioStart,2)} s')
+
+    log.info(f'Processed {len(scenarios)} scenarios in '
+             f'{round(time.perf_counter() - start,2)} s, '
+             f'peak memory {round(instrument.processPeakRSS())} MB')
+
+
+if __name__ == '__main__':
+    main()
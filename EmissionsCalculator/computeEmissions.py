@@ -2,13 +2,27 @@
 
 '''compute the running exhaust emissions using perDistance rates'''
 
+import os
 import sys
+import numpy as np
 import pandas as pd
 from smart_open import open
 import geopandas as gpd
 from joblib import Parallel,delayed
 import yaml
+import multiprocessing as mp
 from argparse import ArgumentParser
+from rateCube import RateCube,sourceStamps
+
+home = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(home,'..','common'))
+from tableIO import readTable,readChunks,writeTable
+from linkKeys import linkKeyFromID,linkIDFromKey,linkIDOrder
+import instrument
+from instrument import log,stage,count,progress
+
+# the keys of the emissions output
+outputKeys = ['linkID','pollutantID','fuelTypeID','sourceTypeID']
 
 def groupRates(rates,vmx,srcTypeGroup,countyID,
                timeIntervalID,roadTypeID,avgSpeedBin):
@@ -37,7 +51,7 @@ def groupRates(rates,vmx,srcTypeGroup,countyID,
                            rateSubset.VMTmix/vmxSubset.VMTmix.sum()
     return rateSubset.groupby(
         ['countyID','timeIntervalID','pollutantID','sourceTypeID',
-         'fuelTypeID','roadTypeID','avgSpeedBinID']
+         'fuelTypeID','roadTypeID','avgSpeedBinID'],observed = True
     ).emRate.sum().reset_index()
 
 
@@ -49,46 +63,277 @@ def processGroup(rates,vmx,vmap,vt,hour,speed,rt,fips,group):
     )
     group['emquant'] = group.vmt*group.emRate
     return group.groupby(
-        ['linkID','pollutantID','sourceTypeID','fuelTypeID']
+        ['linkID','pollutantID','sourceTypeID','fuelTypeID'],
+        observed = True
     ).emquant.sum().reset_index()
 
 
-def main():
-    parser = ArgumentParser()
-    parser.add_argument('vmxPath',help = 'path to the vehicle mix CSV')
-    parser.add_argument('ratesPath',help = 'path to the emission rates CSV')
-    parser.add_argument('year',type = int,help = 'emission rates year')
-    parser.add_argument('numCPU',type = int,help = 'number of CPUs to use')
-    parser.add_argument('--dayOfTheWeek',default = 'WK')
-    args = parser.parse_args()
-    vmxPath = args.vmxPath
-    ratesPath = args.ratesPath
-    year = args.year
-    numCPU = args.numCPU
-    dayOfTheWeek = args.dayOfTheWeek
-    
-    # read the vmt
-    vmt = pd.read_csv('linkVMT.csv')
+def vehTypeFrame(vehTypeMap):
+    # the vehType to sourceTypeID map as a two column dataframe
+    return pd.DataFrame(
+        [(vt,st) for vt,group in vehTypeMap.items() for st in group],
+        columns = ['vehType','sourceTypeID']
+    )
 
-    # read the links metadata and merge
-    links = pd.read_csv('links.csv')
-    vmt = vmt.merge(links,on = 'linkID')
 
-    # read the rates
-    rates = pd.read_csv(open(ratesPath))
+def vmxWeights(vmx,vehTypeMap):
+    # the VMTmix of every source type together with the sum of VMTmix
+    # over the source types in its vehType group
+    vmx = vmx.merge(vehTypeFrame(vehTypeMap),on = 'sourceTypeID')
+    groupKeys = ['vehType','countyID','timeIntervalID','roadTypeID']
+    # sum every group with Series.sum() as groupRates does instead of
+    # the compensated groupby sum so that both engines agree exactly
+    vmx['VMTmixSum'] = vmx.groupby(
+        groupKeys,observed = True
+    ).VMTmix.transform(
+        lambda mix: mix.sum()
+    )
+    return vmx[groupKeys + ['sourceTypeID','fuelTypeID',
+                            'VMTmix','VMTmixSum']]
+
+
+def weightedRates(rates,vmx,vehTypeMap,rateIndex = None):
+    # compute the VMT mix weighted rates for every vehType group at
+    # once: the weights are the VMTmix fractions normalized over the
+    # source types in the vehType group
+    weights = vmxWeights(vmx,vehTypeMap)
+    on = ['countyID','timeIntervalID','roadTypeID',
+          'sourceTypeID','fuelTypeID']
+    if rateIndex is not None:
+        # normalized rates: join the weights to the matrix of their
+        # county and interval instead of expanding the matrices
+        weights = weights.merge(rateIndex,on = ['countyID','timeIntervalID'])
+        on = ['matrixKey','roadTypeID','sourceTypeID','fuelTypeID']
+    rates = rates.merge(weights,on = on)
+    rates['emRate'] = rates.ratePerDistance*rates.VMTmix/rates.VMTmixSum
+    return rates.groupby(
+        ['vehType','countyID','timeIntervalID','pollutantID',
+         'sourceTypeID','fuelTypeID','roadTypeID','avgSpeedBinID'],
+        observed = True
+    ).emRate.sum().reset_index()
+
+
+def vectorizedEmissions(vmt,weighted):
+    # join the weighted rates to the link VMT in a single pass; keep
+    # the rows in the group order of the legacy engine so that the
+    # emissions are summed in the same order
+    emissions = vmt.sort_values(
+        ['vehType','timeIntervalID','avgSpeedBinID',
+         'roadTypeID','countyID'],kind = 'stable'
+    ).merge(
+        weighted,
+        on = ['vehType','timeIntervalID','avgSpeedBinID',
+              'roadTypeID','countyID']
+    )
+    emissions['emquant'] = emissions.vmt*emissions.emRate
+    return emissions
+
+
+def cubeEmissions(vmt,cube,weights):
+    # expand every link VMT row into the source and fuel types of its
+    # vehType group and look up the rates of all pollutants at once
+    emissions = vmt.sort_values(
+        ['vehType','timeIntervalID','avgSpeedBinID',
+         'roadTypeID','countyID'],kind = 'stable'
+    ).merge(
+        weights,
+        on = ['vehType','countyID','timeIntervalID','roadTypeID']
+    )
+    emRate = cube.lookup(emissions)*emissions.VMTmix.values[:,None]/\
+             emissions.VMTmixSum.values[:,None]
+    emquant = emissions.vmt.values[:,None]*emRate
+
+    # unstack the pollutants and drop the missing rates
+    numPollutants = len(cube.pollutants)
+    found = ~np.isnan(emquant.ravel())
+    emissions = emissions[
+        ['linkID','sourceTypeID','fuelTypeID']
+    ].iloc[np.repeat(np.arange(len(emissions)),numPollutants)[found]]
+    emissions['pollutantID'] = np.tile(
+        cube.pollutants,len(emquant)
+    )[found]
+    emissions['emquant'] = emquant.ravel()[found]
+    return emissions
+
+
+def loadRateCube(cubePath,ratesPath,year,indexPath = None):
+    # load the saved cube if it exists and was built from the same
+    # rates and index files, otherwise build it from the rates and
+    # save it
+    sources = sourceStamps(ratesPath,indexPath)
+    if cubePath is not None and os.path.exists(cubePath):
+        log.info(f'Loading the rate cube from {cubePath}')
+        cube = RateCube.load(cubePath)
+        if cube.year != year:
+            log.error(f'The rate cube in {cubePath} is for year {cube.year}')
+            sys.exit(1)
+        if cube.sources == sources: return cube
+        log.warning(f'The rate cube in {cubePath} was built from other '
+                    'or changed rates, rebuilding it')
+
+    rates = readRates(ratesPath,year,indexPath)
+    cube = RateCube.fromRates(rates,year)
+    cube.sources = sources
+    if cubePath is not None:
+        log.info(f'Saving the rate cube to {cubePath}')
+        cube.save(cubePath)
+    return cube
+
+
+# the tables shared by all groups, set once in every pool worker
+shared = {}
+
+def initWorker(rates,vmx,vehTypeMap,vmt):
+    shared['rates'] = rates
+    shared['vmx'] = vmx
+    shared['vehTypeMap'] = vehTypeMap
+    shared['vmt'] = vmt
+
+
+def processDescriptor(key,positions):
+    # process the group given by its key and the positions of its
+    # rows in the shared vmt
+    return processGroup(
+        shared['rates'],shared['vmx'],shared['vehTypeMap'],*key,
+        shared['vmt'].iloc[positions]
+    )
+
+
+def groupEmissions(vmt,rates,vmx,vehTypeMap,numCPU,backend = 'pool'):
+    # group by
+    # ['vehType','timeIntervalID','avgSpeedBinID','roadTypeID','countyID']
+    # and compute the average rate for each group
+    groupKeys = ['vehType','timeIntervalID','avgSpeedBinID',
+                 'roadTypeID','countyID']
+    if backend == 'joblib':
+        # every task receives a copy of the rates and the vmx
+        results = Parallel(n_jobs = numCPU)(
+            delayed(processGroup)(rates,vmx,vehTypeMap,*k,g)
+            for k,g in vmt.groupby(groupKeys,observed = True)
+        )
+        return pd.concat(results)
+
+    # the workers receive the tables once when they start and the
+    # tasks are only the group keys and row positions
+    descriptors = sorted(
+        vmt.groupby(groupKeys,observed = True).indices.items()
+    )
+    count('groups',len(descriptors))
+    with mp.Pool(numCPU,initializer = initWorker,
+                 initargs = (rates,vmx,vehTypeMap,vmt)) as pool:
+        results = pool.starmap(
+            processDescriptor,descriptors,
+            chunksize = 1 + len(descriptors)//(4*numCPU)
+        )
+    return pd.concat(results)
+
+
+def reduceEmissions(partials):
+    # sum the emissions by the output keys
+    emissions = partials[0] if len(partials) == 1 else pd.concat(partials)
+    return emissions.groupby(
+        outputKeys,observed = True
+    ).emquant.sum().reset_index()
+
+
+def streamEmissions(vmtPath,links,engine,chunksize):
+    # read the link VMT in chunks, compute the emissions of every
+    # chunk and reduce the partial sums whenever they outgrow twice
+    # the reduced accumulator so that the memory use is bounded by the
+    # number of output keys and not by the number of rows
+    partials = []
+    numBuffered = 0
+    numReduced = chunksize
+    intervals = set()
+    for idx,chunk in enumerate(readChunks(vmtPath,chunksize)):
+        chunk = mergeLinks(chunk,links)
+        intervals.update(chunk.timeIntervalID)
+        partial = engine(chunk).groupby(
+            outputKeys,observed = True
+        ).emquant.sum()
+        partials.append(partial.reset_index())
+        numBuffered += len(partial)
+        if numBuffered > 2*numReduced:
+            partials = [reduceEmissions(partials)]
+            numBuffered = numReduced = max(len(partials[0]),chunksize)
+        count('vmtRows',len(chunk))
+        progress('Processed chunk',idx + 1)
+        log.debug(f'Chunk {idx + 1} had {len(chunk)} rows, '
+                  f'peak memory {round(instrument.processPeakRSS())} MB')
+    return reduceEmissions(partials),intervals
+
+
+def readLinks(linksPath):
+    # read the links metadata and pack the linkIDs into integer keys
+    links = readTable(linksPath)
+    links['linkID'] = linkKeyFromID(links.linkID)
+    return links
+
+
+def mergeLinks(vmt,links):
+    # pack the linkIDs of the vmt into integer keys so that the joins
+    # and groupbys run on integers and merge the links metadata
+    vmt['linkID'] = linkKeyFromID(vmt.linkID)
+    return vmt.merge(links,on = 'linkID')
+
+
+def outputEmissions(emissions):
+    # restore the string linkIDs and the order of their rows
+    emissions = emissions.iloc[linkIDOrder(emissions.linkID)]
+    emissions['linkID'] = linkIDFromKey(emissions.linkID)
+    return emissions
 
-    # rename hourID to timeIntervalID
-    rates = rates.rename(columns = {'hourID':'timeIntervalID'})
 
+def checkIntervals(intervals):
     # determine whether timeIntervals in linkVMT are hours and if not
     # exit with "Unimpelemented" error
-    if len(set(vmt.timeIntervalID)) != 24:
-        print('Intervals other than 60 min long not yet implemented')
+    if len(intervals) != 24:
+        log.error('Intervals other than 60 min long not yet implemented')
         sys.exit(1)
 
-    # read the vehType to sourceType map
-    vehTypeMap = yaml.load(open('vehTypeMap.yaml').read(),
-                           Loader = yaml.Loader)
+
+def readRates(ratesPath,year,indexPath = None):
+    # read the rates and select the year; normalized rates are joined
+    # to their index
+    if indexPath is not None:
+        return joinRates(*readNormalizedRates(ratesPath,indexPath,year))
+    return selectRates(readTable(ratesPath),year)
+
+
+def readNormalizedRates(matricesPath,indexPath,year):
+    # read the distinct rate matrices and the countyID,hourID to
+    # matrixKey index written by transformMoves.py --layout normalized
+    return selectNormalizedRates(readTable(matricesPath),
+                                 readTable(indexPath),year)
+
+
+def selectNormalizedRates(matrices,rateIndex,year):
+    # rename hourID to timeIntervalID and filter the index on year
+    rateIndex = rateIndex.rename(columns = {'hourID':'timeIntervalID'})
+    rateIndex = rateIndex.query(f'yearID == {year}').drop(
+        columns = ['yearID']
+    )
+
+    # filter running exhaust processID == 1
+    matrices = matrices.query('processID == 1').drop(columns = ['processID'])
+
+    if len(rateIndex) == 0 or len(matrices) == 0:
+        log.error(f'No emission rates for year {year}')
+        sys.exit(1)
+
+    return matrices,rateIndex
+
+
+def joinRates(matrices,rateIndex):
+    # the long rates table of every county and interval
+    return rateIndex.merge(matrices,on = 'matrixKey').drop(
+        columns = ['matrixKey']
+    )
+
+
+def selectRates(rates,year):
+    # rename hourID to timeIntervalID
+    rates = rates.rename(columns = {'hourID':'timeIntervalID'})
 
     # filter on year
     rates = rates.query(f'yearID == {year}').drop(columns = ['yearID'])
@@ -97,13 +342,20 @@ def main():
     rates = rates.query('processID == 1').drop(columns = ['processID'])
 
     if len(rates) == 0:
-        print('No emission rates for year',year)
+        log.error(f'No emission rates for year {year}')
         sys.exit(1)
 
+    return rates
+
+
+def readVMX(vmxPath,year,dayOfTheWeek,combineFuels):
     # transform the volumes by vehType into volumes by sourceType using
     # the VMX dataset
-    vmx = pd.read_csv(open(vmxPath))
+    return selectVMX(readTable(vmxPath),year,dayOfTheWeek,
+                     combineFuels)
+
 
+def selectVMX(vmx,year,dayOfTheWeek,combineFuels):
     # determine which year in the vmx subset is closest to the
     # scenario year
     availableYears = set(vmx.yearID)
@@ -120,32 +372,135 @@ def main():
         f'yearID == {selectYear} & dayOfTheWeek == "{dayOfTheWeek}"'
     )
 
-    # detect whether the rates have a real or fake fuelTypeID column
-    if set(rates.fuelTypeID) == {0}:
+    # the rates have a fake fuelTypeID column
+    if combineFuels:
         # combine the diesel and gas vmx
         vmx = vmx.groupby(
             ['roadTypeID','sourceTypeID','dayOfTheWeek',
-             'yearID','countyID','timeIntervalID']
+             'yearID','countyID','timeIntervalID'],observed = True
         ).VMTmix.sum().reset_index()
         # add a fuelTypeID = 0 columns
         vmx['fuelTypeID'] = 0
 
-    # group by
-    # ['vehType','timeIntervalID','avgSpeedBinID','roadTypeID','countyID']
-    # and compute the average rate for each group
-    results = Parallel(n_jobs = numCPU)(
-        delayed(processGroup)(rates,vmx,vehTypeMap,*k,g)
-        for k,g in vmt.groupby(
-            ['vehType','timeIntervalID','avgSpeedBinID',
-             'roadTypeID','countyID']
-        )
-    )
+    return vmx
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('vmxPath',help = 'path to the vehicle mix CSV')
+    parser.add_argument('ratesPath',help = 'path to the emission rates CSV')
+    parser.add_argument('year',type = int,help = 'emission rates year')
+    parser.add_argument('numCPU',type = int,help = 'number of CPUs to use')
+    parser.add_argument('--rateIndex',
+                        help = 'countyID,hourID to matrixKey index of '
+                        'normalized rates; ratesPath is then the table of '
+                        'the distinct matrices')
+    parser.add_argument('--dayOfTheWeek',default = 'WK')
+    parser.add_argument('--engine',default = 'vectorized',
+                        choices = ['vectorized','groups','cube'],
+                        help = 'compute the emissions in a single columnar '
+                        'pass, per vehType group (legacy) or using the '
+                        'rate cube')
+    parser.add_argument('--backend',default = 'pool',
+                        choices = ['pool','joblib'],
+                        help = 'parallel backend of the groups engine: a '
+                        'process pool that receives the rates once per '
+                        'worker or joblib that ships them with every group')
+    parser.add_argument('--linkVMT',default = 'linkVMT.csv',
+                        help = 'path to the link VMT (.csv, .parquet or '
+                        '.arrow)')
+    parser.add_argument('--links',default = 'links.csv',
+                        help = 'path to the links metadata')
+    parser.add_argument('--outputFormat',default = 'csv',
+                        choices = ['csv','parquet','arrow'])
+    parser.add_argument('--chunksize',type = int,
+                        help = 'stream linkVMT.csv in chunks of this many '
+                        'rows to bound the memory use')
+    parser.add_argument('--rateCube',
+                        help = 'directory of the saved rate cube; it is '
+                        'memory mapped if it exists and created otherwise')
+    instrument.addArguments(parser)
+    args = parser.parse_args()
+    instrument.configure(args)
+    with stage('computeEmissions'):
+        computeEmissions(args)
+
+
+def computeEmissions(args):
+    vmxPath = args.vmxPath
+    ratesPath = args.ratesPath
+    year = args.year
+    numCPU = args.numCPU
+    dayOfTheWeek = args.dayOfTheWeek
     
-    pd.concat(results).groupby(
-        ['linkID','pollutantID','fuelTypeID','sourceTypeID']
-    ).emquant.sum().reset_index().to_csv(
-        f'emissions_{year}_{dayOfTheWeek}.csv',index = False
-    )
+    # read the links metadata
+    with stage('readLinks'):
+        links = readLinks(args.links)
+        count('links',len(links))
+
+    if args.chunksize is None:
+        # read the vmt and merge the links metadata
+        with stage('readLinkVMT'):
+            vmt = mergeLinks(readTable(args.linkVMT),links)
+            count('vmtRows',len(vmt))
+        checkIntervals(set(vmt.timeIntervalID))
+    elif args.engine == 'groups':
+        log.error('The groups engine does not support --chunksize')
+        sys.exit(1)
+
+    # read the vehType to sourceType map
+    vehTypeMap = yaml.load(open('vehTypeMap.yaml').read(),
+                           Loader = yaml.Loader)
+
+    # read the rates and detect whether they have a real or fake
+    # fuelTypeID column; the vectorized engine joins normalized rates
+    # through their index, the other engines expand them
+    rateIndex = None
+    with stage('readRates'):
+        if args.engine == 'cube':
+            cube = loadRateCube(args.rateCube,ratesPath,year,args.rateIndex)
+            combineFuels = set(cube.labels['fuelTypeID']) == {0}
+        else:
+            if args.engine == 'vectorized' and args.rateIndex is not None:
+                rates,rateIndex = readNormalizedRates(ratesPath,
+                                                      args.rateIndex,year)
+            else:
+                rates = readRates(ratesPath,year,args.rateIndex)
+            combineFuels = set(rates.fuelTypeID) == {0}
+            count('rateRows',len(rates))
+
+    with stage('readVMX'):
+        vmx = readVMX(vmxPath,year,dayOfTheWeek,combineFuels)
+
+    # precompute the rate tables shared by all link VMT rows
+    with stage('weightRates'):
+        if args.engine == 'cube':
+            weights = vmxWeights(vmx,vehTypeMap)
+            engine = lambda vmt: cubeEmissions(vmt,cube,weights)
+        elif args.engine == 'vectorized':
+            weighted = weightedRates(rates,vmx,vehTypeMap,rateIndex)
+            engine = lambda vmt: vectorizedEmissions(vmt,weighted)
+
+    outPath = f'emissions_{year}_{dayOfTheWeek}.{args.outputFormat}'
+    if args.chunksize is not None:
+        with stage('streamEmissions'):
+            emissions,intervals = streamEmissions(
+                args.linkVMT,links,engine,args.chunksize
+            )
+        checkIntervals(intervals)
+    else:
+        with stage('emissions'):
+            if args.engine == 'groups':
+                emissions = groupEmissions(vmt,rates,vmx,vehTypeMap,
+                                           numCPU,args.backend)
+            else:
+                emissions = engine(vmt)
+            emissions = reduceEmissions([emissions])
+
+    with stage('writeEmissions'):
+        writeTable(outputEmissions(emissions),outPath)
+        count('emissionRows',len(emissions))
+    log.info(f'Peak memory {round(instrument.processPeakRSS())} MB')
     
 
 if __name__ == '__main__':
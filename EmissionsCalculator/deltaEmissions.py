@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+'''patch the emissions of a baseline scenario by recomputing only the
+links whose VMT differs between the baseline and the new linkVMT.csv'''
+
+import os
+import sys
+import yaml
+import numpy as np
+import pandas as pd
+from smart_open import open
+from argparse import ArgumentParser
+home = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(home,'..','common'))
+from tableIO import readTable,writeTable
+from linkKeys import linkKeyFromID
+import instrument
+from instrument import log,stage,count
+from computeEmissions import outputKeys,readLinks,readRates, \
+    readNormalizedRates,readVMX,loadRateCube,checkIntervals, \
+    weightedRates,vectorizedEmissions,cubeEmissions,vmxWeights, \
+    reduceEmissions,outputEmissions
+
+def changedLinks(baseVMT,vmt):
+    # the linkIDs with at least one link/vehType/interval/speed bin row
+    # that was added, removed or has a different vmt
+    keys = ['linkID','vehType','timeIntervalID','avgSpeedBinID']
+    diff = baseVMT[keys + ['vmt']].merge(
+        vmt[keys + ['vmt']],on = keys,how = 'outer',
+        suffixes = ('Base','')
+    )
+    changed = diff.vmtBase != diff.vmt
+    return set(diff.linkID[changed]),changed.sum()
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('vmxPath',help = 'path to the vehicle mix CSV')
+    parser.add_argument('ratesPath',help = 'path to the emission rates CSV')
+    parser.add_argument('year',type = int,help = 'emission rates year')
+    parser.add_argument('baseVMTPath',help = 'path to the baseline linkVMT')
+    parser.add_argument('baseEmissionsPath',
+                        help = 'path to the emissions of the baseline '
+                        'computed with the same rates and vehicle mix')
+    parser.add_argument('--dayOfTheWeek',default = 'WK')
+    parser.add_argument('--engine',default = 'vectorized',
+                        choices = ['vectorized','cube'])
+    parser.add_argument('--rateCube',
+                        help = 'directory of the saved rate cube')
+    parser.add_argument('--rateIndex',
+                        help = 'countyID,hourID to matrixKey index of '
+                        'normalized rates; ratesPath is then the table of '
+                        'the distinct matrices')
+    parser.add_argument('--linkVMT',default = 'linkVMT.csv',
+                        help = 'path to the new link VMT (.csv, .parquet '
+                        'or .arrow)')
+    parser.add_argument('--links',default = 'links.csv',
+                        help = 'path to the links metadata')
+    parser.add_argument('--outputFormat',default = 'csv',
+                        choices = ['csv','parquet','arrow'])
+    instrument.addArguments(parser)
+    args = parser.parse_args()
+    instrument.configure(args)
+    year = args.year
+    dayOfTheWeek = args.dayOfTheWeek
+
+    # diff the new vmt against the baseline
+    with stage('diffVMT'):
+        vmt = readTable(args.linkVMT)
+        checkIntervals(set(vmt.timeIntervalID))
+        numRows = len(vmt)
+        vmt['linkID'] = linkKeyFromID(vmt.linkID)
+        baseVMT = readTable(args.baseVMTPath)
+        baseVMT['linkID'] = linkKeyFromID(baseVMT.linkID)
+        links,numChanged = changedLinks(baseVMT,vmt)
+        vmt = vmt[vmt.linkID.isin(links)]
+        vmt = vmt.merge(readLinks(args.links),on = 'linkID')
+        count('changedLinks',len(links))
+
+    # read the vehType to sourceType map, the rates and the vmx
+    vehTypeMap = yaml.load(open('vehTypeMap.yaml').read(),
+                           Loader = yaml.Loader)
+    rateIndex = None
+    with stage('readRates'):
+        if args.engine == 'cube':
+            cube = loadRateCube(args.rateCube,args.ratesPath,year,
+                                args.rateIndex)
+            combineFuels = set(cube.labels['fuelTypeID']) == {0}
+        elif args.rateIndex is not None:
+            rates,rateIndex = readNormalizedRates(args.ratesPath,
+                                                  args.rateIndex,year)
+            combineFuels = set(rates.fuelTypeID) == {0}
+        else:
+            rates = readRates(args.ratesPath,year)
+            combineFuels = set(rates.fuelTypeID) == {0}
+        vmx = readVMX(args.vmxPath,year,dayOfTheWeek,combineFuels)
+
+    # recompute the emissions of the changed links
+    with stage('emissions'):
+        if args.engine == 'cube':
+            emissions = cubeEmissions(vmt,cube,vmxWeights(vmx,vehTypeMap))
+        else:
+            emissions = vectorizedEmissions(
+                vmt,weightedRates(rates,vmx,vehTypeMap,rateIndex)
+            )
+        emissions = outputEmissions(reduceEmissions([emissions]))
+        count('vmtRows',len(vmt))
+
+    # patch the baseline; read the emissions with round trip precision
+    # so that the untouched rows are written back unchanged
+    with stage('patchBaseline'):
+        baseline = readTable(
+            args.baseEmissionsPath,float_precision = 'round_trip'
+        )
+        numBaseRows = len(baseline)
+        baseline = baseline[
+            ~np.isin(linkKeyFromID(baseline.linkID),list(links))
+        ]
+        writeTable(
+            pd.concat((baseline,emissions)).sort_values(outputKeys),
+            f'emissions_{year}_{dayOfTheWeek}.{args.outputFormat}'
+        )
+
+    log.info(f'Changed VMT rows: {numChanged}')
+    log.info(f'Changed links: {len(links)}')
+    log.info(f'Recomputed VMT rows: {len(vmt)} out of {numRows} '
+             f'({100*len(vmt)/max(numRows,1):.2f}%)')
+    log.info(f'Patched emission rows: {numBaseRows - len(baseline)} '
+             f'out of {numBaseRows}')
+
+
+if __name__ == '__main__':
+    main()
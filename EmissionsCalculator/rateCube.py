@@ -0,0 +1,148 @@
+'''the RateCube class holds the running emission rates in a dense NumPy
+array indexed by factorized county, time interval, road type, speed
+bin, source type, fuel type and pollutant axes, or in a sparse table
+when the dense array would be too large'''
+
+import os
+import json
+import logging
+import numpy as np
+
+log = logging.getLogger('paths')
+
+def sourceStamps(*paths):
+    # the path, size and modification time of every local file that a
+    # cube is built from, None for the paths that are not given; the
+    # size and time of remote paths are None
+    stamps = []
+    for path in paths:
+        if path is None:
+            stamps.append(None)
+        elif os.path.exists(path):
+            stat = os.stat(path)
+            stamps.append({'path':os.path.abspath(path),
+                           'size':stat.st_size,'mtime':stat.st_mtime})
+        else:
+            stamps.append({'path':path,'size':None,'mtime':None})
+    return stamps
+
+class RateCube(object):
+    axes = ['countyID','timeIntervalID','roadTypeID','avgSpeedBinID',
+            'sourceTypeID','fuelTypeID','pollutantID']
+    # the dense cube is used only if it has fewer cells than this
+    maxDenseCells = 2**27
+
+    def __init__(self,labels,values,keys = None,year = None,
+                 sources = None):
+        # labels is a dict from the axis name to the sorted array of
+        # the axis labels; values is either the dense cube or, if keys
+        # is not None, a (len(keys),numPollutants) array of rates for
+        # the sorted linear indices over all axes except pollutantID;
+        # sources are the sourceStamps of the files the cube is built
+        # from
+        self.labels = labels
+        self.values = values
+        self.keys = keys
+        self.year = year
+        self.sources = sources
+        self.shape = tuple(len(labels[axis]) for axis in self.axes)
+
+    @property
+    def dense(self):
+        return self.keys is None
+
+    @property
+    def pollutants(self):
+        return self.labels['pollutantID']
+
+    @classmethod
+    def fromRates(cls,rates,year = None,maxDenseCells = None):
+        # the rates must be already filtered on year and processID
+        # and have the timeIntervalID column; duplicate rows are
+        # summed as they would be by groupRates
+        if maxDenseCells is None: maxDenseCells = cls.maxDenseCells
+        rates = rates.groupby(cls.axes).ratePerDistance.sum().reset_index()
+        labels = dict(
+            (axis,np.unique(rates[axis].values)) for axis in cls.axes
+        )
+        codes = [np.searchsorted(labels[axis],rates[axis].values)
+                 for axis in cls.axes]
+        shape = tuple(len(labels[axis]) for axis in cls.axes)
+
+        if np.prod(shape,dtype = float) <= maxDenseCells:
+            values = np.full(shape,np.nan)
+            values[tuple(codes)] = rates.ratePerDistance.values
+            return cls(labels,values,year = year)
+
+        # sparse fallback: one row of pollutant rates for every
+        # distinct combination of the other axes
+        log.info(f'Rate cube with {int(np.prod(shape,dtype = float))} '
+                 'cells is too large, using the sparse table')
+        linear = np.ravel_multi_index(codes[:-1],shape[:-1])
+        keys,rows = np.unique(linear,return_inverse = True)
+        values = np.full((len(keys),shape[-1]),np.nan)
+        values[rows.ravel(),codes[-1]] = rates.ratePerDistance.values
+        return cls(labels,values,keys = keys,year = year)
+
+    def index(self,frame,axes = None):
+        # map the columns of the frame to the integer codes of the
+        # axes; -1 marks labels that are not in the cube
+        if axes is None: axes = self.axes[:-1]
+        codes = []
+        for axis in axes:
+            labels = self.labels[axis]
+            values = frame[axis].values
+            code = np.searchsorted(labels,values)
+            code[code == len(labels)] = 0
+            code[labels[code] != values] = -1
+            codes.append(code)
+        return codes
+
+    def lookup(self,frame):
+        # return a (len(frame),numPollutants) array of rates for the
+        # rows of the frame, NaN where the cube has no rate
+        codes = self.index(frame)
+        found = np.logical_and.reduce([code >= 0 for code in codes])
+        result = np.full((len(frame),self.shape[-1]),np.nan)
+        if not found.any(): return result
+        codes = [code[found] for code in codes]
+        if self.dense:
+            result[found] = self.values[tuple(codes)]
+            return result
+        linear = np.ravel_multi_index(codes,self.shape[:-1])
+        pos = np.searchsorted(self.keys,linear)
+        pos[pos == len(self.keys)] = 0
+        hit = self.keys[pos] == linear
+        rows = np.flatnonzero(found)
+        result[rows[hit]] = self.values[pos[hit]]
+        return result
+
+    def save(self,path):
+        # save the cube into the path directory so that it can be
+        # memory mapped by load
+        os.makedirs(path,exist_ok = True)
+        np.save(os.path.join(path,'values.npy'),self.values)
+        if not self.dense:
+            np.save(os.path.join(path,'keys.npy'),self.keys)
+        with open(os.path.join(path,'axes.json'),'w') as f:
+            json.dump({
+                'year':self.year,
+                'sources':self.sources,
+                'labels':dict((axis,self.labels[axis].tolist())
+                              for axis in self.axes)
+            },f)
+
+    @classmethod
+    def load(cls,path,mmap = True):
+        mode = 'r' if mmap else None
+        with open(os.path.join(path,'axes.json')) as f:
+            meta = json.load(f)
+        labels = dict((axis,np.array(meta['labels'][axis]))
+                      for axis in cls.axes)
+        values = np.load(os.path.join(path,'values.npy'),mmap_mode = mode)
+        keys = None
+        keysPath = os.path.join(path,'keys.npy')
+        if os.path.exists(keysPath):
+            keys = np.load(keysPath,mmap_mode = mode)
+        return cls(labels,values,keys = keys,year = meta['year'],
+                   sources = meta.get('sources'))
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+'''script to transform the MOVES rates for every combination of a list
+of years and a list of months reading the reference tables and
+indexing the matrices only once; the months of a year that share a
+MOVES month reuse the matrices they have in common'''
+
+import os
+import sys
+import time
+from argparse import ArgumentParser
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..','common'))
+import instrument
+from instrument import log,stage,count
+
+def parseList(value):
+    # comma separated integers and ranges, e.g. 2020,2025 or 1-12
+    values = []
+    for item in value.split(','):
+        first,_,last = item.partition('-')
+        values.extend(range(int(first),int(last or first) + 1))
+    return values
+
+
+parser = ArgumentParser()
+parser.add_argument('fipsList',
+                    help = 'comma separated list of counties')
+parser.add_argument('years',type = parseList,
+                    help = 'comma separated list of 4 digit years or '
+                    'ranges, e.g. 2020,2025-2027')
+parser.add_argument('months',type = parseList,
+                    help = 'comma separated list of numeric months or '
+                    'ranges, e.g. 1-12')
+parser.add_argument('movesRoot',
+                    help = 'directory where MOVES matrix rates reside')
+parser.add_argument('--speedBinSize',default = 5,type = int,
+                    help = 'speed bin size for aggregation in mph')
+parser.add_argument('--outputFormat',default = 'csv',
+                    choices = ['csv','parquet','arrow'],
+                    help = 'parquet and arrow store the ID columns as '
+                    'narrow integers')
+parser.add_argument('--layout',default = 'wide',
+                    choices = ['wide','normalized'],
+                    help = 'write the rates of every county and hour '
+                    '(legacy) or the distinct matrices and a countyID,'
+                    'hourID to matrixKey index')
+parser.add_argument('--partitioned',metavar = 'DIR',
+                    help = 'write the outputs into the hive partitions '
+                    'DIR/year=YEAR/month=MONTH/ instead of the working '
+                    'directory')
+parser.add_argument('--matrixSearch',default = 'upward',
+                    choices = ['upward','nearest'],
+                    help = 'how to pick the matrix when the one for the '
+                    'hour temperature and humidity is missing: step the '
+                    'humidity and then the temperature up (legacy) or '
+                    'take the nearest available one')
+parser.add_argument('--matrixManifest',
+                    help = 'JSON index of the available matrices; it is '
+                    'loaded if it exists and written otherwise')
+parser.add_argument('--cacheDir',
+                    help = 'directory of the persistent cache of the '
+                    'transformed matrices')
+parser.add_argument('--cacheSizeMB',type = float,default = 1024,
+                    help = 'size cap of the cache, the least recently '
+                    'used matrices are evicted beyond it')
+parser.add_argument('--engine',default = 'pandas',
+                    choices = ['pandas','tensor'],
+                    help = 'transform the matrices with merges and '
+                    'groupbys or with tensor contractions')
+parser.add_argument('--workers',type = int,default = 1,
+                    help = 'number of processes that load and transform '
+                    'the distinct matrices')
+instrument.addArguments(parser)
+
+args = parser.parse_args()
+instrument.configure(args)
+years = sorted(set(args.years))
+months = sorted(set(args.months))
+if months[0] < 1 or months[-1] > 12:
+    parser.error('the months must be between 1 and 12')
+fipsStrList = args.fipsList.split(',')
+fipsIntList = list(map(int,fipsStrList))
+
+import moves
+
+# the reference tables, the catalog and the matrices shared by all
+# (year,month) scenarios; the years are processed one after another
+# so that only the matrices of one year are held in memory
+reference = {}
+start = time.perf_counter()
+with stage('batchMoves'):
+    for year in years:
+        for month in months:
+            scenarioStart = time.perf_counter()
+            with stage('scenario'):
+                m = moves.MOVES(year,month,args.movesRoot,
+                                args.matrixSearch,args.matrixManifest,
+                                args.cacheDir,int(args.cacheSizeMB*2**20),
+                                args.engine,args.workers,reference)
+                m.assembleRates(fipsIntList,args.speedBinSize)
+                name = f'movesRates_{year}-{month}_{"-".join(fipsStrList)}'
+                if args.partitioned:
+                    directory = os.path.join(args.partitioned,
+                                             f'year={year}',
+                                             f'month={month}')
+                    os.makedirs(directory,exist_ok = True)
+                    name = os.path.join(directory,name)
+                path = f'{name}.{args.outputFormat}'
+                with stage('outputRates'):
+                    m.outputRates(path,args.layout)
+                count('scenarios')
+            log.info(f'Wrote {path} in '
+                     f'{round(time.perf_counter() - scenarioStart,2)} s')
+
+log.info(f'Processed {len(years)*len(months)} scenarios '
+         f'in {round(time.perf_counter() - start,2)} s')
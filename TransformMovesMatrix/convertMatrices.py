@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+'''script to convert the MOVES matrix CSVs of every region/year
+directory of movesRoot into the memory mapped matrix store that the
+transformer reads instead of the CSVs'''
+
+import os
+import sys
+from argparse import ArgumentParser
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..','common'))
+import instrument
+from instrument import log,stage,count,progress
+from matrixCatalog import matrixName
+from matrixStore import MatrixStore
+
+parser = ArgumentParser()
+parser.add_argument('movesRoot',
+                    help = 'directory where MOVES matrix rates reside')
+parser.add_argument('--regions',
+                    help = 'comma separated list of fuel/IM regions to '
+                    'convert, e.g. f10i0; all by default')
+parser.add_argument('--years',
+                    help = 'comma separated list of years to convert; all '
+                    'by default')
+parser.add_argument('--removeCSV',action = 'store_true',
+                    help = 'delete the matrix CSVs once they are converted')
+instrument.addArguments(parser)
+
+args = parser.parse_args()
+instrument.configure(args)
+
+# the region/year directories with matrices
+directories = []
+for region in sorted(os.listdir(args.movesRoot)):
+    if args.regions and region not in args.regions.split(','): continue
+    regionDir = os.path.join(args.movesRoot,region)
+    if not os.path.isdir(regionDir): continue
+    for year in sorted(os.listdir(regionDir)):
+        if not year.isdigit(): continue
+        if args.years and year not in args.years.split(','): continue
+        directory = os.path.join(regionDir,year)
+        names = sorted(name for name in os.listdir(directory)
+                       if matrixName.match(name))
+        if names: directories.append((directory,names))
+
+with stage('convertMatrices'):
+    for idx,(directory,names) in enumerate(directories):
+        with stage('convertDirectory'):
+            numRows = MatrixStore.convert(directory,names)
+        count('matrices',len(names))
+        count('rows',numRows)
+        log.info(f'Converted {len(names)} matrices with {numRows} rows '
+                 f'in {directory}')
+        if args.removeCSV:
+            for name in names:
+                os.remove(os.path.join(directory,name))
+        progress('Converted directory',idx + 1,len(directories))
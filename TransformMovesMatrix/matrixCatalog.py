@@ -0,0 +1,106 @@
+'''the MatrixCatalog class indexes the MOVES matrix files available
+under movesRoot/<region>/<year>/ by (region,year,month) so that the
+matrix for the nearest available temperature and humidity is found
+without probing the filesystem'''
+
+import os
+import re
+import json
+from matrixStore import MatrixStore
+
+# the file names of the matrices are {month}_{T}_{H}.csv
+matrixName = re.compile(r'^(\d+)_(-?\d+)_(-?\d+)\.csv$')
+
+class MatrixCatalog(object):
+    policies = ['upward','nearest']
+
+    def __init__(self,movesRoot,index = None):
+        self.root = movesRoot
+        # keys are (region,year,month), values are sets of (T,H)
+        self.index = {} if index is None else index
+        # the region/year directories already scanned
+        self.scanned = set((region,year) for region,year,_ in self.index)
+
+    def scanDirectory(self,region,year):
+        # add the matrices of movesRoot/region/year to the index
+        self.scanned.add((region,year))
+        directory = os.path.join(self.root,region,str(year))
+        try:
+            with os.scandir(directory) as entries:
+                names = [entry.name for entry in entries]
+        except OSError:
+            return
+        # the converted matrices may be kept without their CSVs
+        store = MatrixStore.open(directory)
+        if store is not None: names.extend(store.matrices)
+        for name in names:
+            match = matrixName.match(name)
+            if match is None: continue
+            month,T,H = map(int,match.groups())
+            self.index.setdefault((region,year,month),set()).add((T,H))
+
+    @classmethod
+    def scan(cls,movesRoot):
+        # index every region/year directory under movesRoot
+        catalog = cls(movesRoot)
+        for region in sorted(os.listdir(movesRoot)):
+            regionDir = os.path.join(movesRoot,region)
+            if not os.path.isdir(regionDir): continue
+            for year in sorted(os.listdir(regionDir)):
+                if year.isdigit():
+                    catalog.scanDirectory(region,int(year))
+        return catalog
+
+    def save(self,path):
+        manifest = {}
+        for (region,year,month),keys in sorted(self.index.items()):
+            manifest.setdefault(f'{region}/{year}',[]).extend(
+                [month,T,H] for T,H in sorted(keys)
+            )
+        with open(path,'w') as f:
+            json.dump({'matrices':manifest},f)
+
+    @classmethod
+    def load(cls,movesRoot,path):
+        with open(path) as f:
+            manifest = json.load(f)['matrices']
+        index = {}
+        for directory,keys in manifest.items():
+            region,year = directory.rsplit('/',1)
+            for month,T,H in keys:
+                index.setdefault((region,int(year),month),set()).add((T,H))
+        # the directories missing from the manifest are scanned on
+        # demand
+        return cls(movesRoot,index)
+
+    def path(self,region,year,month,T,H):
+        return os.path.join(self.root,region,str(year),f'{month}_{T}_{H}.csv')
+
+    def available(self,region,year,month):
+        if (region,year) not in self.scanned:
+            self.scanDirectory(region,year)
+        return self.index.get((region,year,month),set())
+
+    def discard(self,region,year,month,T,H):
+        # remove a matrix that is listed but could not be read
+        self.index.get((region,year,month),set()).discard((T,H))
+
+    def find(self,region,year,month,T,H,policy = 'upward'):
+        # the (T,H) of the matrix to use for the requested (T,H) or
+        # None if there is no matrix
+        keys = self.available(region,year,month)
+        if (T,H) in keys: return T,H
+        if not keys: return None
+        if policy == 'nearest':
+            # the smallest distance in the (T,H) plane, ties go to the
+            # warmer and then the more humid matrix
+            return min(keys,key = lambda k: (
+                (k[0] - T)**2 + (k[1] - H)**2,-k[0],-k[1]
+            ))
+        # upward: the legacy search that steps H by 5 up to 100 and
+        # then T by 5 up to 110 starting again from the original H
+        for candidateT in range(T,max(T,110) + 1,5):
+            for candidateH in range(H,max(H,100) + 1,5):
+                if (candidateT,candidateH) in keys:
+                    return candidateT,candidateH
+        return None
@@ -0,0 +1,140 @@
+'''the MatrixStore class keeps the MOVES matrices of a region/year
+directory as memory mapped .npy columns with narrow integer ID types
+and a JSON index of the rows of every {month}_{T}_{H}.csv matrix, so
+that loading a matrix is a slice of the columns instead of a CSV
+parse'''
+
+import os
+import io
+import sys
+import json
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+import pandas as pd
+from smart_open import open
+
+home = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(home,'..','common'))
+from tableIO import keyTypes
+
+# the columns of the raw matrices
+columns = ['opModeID','pollutantID','sourceTypeID','modelYearID','emRate']
+
+def readMatrix(matrixBytes):
+    # parse the raw headerless matrix CSV
+    rates = pd.read_csv(io.BytesIO(matrixBytes),header = None)
+    rates = rates.iloc[:,:5]
+    rates.columns = columns
+    return rates
+
+
+class MatrixStore(object):
+    version = 1
+    # the store of movesRoot/<region>/<year>/ is in this subdirectory
+    name = 'matrixStore'
+    dtypes = dict([(column,np.dtype(keyTypes[column]))
+                   for column in columns[:-1]] +
+                  [('emRate',np.dtype(np.float64))])
+    # the stores opened by this process keyed by the matrix directory,
+    # None for the directories without one
+    opened = {}
+
+    def __init__(self,path):
+        with open(os.path.join(path,'index.json')) as f:
+            index = json.load(f)
+        if index['version'] != self.version:
+            raise ValueError(f'{path} has version {index["version"]}')
+        # keys are the matrix file names, values are [start,stop,digest]
+        self.matrices = index['matrices']
+        self.columns = dict(
+            (column,np.load(os.path.join(path,column + '.npy'),
+                            mmap_mode = 'r'))
+            for column in columns
+        )
+
+    @classmethod
+    def open(cls,directory):
+        # the store of the matrix directory or None
+        if directory not in cls.opened:
+            path = os.path.join(directory,cls.name)
+            store = None
+            if os.path.exists(os.path.join(path,'index.json')):
+                store = cls(path)
+            cls.opened[directory] = store
+        return cls.opened[directory]
+
+    def __contains__(self,matrixName):
+        return matrixName in self.matrices
+
+    def digest(self,matrixName):
+        # the sha256 digest of the raw CSV the matrix was converted from
+        return bytes.fromhex(self.matrices[matrixName][2])
+
+    def read(self,matrixName):
+        # the matrix with the dtypes of a parsed CSV
+        start,stop,_ = self.matrices[matrixName]
+        return pd.DataFrame(dict(
+            (column,values[start:stop].astype(
+                np.float64 if column == 'emRate' else np.int64
+            ))
+            for column,values in self.columns.items()
+        ))
+
+    @classmethod
+    def convert(cls,directory,matrixNames):
+        # write the store of the matrices of the directory; the columns
+        # are appended matrix by matrix to raw files that become the
+        # .npy columns once the number of rows is known
+        tmp = tempfile.mkdtemp(prefix = 'tmp',dir = directory)
+        try:
+            raw = dict((column,open(os.path.join(tmp,column + '.bin'),'wb'))
+                       for column in columns)
+            matrices = {}
+            numRows = 0
+            for matrixName in matrixNames:
+                with open(os.path.join(directory,matrixName),'rb') as f:
+                    matrixBytes = f.read()
+                rates = readMatrix(matrixBytes)
+                for column,dtype in cls.dtypes.items():
+                    values = rates[column].values
+                    if dtype.kind == 'i':
+                        info = np.iinfo(dtype)
+                        if values.dtype.kind != 'i' or len(values) and (
+                           values.min() < info.min or
+                           values.max() > info.max):
+                            raise ValueError(
+                                f'{column} of {matrixName} does not fit '
+                                f'into {dtype}'
+                            )
+                    raw[column].write(values.astype(dtype).tobytes())
+                matrices[matrixName] = [
+                    numRows,numRows + len(rates),
+                    hashlib.sha256(matrixBytes).hexdigest()
+                ]
+                numRows += len(rates)
+            for column,dtype in cls.dtypes.items():
+                raw[column].close()
+                binPath = os.path.join(tmp,column + '.bin')
+                with open(os.path.join(tmp,column + '.npy'),'wb') as out:
+                    np.lib.format.write_array_header_1_0(out,{
+                        'descr':np.lib.format.dtype_to_descr(dtype),
+                        'fortran_order':False,'shape':(numRows,)
+                    })
+                    with open(binPath,'rb') as f:
+                        shutil.copyfileobj(f,out)
+                os.remove(binPath)
+            with open(os.path.join(tmp,'index.json'),'w') as f:
+                json.dump({'version':cls.version,'matrices':matrices},f)
+
+            # replace the old store; mkdtemp makes the directory private
+            os.chmod(tmp,0o755)
+            path = os.path.join(directory,cls.name)
+            if os.path.exists(path): shutil.rmtree(path)
+            os.replace(tmp,path)
+        except BaseException:
+            shutil.rmtree(tmp,ignore_errors = True)
+            raise
+        cls.opened.pop(directory,None)
+        return numRows
@@ -2,176 +2,473 @@
 method for getting the per distance rate given the fips,
 time of day,group of sourceTypes,and speed'''
 
+import numpy as np
 import pandas as pd
 import geopandas as gpd
 import os
+import sys
+import hashlib
+import multiprocessing as mp
 from smart_open import open
 
+home = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(home,'..','common'))
+from tableIO import writeTable
+from instrument import log,stage,count,progress
+from matrixCatalog import MatrixCatalog
+from rateCache import RateCache,frameHash
+from matrixStore import MatrixStore,readMatrix
+
 monthMap = {1:1,2:1,3:1,4:4,5:7,6:7,7:7,8:7,9:7,10:4,11:1,12:1}
 
 def round5(x):
     return 5*round(x*0.2)
 
+
+def speedBin(speed,speedBinSize):
+    return 1 + int((speed - 0.000001)/speedBinSize)
+
+
+def factorize(values):
+    # the sorted labels and the codes of the values
+    return np.unique(values,return_inverse = True)
+
+
+def denseSum(codes,shape,weights = None):
+    # the dense array of the sums of the weights (or of the counts)
+    # of the rows with the given codes along every axis
+    return np.bincount(
+        np.ravel_multi_index(codes,shape),weights = weights,
+        minlength = int(np.prod(shape))
+    ).reshape(shape)
+
+
+def tensorTransform(rates,ages,opmode,speedBinSize):
+    # the age and opmode reductions of MOVES.transformMatrix as tensor
+    # contractions over the factorized opMode (o), pollutant (p),
+    # sourceType (s), modelYear (m), speed (v) and roadType (r) axes;
+    # the existence masks keep exactly the combinations that survive
+    # the inner merges and NaN rates count as 0 as in the groupby sums
+    opModes,o = factorize(rates.opModeID.values)
+    pollutants,p = factorize(rates.pollutantID.values)
+    sourceTypes,s = factorize(rates.sourceTypeID.values)
+    modelYears,m = factorize(rates.modelYearID.values)
+    shape = (len(opModes),len(pollutants),len(sourceTypes),len(modelYears))
+    emRate = denseSum((o,p,s,m),shape,np.nan_to_num(rates.emRate.values))
+    hasRate = denseSum((o,p,s,m),shape) > 0
+
+    # the age fractions of the source types and model years of the
+    # matrix
+    sa = pd.Index(sourceTypes).get_indexer(ages.sourceTypeID.values)
+    ma = pd.Index(modelYears).get_indexer(ages.modelYearID.values)
+    keep = (sa >= 0) & (ma >= 0)
+    shape = (len(sourceTypes),len(modelYears))
+    ageFraction = denseSum((sa[keep],ma[keep]),shape,
+                           np.nan_to_num(ages.ageFraction.values[keep]))
+    hasAge = denseSum((sa[keep],ma[keep]),shape) > 0
+
+    # the opmode fractions of the opmodes and source types of the
+    # matrix
+    oo = pd.Index(opModes).get_indexer(opmode.opModeID.values)
+    so = pd.Index(sourceTypes).get_indexer(opmode.sourceTypeID.values)
+    keep = (oo >= 0) & (so >= 0)
+    speeds,v = factorize(opmode.linkAvgSpeed.values[keep])
+    roadTypes,r = factorize(opmode.roadTypeID.values[keep])
+    shape = (len(opModes),len(sourceTypes),len(speeds),len(roadTypes))
+    opModeFraction = denseSum(
+        (oo[keep],so[keep],v,r),shape,
+        np.nan_to_num(opmode.opModeFraction.values[keep])
+    )
+    hasOpMode = denseSum((oo[keep],so[keep],v,r),shape) > 0
+
+    # average over the ages and then over the opmodes
+    rateAge = np.einsum('opsm,sm->ops',emRate,ageFraction)
+    hasRateAge = np.einsum('opsm,sm->ops',hasRate.astype(float),
+                           hasAge.astype(float)) > 0
+    rateOp = np.einsum('ops,osvr->vspr',rateAge,opModeFraction)
+    hasRateOp = np.einsum('ops,osvr->vspr',hasRateAge.astype(float),
+                          hasOpMode.astype(float)) > 0
+
+    # the mean per distance rate of the speeds in every speed bin
+    perDistance = np.where(
+        hasRateOp,rateOp/speeds[:,np.newaxis,np.newaxis,np.newaxis],0.
+    )
+    bins,b = factorize([speedBin(x,speedBinSize) for x in speeds])
+    inBin = np.zeros((len(speeds),len(bins)))
+    inBin[np.arange(len(speeds)),b] = 1.
+    total = np.einsum('vspr,vb->sprb',perDistance,inBin)
+    numSpeeds = np.einsum('vspr,vb->sprb',hasRateOp.astype(float),inBin)
+    s,p,r,b = np.nonzero(numSpeeds)
+    return pd.DataFrame({
+        'sourceTypeID':sourceTypes[s],
+        'pollutantID':pollutants[p],
+        'roadTypeID':roadTypes[r],
+        'avgSpeedBinID':bins[b],
+        'ratePerDistance':total[s,p,r,b]/numSpeeds[s,p,r,b]
+    })
+
+def pandasTransform(rates,ages,opmode,speedBinSize):
+    # compute the perDistance rates
+    # merge ages into rates and average over the ages
+    rates = rates.merge(ages,on = ['modelYearID','sourceTypeID'])
+    rates['rateAge'] = rates.emRate*rates.ageFraction
+    rates = rates.groupby(
+        ['opModeID','pollutantID','sourceTypeID']
+    ).rateAge.sum().reset_index()
+
+    # merge opModeDist and averge over the opModes
+    rates = rates.merge(opmode,on = ['opModeID','sourceTypeID'])
+    rates['rateOp'] = rates.rateAge*rates.opModeFraction
+    rates = rates.groupby(
+        ['linkAvgSpeed','sourceTypeID','pollutantID','roadTypeID']
+    ).rateOp.sum().reset_index()
+
+    # compute the rate perdistance
+    rates['ratePerDistance'] = rates.rateOp/rates.linkAvgSpeed
+
+    # average the rates into speedBins
+    rates['avgSpeedBinID'] = rates.linkAvgSpeed.apply(
+        lambda x: speedBin(x,speedBinSize)
+    )
+    return rates.groupby(
+        ['sourceTypeID','pollutantID',
+         'roadTypeID','avgSpeedBinID']
+    ).ratePerDistance.mean().reset_index()
+
+
+transforms = {'pandas':pandasTransform,'tensor':tensorTransform}
+
+def openMatrix(path):
+    # the digest of the raw matrix and a function that returns its
+    # rates; the matrix is read from the store of its directory when
+    # it has been converted and from the CSV otherwise
+    directory,matrixName = os.path.split(path)
+    store = MatrixStore.open(directory)
+    if store is not None and matrixName in store:
+        return store.digest(matrixName),lambda: store.read(matrixName)
+    with open(path,'rb') as f:
+        matrixBytes = f.read()
+    return (hashlib.sha256(matrixBytes).digest(),
+            lambda: readMatrix(matrixBytes))
+
+
+def loadMatrix(path,ages,opmode,speedBinSize,engine,cache = None,
+               opmodeHash = None):
+    # read and transform the matrix at path; returns the rates and
+    # whether they came from the cache or None if the file cannot be
+    # read
+    try:
+        log.debug(f'Reading {path}')
+        with stage('readMatrix'):
+            digest,read = openMatrix(path)
+    except OSError:
+        return None
+
+    # reuse the rates transformed by an earlier run
+    if cache is not None:
+        with stage('cacheLookup'):
+            cacheKey = cache.key(digest,ages,opmodeHash,speedBinSize,engine)
+            rates = cache.get(cacheKey)
+        if rates is not None: return rates,True
+
+    with stage('parseMatrix'):
+        rates = read()
+    with stage('transformMatrix'):
+        rates = transforms[engine](rates,ages,opmode,speedBinSize)
+    if cache is not None:
+        with stage('cacheStore'):
+            cache.put(cacheKey,rates)
+    return rates,False
+
+
+# the tables shared with the workers of the matrix pool
+shared = {}
+
+def initWorker(opmode,speedBinSize,engine,cache,opmodeHash):
+    shared['opmode'] = opmode
+    shared['speedBinSize'] = speedBinSize
+    shared['engine'] = engine
+    shared['cache'] = cache
+    shared['opmodeHash'] = opmodeHash
+
+
+def loadShared(task):
+    # load the matrix of a (path,ages) task in a worker
+    path,ages = task
+    return loadMatrix(path,ages,shared['opmode'],shared['speedBinSize'],
+                      shared['engine'],shared['cache'],shared['opmodeHash'])
+
+def makeCatalog(movesRoot,matrixManifest = None):
+    # the index of the available matrices; the manifest is loaded if
+    # it exists and written otherwise
+    if matrixManifest is not None and os.path.exists(matrixManifest):
+        log.info(f'Loading the matrix manifest {matrixManifest}')
+        return MatrixCatalog.load(movesRoot,matrixManifest)
+    if matrixManifest is not None:
+        log.info(f'Writing the matrix manifest {matrixManifest}')
+        catalog = MatrixCatalog.scan(movesRoot)
+        catalog.save(matrixManifest)
+        return catalog
+    return MatrixCatalog(movesRoot)
+
+
+def loadReference(movesRoot):
+    # the tables that do not depend on the year and month
+    reference = {}
+    # load the age distribution
+    log.info('Loading the age distribution')
+    reference['ages'] = pd.read_csv(
+        os.path.join(movesRoot,'age_distribution.csv'),
+        dtype = {'countyID':pd.Int64Dtype()}
+    )
+
+    # load the meteo of all months
+    log.info('Loading the MOVES 20181022 meteorology')
+    reference['meteo'] = pd.read_csv(
+        os.path.join(movesRoot,'MOVES20181022_zoneMonthHour.csv')
+    )
+
+    # load the mapping from fips to fuel regions
+    log.info('Loading the map from FIPS to fuel and IM regions')
+    reference['coverage'] = pd.read_excel(
+        os.path.join(movesRoot,'moves_matrix_coverage_04-15-2020.xlsx'),
+        sheet_name = 'IM_fuel'
+    )
+
+    # load the opModeDist
+    log.info('Loading the default OpMode distribution')
+    reference['opmode'] = pd.read_csv(
+        os.path.join(movesRoot,'default_opmode_project.csv')
+    )
+    return reference
+
+
 class MOVES(object):
     columns = ['countyID','hourID','pollutantID',
                'processID','sourceTypeID','roadTypeID',
                'avgSpeedBinID','ratePerDistance']
+    matrixColumns = ['matrixKey','pollutantID','processID','sourceTypeID',
+                     'fuelTypeID','roadTypeID','avgSpeedBinID',
+                     'ratePerDistance']
     
-    def __init__(self,year,month,movesRoot):
+    def __init__(self,year,month,movesRoot,matrixSearch = 'upward',
+                 matrixManifest = None,cacheDir = None,
+                 cacheSize = 2**30,engine = 'pandas',workers = 1,
+                 reference = None):
         self.year = year
         self.month = month
         self.root = movesRoot
+        self.matrixSearch = matrixSearch
+        self.engine = engine
+        self.workers = workers
+        # the reference tables, the matrix catalog and the transformed
+        # matrices shared by the MOVES objects of a batch
+        if reference is None: reference = {}
+        self.reference = reference
 
-        # load the age distribution
-        print('Loading the age distribution')
-        self.ages = pd.read_csv(
-            os.path.join(self.root,'age_distribution.csv'),
-            dtype = {'countyID':pd.Int64Dtype()}
-        )
-        # add the required modelYearID column
-        self.ages['modelYearID'] = year - self.ages.ageID
-        
-        # load the meteo for the passed month
-        print('Loading the MOVES 20181022 meteorology')
-        self.meteo = pd.read_csv(
-            os.path.join(self.root,'MOVES20181022_zoneMonthHour.csv')
-        ).query(f'monthID == {month}')
-        
-        # load the mapping from fips to fuel regions
-        print('Loading the map from FIPS to fuel and IM regions')
-        self.coverage = pd.read_excel(
-            os.path.join(
-                self.root,'moves_matrix_coverage_04-15-2020.xlsx'
-            ),sheet_name = 'IM_fuel'
-        )
+        # index the available matrices once; the manifest is loaded if
+        # it exists and written otherwise
+        with stage('matrixCatalog'):
+            if 'catalog' not in reference:
+                reference['catalog'] = makeCatalog(movesRoot,matrixManifest)
+            self.catalog = reference['catalog']
+
+        with stage('loadDistributions'):
+            if 'ages' not in reference:
+                reference.update(loadReference(movesRoot))
+            # add the required modelYearID column
+            self.ages = reference['ages'].copy()
+            self.ages['modelYearID'] = year - self.ages.ageID
+            # the meteo for the passed month
+            self.meteo = reference['meteo'].query(f'monthID == {month}')
+            self.coverage = reference['coverage']
+            self.opmode = reference['opmode']
+
+        # the transformed matrices keyed by (path,fips) that other
+        # months of the year reuse through monthMap; the matrix paths
+        # and the model years depend on the year so the matrices of
+        # other years are dropped
+        if reference.get('year') != year:
+            reference['year'] = year
+            reference['transformed'] = {}
+        self.transformed = reference['transformed']
+
+        # the persistent cache of the transformed matrices
+        self.cache = None
+        self.opmodeHash = None
+        if cacheDir is not None:
+            self.cache = RateCache(cacheDir,cacheSize)
+            self.opmodeHash = frameHash(self.opmode)
         
-        # load the opModeDist
-        print('Loading the default OpMode distribution')
-        self.opmode = pd.read_csv(
-            os.path.join(self.root,'default_opmode_project.csv')
+        # the countyID,hourID to matrixKey index of the assembled rates
+        self.rateIndex = pd.DataFrame(
+            {'countyID':[],'hourID':[],'matrixKey':[]},dtype = 'int64'
         )
-        
-        # init the rates dataframe
-        self.rates = pd.DataFrame(columns = self.columns)
 
         # avoid reading MOVES matrices more than once, keys are
-        # (region,T,H)
+        # (region,T,H) and values are the matrixKeys, i.e. positions in
+        # matrixRates of the distinct transformed matrices
         self.matrices = {}
+        self.matrixRates = []
         self.meteoMap = {} # keys are (fips,hour) values (T,H)
         self.regionMap = {} # map from fips to fuel region
         
 
-    def loadRates(self,fips,speedBinSize):
-        fips = int(fips)
-        print('Loading rates for',fips,self.year,self.month)
-        # deterimine the fuel region
-        row = self.coverage.query(f'countyID == {fips}')
-        if len(row) == 0:
-            print('Could not get region for county',fips)
-            return None
-        row = row.squeeze()
-        region = f'f{row.fuelID}i{row.imID}'
-        self.regionMap[fips] = region
-
-        # for every hour load the rates and transform them using the
-        # opmode and age distribututions
-        # avoid reading the matrices more than once
-        for hour in range(1,25):
-            row = self.meteo.query(
-                f'zoneID=={fips*10}&monthID=={self.month}&hourID=={hour}'
-            ).squeeze()
-            T = round5(row.temperature)
-            H = round5(row.relHumidity)
-            movesMonth = monthMap[self.month]
-            self.meteoMap[(fips,hour)] = (T,H)
-
-            if (region,T,H) in self.matrices: continue
-
-            # implement the missing matrix logic
-            Horig = H
-            Torig = T
-            while True:
-                try:
-                    prefix = os.path.join(
-                        self.root,region,str(self.year)
+    def countyAges(self,fips):
+        # filter the ages on passed fips
+        ages = None
+        if 'countyID' in self.ages.columns:
+            ages = self.ages.query(f'countyID == {fips}')
+
+        if ages is None or len(ages) == 0:
+            ages = self.ages
+        return ages[['modelYearID','sourceTypeID','ageFraction']]
+
+
+    def planRates(self,fipsList):
+        # resolve every (fips,hour) to the (region,T,H) key of its
+        # matrix; returns the keys that are not loaded yet mapped to
+        # the first county that needs them and its ages
+        plan = {}
+        for fips in map(int,fipsList):
+            if fips in self.regionMap: continue
+            # deterimine the fuel region
+            row = self.coverage.query(f'countyID == {fips}')
+            if len(row) == 0:
+                log.error(f'Could not get region for county {fips}')
+                continue
+            row = row.squeeze()
+            region = f'f{row.fuelID}i{row.imID}'
+            self.regionMap[fips] = region
+            ages = self.countyAges(fips)
+
+            for hour in range(1,25):
+                row = self.meteo.query(
+                    f'zoneID=={fips*10}&monthID=={self.month}&'
+                    f'hourID=={hour}'
+                ).squeeze()
+                T = round5(row.temperature)
+                H = round5(row.relHumidity)
+                self.meteoMap[(fips,hour)] = (T,H)
+                key = (region,T,H)
+                if key not in self.matrices and key not in plan:
+                    plan[key] = (fips,ages)
+        count('matrixKeys',len(plan))
+        return plan
+
+
+    def loadMatrices(self,plan,speedBinSize):
+        # find the matrix file of every planned key in the catalog and
+        # load and transform every distinct (file,county) only once
+        movesMonth = monthMap[self.month]
+        # the rates keyed by (path,fips) so that the keys searched again
+        # after a failed read reuse the matrices already loaded
+        loaded = {}
+        pending = list(plan)
+        while pending:
+            jobs = {}
+            for key in pending:
+                region,T,H = key
+                with stage('matrixLookup'):
+                    found = self.catalog.find(
+                        region,self.year,movesMonth,T,H,self.matrixSearch
                     )
-                    path = os.path.join(
-                        prefix,f'{movesMonth}_{T}_{H}.csv'
+                if found is None:
+                    log.error(
+                        'Could not find the matrix for '
+                        f'region = {region} '
+                        f'T = {T} '
+                        f'H = {H}'
                     )
-                    print('For hour',hour,'read',path)
-                    rates = pd.read_csv(path,header = None)
-                    rates = rates.iloc[:,:5]
-                    rates.columns = [
-                        'opModeID','pollutantID','sourceTypeID',
-                        'modelYearID','emRate'
-                    ]
-                    break
-                except OSError as e:
-                    # print(e)
-                    if H < 100:
-                        H += 5
-                    else:
-                        H = Horig
-                        T += 5
-                        if T > 110:
-                            print(
-                                'Could not find the matrix for',
-                                'region =',region,
-                                'T =',Torig,
-                                'H =',Horig
-                            )
-                            return
-
-            # filter the ages on passed fips
-            ages = None
-            if 'countyID' in self.ages.columns:
-                ages = self.ages.query(f'countyID == {fips}')
-
-            if ages is None or len(ages) == 0:
-                ages = self.ages
-                
-            # compute the perDistance rates
-            # merge ages into rates and average over the ages
-            rates = rates.merge(
-                ages[['modelYearID','sourceTypeID','ageFraction']],
-                on = ['modelYearID','sourceTypeID']
-            )
-            rates['rateAge'] = rates.emRate*rates.ageFraction
-            rates = rates.groupby(
-                ['opModeID','pollutantID','sourceTypeID']
-            ).rateAge.sum().reset_index()
-
-            # merge opModeDist and averge over the opModes
-            rates = rates.merge(
-                self.opmode,on = ['opModeID','sourceTypeID']
-            )
-            rates['rateOp'] = rates.rateAge*rates.opModeFraction
-            rates = rates.groupby(
-                ['linkAvgSpeed','sourceTypeID','pollutantID','roadTypeID']
-            ).rateOp.sum().reset_index()
-            
-            # compute the rate perdistance
-            rates['ratePerDistance'] = rates.rateOp/rates.linkAvgSpeed
-
-            # average the rates into speedBins
-            rates['avgSpeedBinID'] = rates.linkAvgSpeed.apply(
-                lambda x: 1 + int((x - 0.000001)/speedBinSize)
-            )
-            rates = rates.groupby(
-                ['sourceTypeID','pollutantID',
-                 'roadTypeID','avgSpeedBinID']
-            ).ratePerDistance.mean().reset_index()
-
-            # save the rates
-            self.matrices[(region,Torig,Horig)] = rates
+                    continue
+                path = self.catalog.path(region,self.year,movesMonth,*found)
+                job = (path,plan[key][0])
+                if job not in loaded and job in self.transformed:
+                    # transformed for another month of the batch
+                    count('sharedMatrices')
+                    loaded[job] = len(self.matrixRates)
+                    self.matrixRates.append(self.transformed[job])
+                if job in loaded:
+                    self.matrices[key] = loaded[job]
+                    if found != (T,H): count('matrixFallbacks')
+                    continue
+                jobs.setdefault(job,[]).append((key,found))
+
+            tasks = [(path,plan[keys[0][0]][1])
+                     for (path,_),keys in jobs.items()]
+            results = self.runTasks(tasks,speedBinSize)
+
+            # merge in the order of the plan
+            pending = []
+            for (job,keys),result in zip(jobs.items(),results):
+                if result is None:
+                    # the manifest is stale, search again without the
+                    # matrix
+                    count('failedOpens')
+                    (region,_,_),found = keys[0]
+                    self.catalog.discard(region,self.year,movesMonth,*found)
+                    pending.extend(key for key,_ in keys)
+                    continue
+                rates,hit = result
+                if hit: count('cacheHits')
+                count('matricesLoaded')
+                loaded[job] = len(self.matrixRates)
+                self.matrixRates.append(rates)
+                self.transformed[job] = rates
+                for key,found in keys:
+                    if found != key[1:]: count('matrixFallbacks')
+                    self.matrices[key] = loaded[job]
+
+
+    def runTasks(self,tasks,speedBinSize):
+        # load the (path,ages) tasks in the order given, in a process
+        # pool when there is more than one worker
+        results = []
+        if self.workers <= 1 or len(tasks) <= 1:
+            for idx,(path,ages) in enumerate(tasks):
+                results.append(loadMatrix(
+                    path,ages,self.opmode,speedBinSize,self.engine,
+                    self.cache,self.opmodeHash
+                ))
+                progress('Loaded matrix',idx + 1,len(tasks))
+            return results
+
+        with mp.Pool(min(self.workers,len(tasks)),initializer = initWorker,
+                     initargs = (self.opmode,speedBinSize,self.engine,
+                                 self.cache,self.opmodeHash)) as pool:
+            for idx,result in enumerate(pool.imap(loadShared,tasks)):
+                results.append(result)
+                progress('Loaded matrix',idx + 1,len(tasks))
+        return results
+
+
+    def loadRates(self,fips,speedBinSize):
+        log.info(f'Loading rates for {fips} {self.year} {self.month}')
+        self.loadMatrices(self.planRates([fips]),speedBinSize)
+
+
+    def transformMatrix(self,rates,ages,speedBinSize):
+        return transforms[self.engine](rates,ages,self.opmode,speedBinSize)
 
 
     def assembleRates(self,fipsList,speedBinSize = 5):
+        # resolve the matrices of all of the counties and hours first
+        # so that every distinct matrix is loaded once
+        log.info(f'Loading rates for {len(fipsList)} counties '
+                 f'{self.year} {self.month}')
+        with stage('planRates'):
+            plan = self.planRates(fipsList)
+        with stage('loadMatrices'):
+            self.loadMatrices(plan,speedBinSize)
+
+        # index the matrix of every county and hour
+        rows = []
         for fips in fipsList:
             for hourID in range(1,25):
                 # get T,H for this hour
                 if (fips,hourID) not in self.meteoMap:
-                    self.loadRates(fips,speedBinSize)
+                    log.error(f'Missing rates for county {fips}')
+                    return None
 
                 T,H = self.meteoMap[(fips,hourID)]
 
@@ -180,21 +477,60 @@ class MOVES(object):
 
                 # make sure we have the rates
                 if (region,T,H) not in self.matrices:
-                    print('Missing rates for',region,T,H)
+                    log.error(f'Missing rates for {region} {T} {H}')
                     return None
 
-                rates = self.matrices[(region,T,H)].copy()
-                rates['countyID'] = fips
-                rates['hourID'] = hourID
-                rates['processID'] = 1
-
-                # concat
-                self.rates = pd.concat((self.rates,rates))
-                     
-
-    def outputRates(self,path):
-        # add the dummy fuelTypeID column
-        self.rates['fuelTypeID'] = 0
-        # add the yearID column
-        self.rates['yearID'] = self.year
-        self.rates.to_csv(open(path,'w'),index = False)
+                rows.append((fips,hourID,self.matrices[(region,T,H)]))
+        self.rateIndex = pd.concat((
+            self.rateIndex,
+            pd.DataFrame(rows,columns = ['countyID','hourID','matrixKey'])
+        ),ignore_index = True)
+        count('countyHours',len(rows))
+
+
+    def matrixTable(self):
+        # the distinct transformed matrices with their matrixKey
+        tables = [rates.assign(matrixKey = matrixKey,processID = 1,
+                               fuelTypeID = 0)
+                  for matrixKey,rates in enumerate(self.matrixRates)]
+        if not tables:
+            return pd.DataFrame(columns = self.matrixColumns)
+        return pd.concat(tables,ignore_index = True)[self.matrixColumns]
+
+
+    def wideRates(self):
+        # the legacy long table with the rates of every county and hour,
+        # gathered from the distinct matrices in a single take
+        matrices = self.matrixTable()
+        sizes = np.array([len(rates) for rates in self.matrixRates],
+                         dtype = np.int64)
+        starts = np.cumsum(sizes) - sizes
+        keys = self.rateIndex.matrixKey.values
+        positions = np.concatenate([np.zeros(0,dtype = np.int64)] + [
+            np.arange(starts[key],starts[key] + sizes[key]) for key in keys
+        ])
+        rates = matrices.iloc[positions].reset_index(drop = True)
+        rates['countyID'] = np.repeat(self.rateIndex.countyID.values,
+                                      sizes[keys])
+        rates['hourID'] = np.repeat(self.rateIndex.hourID.values,sizes[keys])
+        return rates[self.columns]
+
+
+    def outputRates(self,path,layout = 'wide'):
+        # the format is CSV, Parquet or Arrow IPC depending on the
+        # extension of the path
+        if layout == 'wide':
+            rates = self.wideRates()
+            # add the dummy fuelTypeID column
+            rates['fuelTypeID'] = 0
+            # add the yearID column
+            rates['yearID'] = self.year
+            writeTable(rates,path)
+            return
+
+        # normalized: the distinct matrices once and the index of the
+        # matrix of every county and hour next to them
+        stem,ext = os.path.splitext(path)
+        writeTable(self.matrixTable(),f'{stem}_matrices{ext}')
+        writeTable(self.rateIndex.assign(yearID = self.year),
+                   f'{stem}_index{ext}')
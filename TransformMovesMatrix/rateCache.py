@@ -0,0 +1,102 @@
+'''the RateCache class keeps the transformed speed binned rate tables
+on disk as Arrow IPC files named by the content hash of the inputs of
+the transform, evicting the least recently used tables when the cache
+grows beyond its size cap'''
+
+import os
+import sys
+import hashlib
+import tempfile
+import pandas as pd
+
+home = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(home,'..','common'))
+from tableIO import readTable,writeTable
+
+def frameHash(df):
+    # content hash of a dataframe that does not depend on its index
+    return hashlib.sha256(
+        pd.util.hash_pandas_object(df,index = False).values.tobytes()
+    ).hexdigest()
+
+
+class RateCache(object):
+    # bump when the transform changes so that stale tables are missed
+    version = 1
+    suffix = '.arrow'
+
+    def __init__(self,directory,maxBytes = 2**30):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        os.makedirs(directory,exist_ok = True)
+        # the cap may be smaller than in the run that filled the cache
+        self.evict()
+
+    def key(self,matrixDigest,ages,opmodeHash,speedBinSize,engine):
+        # the hash of the sha256 digest of the raw matrix file, the age
+        # fractions of the county, the opmode distribution, the speed
+        # bin size and the transform engine whose rounding the rates
+        # carry
+        digest = hashlib.sha256()
+        digest.update(f'v{self.version} {speedBinSize} {engine} '.encode())
+        digest.update(matrixDigest)
+        digest.update(frameHash(ages).encode())
+        digest.update(opmodeHash.encode())
+        return digest.hexdigest()
+
+    def path(self,key):
+        return os.path.join(self.directory,key + self.suffix)
+
+    def get(self,key):
+        # the cached table or None; a hit makes the table the most
+        # recently used
+        path = self.path(key)
+        try:
+            rates = readTable(path)
+            os.utime(path)
+        except (OSError,ValueError):
+            return None
+        # restore the int64 keys of the transform
+        return rates.astype({
+            column:'int64' for column in rates.columns
+            if column != 'ratePerDistance'
+        })
+
+    def put(self,key,rates):
+        # write to a temporary file first so that concurrent runs never
+        # read a partial table
+        fd,tmpPath = tempfile.mkstemp(prefix = 'tmp',suffix = self.suffix,
+                                      dir = self.directory)
+        os.close(fd)
+        try:
+            writeTable(rates,tmpPath)
+            os.replace(tmpPath,self.path(key))
+        except BaseException:
+            os.remove(tmpPath)
+            raise
+        self.evict()
+
+    def evict(self):
+        # remove the least recently used tables until the cache fits
+        # into maxBytes
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                # skip the tables that are being written
+                if not entry.name.endswith(self.suffix) or \
+                   entry.name.startswith('tmp'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    # evicted by a concurrent run
+                    continue
+                entries.append((stat.st_mtime,stat.st_size,entry.path))
+        total = sum(size for _,size,_ in entries)
+        for _,size,path in sorted(entries):
+            if total <= self.maxBytes: break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
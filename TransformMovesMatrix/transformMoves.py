@@ -3,7 +3,14 @@
 '''script to transform the MOVES rates into the per-distance rates
 binned by 5 mph velocity bins without the fuelID column'''
 
+import os
+import sys
 from argparse import ArgumentParser
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..','common'))
+import instrument
+from instrument import stage
+
 parser = ArgumentParser()
 parser.add_argument('fipsList',
                     help = 'comma separated list of counties')
@@ -14,14 +21,53 @@ parser.add_argument('movesRoot',
                     help = 'directory where MOVES matrix rates reside')
 parser.add_argument('--speedBinSize',default = 5,type = int,
                     help = 'speed bin size for aggregation in mph')
+parser.add_argument('--outputFormat',default = 'csv',
+                    choices = ['csv','parquet','arrow'],
+                    help = 'parquet and arrow store the ID columns as '
+                    'narrow integers')
+parser.add_argument('--layout',default = 'wide',
+                    choices = ['wide','normalized'],
+                    help = 'write the rates of every county and hour '
+                    '(legacy) or the distinct matrices and a countyID,'
+                    'hourID to matrixKey index')
+parser.add_argument('--matrixSearch',default = 'upward',
+                    choices = ['upward','nearest'],
+                    help = 'how to pick the matrix when the one for the '
+                    'hour temperature and humidity is missing: step the '
+                    'humidity and then the temperature up (legacy) or '
+                    'take the nearest available one')
+parser.add_argument('--matrixManifest',
+                    help = 'JSON index of the available matrices; it is '
+                    'loaded if it exists and written otherwise')
+parser.add_argument('--cacheDir',
+                    help = 'directory of the persistent cache of the '
+                    'transformed matrices')
+parser.add_argument('--cacheSizeMB',type = float,default = 1024,
+                    help = 'size cap of the cache, the least recently '
+                    'used matrices are evicted beyond it')
+parser.add_argument('--engine',default = 'pandas',
+                    choices = ['pandas','tensor'],
+                    help = 'transform the matrices with merges and '
+                    'groupbys or with tensor contractions')
+parser.add_argument('--workers',type = int,default = 1,
+                    help = 'number of processes that load and transform '
+                    'the distinct matrices')
+instrument.addArguments(parser)
 
 args = parser.parse_args()
+instrument.configure(args)
 fipsStrList = args.fipsList.split(',')
 fipsIntList = list(map(int,fipsStrList))
 
 import moves
 
-m = moves.MOVES(args.year,args.month,args.movesRoot)
-m.assembleRates(fipsIntList,args.speedBinSize)
-path = f'movesRates_{args.year}-{args.month}_{"-".join(fipsStrList)}.csv'
-m.outputRates(path)
+with stage('transformMoves'):
+    m = moves.MOVES(args.year,args.month,args.movesRoot,
+                    args.matrixSearch,args.matrixManifest,
+                    args.cacheDir,int(args.cacheSizeMB*2**20),
+                    args.engine,args.workers)
+    m.assembleRates(fipsIntList,args.speedBinSize)
+    path = f'movesRates_{args.year}-{args.month}_{"-".join(fipsStrList)}'
+    path += f'.{args.outputFormat}'
+    with stage('outputRates'):
+        m.outputRates(path,args.layout)
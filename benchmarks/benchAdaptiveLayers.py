@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+'''benchmark the flux adaptive receptor layers of
+AERMOD/aermodInput.py against all receptor layers on a synthetic
+network: the receptor counts, which AERMOD runtime scales with, and
+the concentration error of AERMOD/compareLayers.py with the
+concentrations of a near road decay model standing in for AERMOD'''
+
+import os
+import sys
+import json
+import time
+import tempfile
+from argparse import ArgumentParser
+
+home = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(home)
+sys.path.append(os.path.join(home,'..','AERMOD'))
+import numpy as np
+import pandas as pd
+import synthetic
+from shapely import STRtree,distance
+from aermodConst import receptorLayerThresholds
+from aermodInput import AermodScenario
+from compareLayers import compareLayers
+
+parser = ArgumentParser()
+parser.add_argument('--numLinks',type = int,default = 2000)
+parser.add_argument('--layerThresholds',nargs = '+',type = float,
+                    default = receptorLayerThresholds)
+parser.add_argument('--decay',type = float,default = 100.,
+                    help = 'distance in meters over which the surrogate '
+                    'concentrations of a source decay by 1/e')
+parser.add_argument('--output',help = 'optional path of the JSON results')
+args = parser.parse_args()
+
+def surrogateConc(sources,receptors,cutoff):
+    # the sum over the sources within cutoff of the flux times the
+    # area of the source decaying exponentially with the distance from
+    # its edge
+    tree = STRtree(sources.geometry.values)
+    locations = np.asarray(receptors.geometry)
+    receptorIdx,sourceIdx = tree.query(locations,predicate = 'dwithin',
+                                       distance = cutoff)
+    width = sources.width.values[sourceIdx]
+    edge = np.maximum(distance(locations[receptorIdx],
+                               sources.geometry.values[sourceIdx]) -
+                      0.5*width,0.)
+    emission = sources.flux.values[sourceIdx]*width*\
+        sources.geometry.length.values[sourceIdx]
+    return pd.DataFrame({
+        'receptorID':receptors.receptorID.values,
+        'concentrat':np.bincount(receptorIdx,
+                                 emission*np.exp(-edge/args.decay),
+                                 minlength = len(receptors))
+    })
+
+
+with tempfile.TemporaryDirectory() as tmp:
+    shapes = synthetic.makeLinkShapes(args.numLinks)
+    shapes.to_file(os.path.join(tmp,'links.shp'))
+    synthetic.makeEmissions(shapes).to_csv(
+        os.path.join(tmp,'emissions.csv'),index = False
+    )
+    scenario = AermodScenario(None,12)
+    scenario.getLinkGeometries(os.path.join(tmp,'links.shp'))
+    scenario.constructNetwork()
+    scenario.mergeEmissionRate(os.path.join(tmp,'emissions.csv'))
+    scenario.makeSources()
+
+seconds = {}
+receptors = {}
+for name,makeReceptors in [
+        ('full',scenario.makeLinkReceptors),
+        ('adaptive',lambda: scenario.makeSourceReceptors(args.layerThresholds))
+]:
+    start = time.perf_counter()
+    makeReceptors()
+    scenario.makeGridReceptors()
+    scenario.dropReceptorsInSources()
+    seconds[name] = time.perf_counter() - start
+    receptors[name] = scenario.receptors
+
+start = time.perf_counter()
+fullConc = surrogateConc(scenario.lineSources,receptors['full'],
+                         10*args.decay)
+seconds['surrogateConc'] = time.perf_counter() - start
+adaptiveConc = fullConc[fullConc.receptorID.isin(
+    receptors['adaptive'].receptorID
+)]
+result = compareLayers(receptors['full'],fullConc,adaptiveConc)
+
+print(f'{len(scenario.lineSources)} sources, {result["fullReceptors"]} '
+      f'receptors with all layers, {result["adaptiveReceptors"]} adaptive, '
+      f'{100*result["receptorReduction"]:.1f}% fewer')
+print(f'dropped receptors: mean absolute error '
+      f'{result["droppedMeanAbsError"]:.4g}, maximum '
+      f'{result["droppedMaxAbsError"]:.4g}, relative '
+      f'{100*result["droppedRelativeError"]:.1f}%; mean concentration '
+      f'{result["estimatedMeanConc"]:.4g} instead of '
+      f'{result["fullMeanConc"]:.4g}')
+for name,value in seconds.items():
+    print(f'{name}: {value:.2f} s')
+
+if args.output:
+    with open(args.output,'w') as f:
+        json.dump(dict(result,numSources = len(scenario.lineSources),
+                       layerThresholds = args.layerThresholds,
+                       seconds = seconds),f,indent = 1)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+'''benchmark the decompression throughput of the block parallel bzip2
+reader (DynusTparser/parallelBz2.py) against single stream bz2 on the
+synthetic VehTrajectory.dat.bz2 or on a given bzip2 file'''
+
+import os
+import sys
+import bz2
+import json
+import time
+import hashlib
+import tempfile
+from argparse import ArgumentParser
+
+home = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(home)
+sys.path.append(os.path.join(home,'..','DynusTparser'))
+import synthetic
+import parallelBz2
+
+parser = ArgumentParser()
+parser.add_argument('--path',help = 'bzip2 file to decompress instead of '
+                    'the synthetic trajectories')
+parser.add_argument('--numVehicles',type = int,default = 100000)
+parser.add_argument('--numLinks',type = int,default = 10000)
+parser.add_argument('--cpus',default = '1,2,4,8,16',
+                    help = 'comma separated list of worker counts')
+parser.add_argument('--output',help = 'optional path of the JSON results')
+args = parser.parse_args()
+
+def singleStream(path):
+    with bz2.open(path,'rb') as f:
+        while True:
+            data = f.read(2**25)
+            if not data: return
+            yield data
+
+
+def measure(pieces):
+    # the seconds, decompressed bytes and digest of the pieces
+    start = time.perf_counter()
+    digest = hashlib.md5()
+    size = 0
+    for data in pieces:
+        digest.update(data)
+        size += len(data)
+    return time.perf_counter() - start,size,digest.hexdigest()
+
+
+with tempfile.TemporaryDirectory() as tmp:
+    path = args.path
+    if path is None:
+        synthetic.makeDynusT(tmp,args.numVehicles,args.numLinks)
+        path = os.path.join(tmp,'VehTrajectory.dat.bz2')
+    compressedMB = os.path.getsize(path)/2**20
+
+    seconds,size,reference = measure(singleStream(path))
+    results = [{'reader':'bz2','workers':1,'seconds':seconds,
+                'compressedMBps':compressedMB/seconds,
+                'decompressedMBps':size/2**20/seconds,'identical':True}]
+    with open(path,'rb') as f:
+        data = f.read()
+    start = time.perf_counter()
+    numBlocks = sum(isBlock for _,isBlock in parallelBz2.scanBlocks(data))
+    scanSeconds = time.perf_counter() - start
+    del data
+    for workers in map(int,args.cpus.split(',')):
+        seconds,_,digest = measure(parallelBz2.readBlocks(path,workers))
+        results.append({
+            'reader':'parallelBz2','workers':workers,'seconds':seconds,
+            'compressedMBps':compressedMB/seconds,
+            'decompressedMBps':size/2**20/seconds,
+            'identical':digest == reference
+        })
+
+print(f'{compressedMB:.1f} MB compressed, {size/2**20:.1f} MB '
+      f'decompressed, {numBlocks} blocks, block scan '
+      f'{compressedMB/scanSeconds:.0f} MB/s')
+for result in results:
+    print(f'{result["reader"]:12s} {result["workers"]:3d} workers '
+          f'{result["seconds"]:8.2f} s {result["compressedMBps"]:7.1f} '
+          f'MB/s compressed {result["decompressedMBps"]:7.1f} MB/s '
+          f'decompressed identical {result["identical"]}')
+
+if args.output:
+    with open(args.output,'w') as f:
+        json.dump({'compressedMB':compressedMB,'decompressedMB':size/2**20,
+                   'numBlocks':numBlocks,'cpuCount':os.cpu_count(),
+                   'results':results},f,indent = 1)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+'''benchmark the join heavy steps of the emissions stage with string
+linkIDs against the packed integer link keys'''
+
+import os
+import sys
+import time
+import numpy as np
+from argparse import ArgumentParser
+
+home = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(home)
+sys.path.append(os.path.join(home,'..','common'))
+import synthetic
+from linkKeys import linkKeyFromID,linkIDFromKey,linkIDOrder
+
+parser = ArgumentParser()
+parser.add_argument('--numLinks',type = int,default = 100000)
+parser.add_argument('--numPollutants',type = int,default = 9,
+                    help = 'rows of the emissions per linkVMT row')
+args = parser.parse_args()
+
+def timeit(label,func):
+    start = time.perf_counter()
+    result = func()
+    print(f'{label:45s} {time.perf_counter() - start:10.3f} s')
+    return result
+
+links = synthetic.makeLinks(args.numLinks)
+vmt = synthetic.makeLinkVMT(links)
+print('links:',len(links),'linkVMT rows:',len(vmt))
+
+# the before: string linkIDs
+merged = timeit('merge links on string linkIDs',
+                lambda: vmt.merge(links,on = 'linkID'))
+emissions = merged.loc[
+    merged.index.repeat(args.numPollutants),['linkID','vmt']
+]
+emissions['pollutantID'] = np.tile(
+    np.arange(args.numPollutants),len(merged)
+)
+timeit('groupby string linkIDs and pollutantID',
+       lambda: emissions.groupby(['linkID','pollutantID']).vmt.sum())
+
+# the after: integer keys, including the conversions at the file
+# boundaries
+keyedLinks = links.copy()
+keyedVMT = vmt.copy()
+keyedLinks['linkID'] = timeit('pack the links linkIDs',
+                              lambda: linkKeyFromID(links.linkID))
+keyedVMT['linkID'] = timeit('pack the linkVMT linkIDs',
+                            lambda: linkKeyFromID(vmt.linkID))
+merged = timeit('merge links on integer keys',
+                lambda: keyedVMT.merge(keyedLinks,on = 'linkID'))
+emissions = merged.loc[
+    merged.index.repeat(args.numPollutants),['linkID','vmt']
+]
+emissions['pollutantID'] = np.tile(
+    np.arange(args.numPollutants),len(merged)
+)
+summed = timeit(
+    'groupby integer keys and pollutantID',
+    lambda: emissions.groupby(['linkID','pollutantID']).vmt.sum()
+).reset_index()
+timeit('restore the string linkIDs and their order',
+       lambda: linkIDFromKey(summed.linkID.values[
+           linkIDOrder(summed.linkID)
+       ]))
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+'''benchmark the county lookup and links.csv construction of
+DynusTparser/makeLinks.py against the per link nearest county lookup
+keyed by the WKT of the county polygons that it replaced, on a
+synthetic network and county layer'''
+
+import os
+import sys
+import json
+import time
+import tempfile
+from argparse import ArgumentParser
+
+home = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(home)
+sys.path.append(os.path.join(home,'..','DynusTparser'))
+import synthetic
+import makeLinks
+
+parser = ArgumentParser()
+parser.add_argument('--numLinks',type = int,default = 100000)
+parser.add_argument('--numCounties',type = int,default = 3000)
+parser.add_argument('--output',help = 'optional path of the JSON results')
+args = parser.parse_args()
+
+def legacyLinks(shp,path):
+    # the row by row makeLinks.py; shapely 2 returns the index of the
+    # nearest geometry rather than the geometry itself
+    import geopandas as gpd
+    from shapely.strtree import STRtree
+    counties = gpd.read_file(path).to_crs(epsg = makeLinks.epsg)
+    tree = STRtree(counties.geometry)
+    fipsLookup = dict((r.geometry.wkt,r.GEOID) for r in counties.itertuples())
+    shp = shp.copy()
+    shp['point'] = [l.interpolate(0.5,normalized = True) for l in shp.geometry]
+    shp['countyID'] = shp.point.apply(
+        lambda p: fipsLookup[counties.geometry.iloc[tree.nearest(p)].wkt]
+    )
+    shp['linkID'] = shp.A_NODE.astype(str) + '-' + shp.B_NODE.astype(str)
+    shp['roadTypeID'] = shp['#LTYPE'].apply(
+        lambda ID: 4 if ID in [1,2,6,7,8,9,10] else 5
+    )
+    shp['length'] = shp.geometry.length*makeLinks.milesInMeter
+    shp = shp.rename(columns = {'#SPEED':'speedLimit','#LANES':'numLanes'})
+    return shp[['linkID','roadTypeID','countyID','length','speedLimit',
+                'numLanes']]
+
+
+def vectorizedLinks(shp,path):
+    return makeLinks.linkTable(shp,makeLinks.assignCounties(
+        makeLinks.midpoints(shp.geometry),path
+    ))
+
+
+shp = synthetic.makeLinkShapes(args.numLinks).to_crs(epsg = makeLinks.epsg)
+counties = synthetic.makeCounties(shp,numCounties = args.numCounties)
+seconds = {}
+tables = {}
+with tempfile.TemporaryDirectory() as tmp:
+    path = os.path.join(tmp,'counties.gpkg')
+    counties.to_file(path)
+    for name,method in [('vectorized',vectorizedLinks),
+                        ('legacy',legacyLinks)]:
+        start = time.perf_counter()
+        tables[name] = method(shp,path)
+        seconds[name] = time.perf_counter() - start
+identical = tables['vectorized'].reset_index(drop = True).equals(
+    tables['legacy'].reset_index(drop = True)
+)
+
+print(f'{len(shp)} links, {len(counties)} counties, '
+      f'{tables["vectorized"].countyID.nunique()} counties with links')
+for name,value in seconds.items():
+    print(f'{name}: {value:.2f} s')
+print(f'speedup {seconds["legacy"]/seconds["vectorized"]:.1f}, '
+      f'identical {identical}')
+
+if args.output:
+    with open(args.output,'w') as f:
+        json.dump({'numLinks':len(shp),'numCounties':len(counties),
+                   'seconds':seconds,'identical':identical},f,indent = 1)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+'''benchmark loading the MOVES matrices by parsing their CSVs against
+slicing the memory mapped matrix store'''
+
+import os
+import sys
+import json
+import time
+import tempfile
+from argparse import ArgumentParser
+
+home = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(home)
+sys.path.append(os.path.join(home,'..','TransformMovesMatrix'))
+import synthetic
+from matrixStore import MatrixStore,readMatrix
+
+parser = ArgumentParser()
+parser.add_argument('--numCounties',type = int,default = 2)
+parser.add_argument('--numPollutants',type = int,default = 30,
+                    help = 'pollutants in every matrix')
+parser.add_argument('--output',help = 'optional path of the JSON results')
+args = parser.parse_args()
+
+year,month = 2020,7
+with tempfile.TemporaryDirectory() as tmp:
+    synthetic.makeMovesRoot(tmp,synthetic.counties(args.numCounties),
+                            year,month,pollutantIDs = list(
+                                range(1,1 + args.numPollutants)
+                            ))
+    directory = os.path.join(tmp,'f10i0',str(year))
+    names = sorted(os.listdir(directory))
+
+    start = time.perf_counter()
+    MatrixStore.convert(directory,names)
+    convertSeconds = time.perf_counter() - start
+    csvBytes = sum(os.path.getsize(os.path.join(directory,name))
+                   for name in names)
+    storeBytes = sum(
+        entry.stat().st_size
+        for entry in os.scandir(os.path.join(directory,MatrixStore.name))
+    )
+
+    # drop the opened stores so that opening is timed too
+    MatrixStore.opened.clear()
+    start = time.perf_counter()
+    for name in names:
+        with open(os.path.join(directory,name),'rb') as f:
+            expected = readMatrix(f.read())
+    csvSeconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    store = MatrixStore.open(directory)
+    for name in names:
+        actual = store.read(name)
+    storeSeconds = time.perf_counter() - start
+
+    # the last matrix read both ways must be identical
+    same = expected.equals(actual)
+
+print(f'{len(names)} matrices, {len(expected)} rows each')
+print(f'conversion {convertSeconds:.2f} s, '
+      f'CSV {csvBytes/2**20:.1f} MB, store {storeBytes/2**20:.1f} MB')
+print(f'per matrix: CSV parse {1000*csvSeconds/len(names):.2f} ms, '
+      f'store {1000*storeSeconds/len(names):.2f} ms, '
+      f'speedup {csvSeconds/storeSeconds:.1f}, identical {same}')
+
+if args.output:
+    with open(args.output,'w') as f:
+        json.dump({
+            'numMatrices':len(names),'rows':len(expected),
+            'convertSeconds':convertSeconds,'csvBytes':csvBytes,
+            'storeBytes':storeBytes,'csvSeconds':csvSeconds,
+            'storeSeconds':storeSeconds,'identical':same
+        },f,indent = 1)
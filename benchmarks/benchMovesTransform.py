@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+'''benchmark the per matrix transform of the MOVES rates with pandas
+merges and groupbys against the tensor contractions'''
+
+import os
+import sys
+import json
+import time
+import tempfile
+import numpy as np
+import pandas as pd
+from argparse import ArgumentParser
+
+home = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(home)
+sys.path.append(os.path.join(home,'..','TransformMovesMatrix'))
+import synthetic
+import moves
+
+parser = ArgumentParser()
+parser.add_argument('--numMatrices',type = int,default = 10)
+parser.add_argument('--numPollutants',type = int,default = 30,
+                    help = 'pollutants in every matrix')
+parser.add_argument('--numAges',type = int,default = 31)
+parser.add_argument('--speedBinSize',type = int,default = 5)
+parser.add_argument('--output',help = 'optional path of the JSON results')
+args = parser.parse_args()
+
+def timeit(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start,result
+
+
+year,month = 2020,7
+fips = synthetic.counties(1)
+with tempfile.TemporaryDirectory() as tmp:
+    synthetic.makeMovesRoot(tmp,fips,year,month,args.numAges,
+                            list(range(1,1 + args.numPollutants)))
+    m = moves.MOVES(year,month,tmp)
+    ages = m.ages.query(f'countyID == {fips[0]}')[
+        ['modelYearID','sourceTypeID','ageFraction']
+    ]
+    prefix = os.path.join(tmp,'f10i0',str(year))
+    paths = sorted(os.listdir(prefix))[:args.numMatrices]
+    matrices = []
+    for name in paths:
+        rates = pd.read_csv(os.path.join(prefix,name),header = None)
+        rates.columns = ['opModeID','pollutantID','sourceTypeID',
+                         'modelYearID','emRate']
+        matrices.append(rates)
+
+results = []
+for name,rates in zip(paths,matrices):
+    m.engine = 'pandas'
+    pandasSeconds,expected = timeit(
+        lambda: m.transformMatrix(rates.copy(),ages,args.speedBinSize)
+    )
+    m.engine = 'tensor'
+    tensorSeconds,actual = timeit(
+        lambda: m.transformMatrix(rates.copy(),ages,args.speedBinSize)
+    )
+    sameKeys = expected.drop(columns = 'ratePerDistance').equals(
+        actual.drop(columns = 'ratePerDistance')
+    )
+    relError = np.max(
+        np.abs(actual.ratePerDistance.values -
+               expected.ratePerDistance.values)/
+        np.abs(expected.ratePerDistance.values)
+    )
+    results.append({
+        'matrix':name,'rows':len(rates),'pandasSeconds':pandasSeconds,
+        'tensorSeconds':tensorSeconds,'sameKeys':bool(sameKeys),
+        'maxRelError':float(relError)
+    })
+    print(f'{name:16s} {len(rates):8d} rows pandas {pandasSeconds:8.4f} s '
+          f'tensor {tensorSeconds:8.4f} s '
+          f'speedup {pandasSeconds/tensorSeconds:6.1f} '
+          f'same keys {sameKeys} max rel error {relError:.2e}')
+
+pandasTotal = sum(r['pandasSeconds'] for r in results)
+tensorTotal = sum(r['tensorSeconds'] for r in results)
+print(f'mean per matrix: pandas {pandasTotal/len(results):.4f} s, '
+      f'tensor {tensorTotal/len(results):.4f} s, '
+      f'speedup {pandasTotal/tensorTotal:.1f}')
+
+if args.output:
+    with open(args.output,'w') as f:
+        json.dump({'numPollutants':args.numPollutants,
+                   'numAges':args.numAges,'results':results},f,indent = 1)
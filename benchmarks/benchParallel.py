@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+'''benchmark the scaling of the groups emissions engine with the
+number of CPUs for the process pool and joblib backends'''
+
+import os
+import sys
+import json
+import time
+import tempfile
+from argparse import ArgumentParser
+
+home = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(home)
+sys.path.append(os.path.join(home,'..','EmissionsCalculator'))
+import synthetic
+import pandas as pd
+from computeEmissions import readRates,readVMX,groupEmissions
+
+parser = ArgumentParser()
+parser.add_argument('--numLinks',type = int,default = 2000)
+parser.add_argument('--numCounties',type = int,default = 2)
+parser.add_argument('--cpus',default = '1,2,4,8,16',
+                    help = 'comma separated list of CPU counts')
+parser.add_argument('--backends',default = 'pool,joblib')
+parser.add_argument('--output',help = 'optional path of the JSON results')
+args = parser.parse_args()
+
+with tempfile.TemporaryDirectory() as tmp:
+    synthetic.writeEmissionsInputs(tmp,args.numLinks,args.numCounties)
+    vmt = pd.read_csv(os.path.join(tmp,'linkVMT.csv')).merge(
+        pd.read_csv(os.path.join(tmp,'links.csv')),on = 'linkID'
+    )
+    rates = readRates(os.path.join(tmp,'rates.csv'),2020)
+    vmx = readVMX(os.path.join(tmp,'vmx.csv'),2020,'WK',False)
+
+results = []
+for backend in args.backends.split(','):
+    baseline = None
+    for numCPU in map(int,args.cpus.split(',')):
+        start = time.perf_counter()
+        groupEmissions(vmt,rates,vmx,synthetic.vehTypeMap,numCPU,backend)
+        elapsed = time.perf_counter() - start
+        if baseline is None: baseline = elapsed
+        results.append({
+            'backend':backend,'numCPU':numCPU,'seconds':elapsed,
+            'speedup':baseline/elapsed
+        })
+        print(f'{backend:8s} {numCPU:3d} CPUs {elapsed:10.3f} s '
+              f'speedup {baseline/elapsed:6.2f}')
+
+if args.output:
+    with open(args.output,'w') as f:
+        json.dump({'numLinks':args.numLinks,'cpuCount':os.cpu_count(),
+                   'results':results},f,indent = 1)
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+
+'''benchmark the wall time, CPU time and peak memory of the stages of
+the PATHS pipeline on synthetic inputs at several scales; every stage
+runs in a fresh process and the results are written as JSON so that
+they can be compared across commits'''
+
+import os
+import sys
+import json
+import time
+import runpy
+import signal
+import platform
+import tempfile
+import subprocess
+from argparse import ArgumentParser
+
+home = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(home)
+for directory in ['EmissionsCalculator','TransformMovesMatrix','AERMOD',
+                  'common']:
+    sys.path.append(os.path.join(home,'..',directory))
+import synthetic
+from instrument import peakRSS,resetPeakRSS
+
+# the stages in pipeline order; the AERMOD stages run the preceding
+# AERMOD stages as their setup
+stages = ['computeEmissions','assembleRates','makeSources',
+          'makeLinkReceptors','makeGridReceptors',
+          'dropReceptorsInSources','combineOuts']
+aermodStages = stages[2:6]
+
+parser = ArgumentParser()
+parser.add_argument('--numLinks',default = '1000,10000,100000',
+                    help = 'comma separated list of network sizes')
+parser.add_argument('--numCounties',type = int,default = 2)
+parser.add_argument('--stages',default = ','.join(stages),
+                    help = 'comma separated list of stages to run')
+parser.add_argument('--year',type = int,default = 2020)
+parser.add_argument('--month',type = int,default = 7)
+parser.add_argument('--receptorsPerLink',type = int,default = 10,
+                    help = 'receptors in the AERMOD outputs per link')
+parser.add_argument('--outFiles',type = int,default = 10,
+                    help = 'number of AERMOD outputs to combine')
+parser.add_argument('--timeout',type = float,default = 1800,
+                    help = 'seconds after which a stage is stopped')
+parser.add_argument('--workDir',
+                    help = 'keep the synthetic inputs in this directory')
+parser.add_argument('--output',default = 'benchPipeline.json',
+                    help = 'path of the JSON results')
+# used internally to run a single stage in a child process
+parser.add_argument('--run',help = 'run this stage (used internally)')
+parser.add_argument('--inputs',help = 'inputs of the stage to run')
+parser.add_argument('--result',help = 'path of the stage result')
+args = parser.parse_args()
+
+def setupStage(stage,inputs):
+    # prepare everything the stage needs and return the callable that
+    # runs it and the callable that counts the items it produced
+    os.chdir(inputs)
+    if stage == 'computeEmissions':
+        import computeEmissions
+        sys.argv = ['computeEmissions.py','vmx.csv','rates.csv',
+                    str(args.year),'1']
+        return computeEmissions.main,lambda: None
+
+    if stage == 'assembleRates':
+        import moves
+        m = moves.MOVES(args.year,args.month,
+                        os.path.join(inputs,'..','MOVES'))
+        fipsList = synthetic.counties(args.numCounties)
+        # include the expansion into the long rates table as before
+        rates = []
+        def run():
+            m.assembleRates(fipsList)
+            rates.append(m.wideRates())
+        return run,lambda: len(rates[0])
+
+    if stage in aermodStages:
+        from aermodInput import AermodScenario
+        scenario = AermodScenario(None,12)
+        scenario.getLinkGeometries('links.shp')
+        scenario.constructNetwork()
+        scenario.mergeEmissionRate('emissions.csv')
+        for step in aermodStages[:aermodStages.index(stage)]:
+            getattr(scenario,step)()
+        if stage == 'makeSources':
+            count = lambda: len(scenario.lineSources)
+        else:
+            count = lambda: len(scenario.receptors)
+        return getattr(scenario,stage),count
+
+    if stage == 'combineOuts':
+        os.chdir('outs')
+        path = os.path.join(home,'..','AERMOD','combineOuts.py')
+        sys.argv = [path]
+        return lambda: runpy.run_path(path),lambda: None
+
+    raise ValueError(f'unknown stage {stage}')
+
+
+def runStage():
+    # runs in the child process
+    run,count = setupStage(args.run,args.inputs)
+    # the peak of the setup is not attributed to the stage
+    resetPeakRSS()
+    baseRSS = peakRSS()
+    start = time.perf_counter()
+    cpuStart = time.process_time()
+    run()
+    result = {
+        'seconds':time.perf_counter() - start,
+        'cpuSeconds':time.process_time() - cpuStart,
+        'peakRSSMB':peakRSS(),
+        'baseRSSMB':baseRSS,
+        'items':count()
+    }
+    with open(args.result,'w') as f:
+        json.dump(result,f)
+
+
+def writeInputs(directory,numLinks,selected):
+    # write only the inputs of the selected stages
+    os.makedirs(directory,exist_ok = True)
+    if 'computeEmissions' in selected:
+        synthetic.writeEmissionsInputs(directory,numLinks,
+                                       args.numCounties,[args.year])
+    if set(aermodStages) & set(selected):
+        shapes = synthetic.makeLinkShapes(numLinks)
+        shapes.to_file(os.path.join(directory,'links.shp'))
+        synthetic.makeEmissions(shapes).to_csv(
+            os.path.join(directory,'emissions.csv'),index = False
+        )
+    if 'combineOuts' in selected:
+        outs = os.path.join(directory,'outs')
+        os.makedirs(outs,exist_ok = True)
+        synthetic.makeAermodOuts(outs,args.receptorsPerLink*numLinks,
+                                 args.outFiles)
+
+
+def benchStage(stage,inputs):
+    # run the stage in a fresh process in its own session so that the
+    # workers it forks are stopped with it on timeout
+    with tempfile.NamedTemporaryFile(suffix = '.json') as result:
+        child = subprocess.Popen(
+            [sys.executable,os.path.abspath(__file__),'--run',stage,
+             '--inputs',inputs,'--result',result.name,
+             '--numCounties',str(args.numCounties),
+             '--year',str(args.year),'--month',str(args.month)],
+            stdout = subprocess.DEVNULL,stderr = subprocess.PIPE,
+            text = True,start_new_session = True
+        )
+        try:
+            _,stderr = child.communicate(timeout = args.timeout)
+        except subprocess.TimeoutExpired:
+            os.killpg(child.pid,signal.SIGKILL)
+            child.communicate()
+            return {'error':f'timeout after {args.timeout} s'}
+        if child.returncode != 0:
+            lines = stderr.strip().splitlines()
+            if child.returncode < 0:
+                error = f'killed by signal {-child.returncode}'
+            else:
+                error = lines[-1] if lines else f'exit {child.returncode}'
+            return {'error':error}
+        with open(result.name) as f:
+            return json.load(f)
+
+
+def commit():
+    try:
+        return subprocess.run(
+            ['git','rev-parse','--short','HEAD'],cwd = home,
+            capture_output = True,text = True,check = True
+        ).stdout.strip()
+    except (OSError,subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    selected = args.stages.split(',')
+    unknown = set(selected) - set(stages)
+    if unknown:
+        print('Unknown stages:',','.join(sorted(unknown)))
+        sys.exit(1)
+
+    workDir = args.workDir or tempfile.mkdtemp(prefix = 'benchPipeline')
+    if 'assembleRates' in selected:
+        movesRoot = os.path.join(workDir,'MOVES')
+        os.makedirs(movesRoot,exist_ok = True)
+        numMatrices = synthetic.makeMovesRoot(
+            movesRoot,synthetic.counties(args.numCounties),
+            args.year,args.month
+        )
+        print('Wrote',numMatrices,'MOVES matrices')
+
+    results = []
+    for numLinks in map(int,args.numLinks.split(',')):
+        inputs = os.path.join(workDir,str(numLinks))
+        start = time.perf_counter()
+        writeInputs(inputs,numLinks,selected)
+        print(f'Wrote the inputs for {numLinks} links in '
+              f'{time.perf_counter() - start:.1f} s')
+        for stage in selected:
+            # the MOVES rates do not depend on the number of links
+            if stage == 'assembleRates' and \
+               any(r['stage'] == stage for r in results):
+                continue
+            result = benchStage(stage,inputs)
+            result['stage'] = stage
+            result['numLinks'] = numLinks
+            results.append(result)
+            if 'error' in result:
+                print(f'{stage:25s} {numLinks:8d} links '
+                      f'failed: {result["error"]}')
+            else:
+                print(f'{stage:25s} {numLinks:8d} links '
+                      f'{result["seconds"]:10.3f} s '
+                      f'cpu {result["cpuSeconds"]:10.3f} s '
+                      f'peak RSS {result["peakRSSMB"]:8.1f} MB '
+                      f'items {result["items"]}')
+
+    if not args.workDir:
+        import shutil
+        shutil.rmtree(workDir)
+
+    with open(args.output,'w') as f:
+        json.dump({
+            'commit':commit(),
+            'python':platform.python_version(),
+            'cpuCount':os.cpu_count(),
+            'numCounties':args.numCounties,
+            'results':results
+        },f,indent = 1)
+    print('Wrote',args.output)
+
+
+if __name__ == '__main__':
+    if args.run:
+        runStage()
+    else:
+        main()
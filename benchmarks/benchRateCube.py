@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+'''benchmark the emission rate lookups of the rate cube against
+filtering the long format rates dataframe'''
+
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+from argparse import ArgumentParser
+
+home = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(home)
+sys.path.append(os.path.join(home,'..','EmissionsCalculator'))
+import synthetic
+from rateCube import RateCube
+from computeEmissions import readRates
+
+parser = ArgumentParser()
+parser.add_argument('--numCounties',type = int,default = 4)
+parser.add_argument('--numLookups',type = int,default = 200,
+                    help = 'number of dataframe filter lookups to time')
+parser.add_argument('--numRows',type = int,default = 1000000,
+                    help = 'number of rows to look up in the cube')
+args = parser.parse_args()
+
+def timeit(label,func,count = None):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    rate = '' if count is None else f'{count/elapsed:14.1f} rows/s'
+    print(f'{label:40s} {elapsed:10.4f} s {rate}')
+    return result
+
+with tempfile.TemporaryDirectory() as tmp:
+    ratesPath = os.path.join(tmp,'rates.csv')
+    cubePath = os.path.join(tmp,'cube')
+    synthetic.makeRates([2020],args.numCounties).to_csv(
+        ratesPath,index = False
+    )
+    rates = timeit('parse the rates CSV',
+                   lambda: readRates(ratesPath,2020))
+    print('Rates:',len(rates),'rows')
+    cube = timeit('build the dense cube',
+                  lambda: RateCube.fromRates(rates,2020))
+    sparse = timeit('build the sparse table',
+                    lambda: RateCube.fromRates(rates,2020,0))
+    cube.save(cubePath)
+    timeit('memory map the saved cube',lambda: RateCube.load(cubePath))
+
+    # the dataframe filter path: one six key filter per lookup
+    keys = rates.sample(args.numLookups,random_state = 0)
+    def filterLookups():
+        for row in keys.itertuples():
+            rates[
+                (rates.countyID == row.countyID) &
+                (rates.timeIntervalID == row.timeIntervalID) &
+                (rates.roadTypeID == row.roadTypeID) &
+                (rates.avgSpeedBinID == row.avgSpeedBinID) &
+                (rates.sourceTypeID == row.sourceTypeID) &
+                (rates.fuelTypeID == row.fuelTypeID)
+            ].ratePerDistance.values
+    timeit('dataframe filter',filterLookups,args.numLookups)
+
+    # the cube path: all rows at once
+    rows = rates.sample(args.numRows,replace = True,random_state = 0)
+    dense = timeit('dense cube lookup',lambda: cube.lookup(rows),
+                   args.numRows)
+    loaded = RateCube.load(cubePath)
+    timeit('memory mapped cube lookup',lambda: loaded.lookup(rows),
+           args.numRows)
+    result = timeit('sparse table lookup',lambda: sparse.lookup(rows),
+                    args.numRows)
+    assert np.array_equal(dense,result,equal_nan = True)
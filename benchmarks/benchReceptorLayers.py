@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+'''benchmark the closed form receptor layers of AERMOD/aermodInput.py
+against the per source parallel_offset and interpolate calls that it
+replaced, and check that both give the same receptors'''
+
+import os
+import sys
+import json
+import time
+import tempfile
+from argparse import ArgumentParser
+
+home = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(home)
+sys.path.append(os.path.join(home,'..','AERMOD'))
+import numpy as np
+import pandas as pd
+import synthetic
+from shapely import distance
+from aermodConst import receptorSpacing,receptorLayerScales
+from aermodInput import AermodScenario,receptorLayers
+
+parser = ArgumentParser()
+parser.add_argument('--numLinks',type = int,default = 20000)
+parser.add_argument('--output',help = 'optional path of the JSON results')
+args = parser.parse_args()
+
+def legacyLayers(sources):
+    # the replaced row by row receptor layers; parallel_offset offsets
+    # to the right of the line for a positive distance
+    receptors = []
+    for idx,source in sources.iterrows():
+        length = source.geometry.length
+        numReceptors = int(length/receptorSpacing) + 1
+        startPos = 0.5*(length - receptorSpacing*(numReceptors - 1))
+        for layerID,scale in enumerate(receptorLayerScales):
+            dist = scale + 0.5*source.width
+            offsets = [source.geometry.parallel_offset(dist),
+                       source.geometry.parallel_offset(-dist)]
+            for receptorIdx in range(numReceptors):
+                pos = startPos + receptorIdx*receptorSpacing
+                for offsetIdx,offset in enumerate(offsets):
+                    receptors.append({
+                        'receptorID':f'{source.sourceID}_{layerID}_'
+                        f'{receptorIdx}_{offsetIdx}',
+                        'geometry':offset.interpolate(pos)
+                    })
+    return pd.DataFrame(receptors)
+
+
+with tempfile.TemporaryDirectory() as tmp:
+    shapes = synthetic.makeLinkShapes(args.numLinks)
+    shapes.to_file(os.path.join(tmp,'links.shp'))
+    synthetic.makeEmissions(shapes).to_csv(
+        os.path.join(tmp,'emissions.csv'),index = False
+    )
+    scenario = AermodScenario(None,12)
+    scenario.getLinkGeometries(os.path.join(tmp,'links.shp'))
+    scenario.constructNetwork()
+    scenario.mergeEmissionRate(os.path.join(tmp,'emissions.csv'))
+    scenario.makeSources()
+sources = scenario.lineSources
+
+seconds = {}
+layers = {}
+for name,method in [('closedForm',receptorLayers),('legacy',legacyLayers)]:
+    start = time.perf_counter()
+    layers[name] = method(sources)
+    seconds[name] = time.perf_counter() - start
+
+closedForm,legacy = layers['closedForm'],layers['legacy']
+sameIDs = bool(np.array_equal(closedForm.receptorID.values,
+                              legacy.receptorID.values))
+maxDistance = float(distance(closedForm.geometry.values,
+                             np.asarray(legacy.geometry)).max())
+
+print(f'{len(sources)} sources, {len(closedForm)} receptors, same IDs '
+      f'{sameIDs}, largest distance {maxDistance:.2e} m')
+for name,value in seconds.items():
+    print(f'{name}: {value:.2f} s')
+print(f'speedup {seconds["legacy"]/seconds["closedForm"]:.0f}')
+
+if args.output:
+    with open(args.output,'w') as f:
+        json.dump({'numSources':len(sources),'numReceptors':len(closedForm),
+                   'sameIDs':sameIDs,'maxDistance':maxDistance,
+                   'seconds':seconds},f,indent = 1)
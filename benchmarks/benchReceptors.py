@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+'''benchmark dropping the receptors that fall inside the source buffers
+with the bulk STRtree query of AERMOD/aermodInput.py against the
+nearest buffer check per receptor in a process per CPU that it
+replaced, and count the receptors inside overlapping buffers that the
+nearest buffer check keeps'''
+
+import os
+import sys
+import json
+import time
+import tempfile
+import multiprocessing as mp
+from itertools import chain
+from argparse import ArgumentParser
+
+home = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(home)
+sys.path.append(os.path.join(home,'..','AERMOD'))
+import numpy as np
+import pandas as pd
+import synthetic
+from shapely import points,contains
+from aermodInput import AermodScenario,receptorsInSources
+
+parser = ArgumentParser()
+parser.add_argument('--numLinks',type = int,default = 20000)
+parser.add_argument('--numReceptors',type = int,default = 1000000)
+parser.add_argument('--checkSample',type = int,default = 500,
+                    help = 'receptors checked against every buffer')
+parser.add_argument('--skipLegacy',action = 'store_true')
+parser.add_argument('--output',help = 'optional path of the JSON results')
+args = parser.parse_args()
+
+# the replaced receptor check; shapely 2 returns the index of the
+# nearest geometry rather than the geometry itself
+output = mp.SimpleQueue()
+
+def checkReceptorGroup(tree,data):
+    indices = []
+    for idx,row in data.iterrows():
+        if tree.geometries[tree.nearest(row.geometry)].contains(row.geometry):
+            indices.append(idx)
+    output.put(indices)
+
+
+def checkAllReceptors(tree,receptors,numGroups = None):
+    numReceptors = receptors.index.size
+    if numGroups is None: numGroups = mp.cpu_count()
+    groupSize = 1 + int(numReceptors/numGroups)
+    args = []
+    for start in range(0,numReceptors,groupSize):
+        stop = min(start + groupSize,numReceptors)
+        args.append((tree,receptors.iloc[range(start,stop)]))
+    procs = [mp.Process(target = checkReceptorGroup,args = arg)
+             for arg in args]
+    for p in procs: p.start()
+    for p in procs:
+        if p.is_alive(): p.join(timeout = 10)
+    indices = [output.get() for p in procs]
+    return list(chain(*indices))
+
+
+def makeReceptors(sources,numReceptors,seed = 0):
+    # half of the receptors scattered over the sources and half close
+    # to their center lines, where the buffers of connected sources
+    # overlap
+    rng = np.random.default_rng(seed)
+    numNear = numReceptors//2
+    xmin,ymin,xmax,ymax = sources.total_bounds
+    x = rng.uniform(xmin,xmax,numReceptors - numNear)
+    y = rng.uniform(ymin,ymax,numReceptors - numNear)
+    source = rng.integers(0,len(sources),numNear)
+    along = rng.random(numNear)
+    x1,y1 = sources.x1.values[source],sources.y1.values[source]
+    x2,y2 = sources.x2.values[source],sources.y2.values[source]
+    spread = rng.normal(0.,sources.width.values[source],(2,numNear))
+    x = np.concatenate((x,x1 + along*(x2 - x1) + spread[0]))
+    y = np.concatenate((y,y1 + along*(y2 - y1) + spread[1]))
+    return pd.DataFrame({
+        'receptorID':[f'r{idx}' for idx in range(numReceptors)],
+        'geometry':points(x,y)
+    })
+
+
+with tempfile.TemporaryDirectory() as tmp:
+    shapes = synthetic.makeLinkShapes(args.numLinks)
+    shapes.to_file(os.path.join(tmp,'links.shp'))
+    synthetic.makeEmissions(shapes).to_csv(
+        os.path.join(tmp,'emissions.csv'),index = False
+    )
+    scenario = AermodScenario(None,12)
+    scenario.getLinkGeometries(os.path.join(tmp,'links.shp'))
+    scenario.constructNetwork()
+    scenario.mergeEmissionRate(os.path.join(tmp,'emissions.csv'))
+    scenario.makeSources()
+receptors = makeReceptors(scenario.lineSources,args.numReceptors)
+
+seconds = {}
+start = time.perf_counter()
+bulk = receptorsInSources(scenario.tree,receptors.geometry.values)
+seconds['bulk'] = time.perf_counter() - start
+
+# check a sample of the receptors against every buffer
+rng = np.random.default_rng(1)
+sample = np.sort(rng.choice(len(receptors),
+                            min(args.checkSample,len(receptors)),
+                            replace = False))
+buffers = np.asarray(scenario.lineSources.buffers)
+inside = np.array([contains(buffers,receptors.geometry.values[idx]).any()
+                   for idx in sample])
+correct = bool((np.isin(sample,bulk) == inside).all())
+
+result = {'numSources':len(scenario.lineSources),
+          'numReceptors':len(receptors),'bulkDropped':len(bulk),
+          'sampleCorrect':correct}
+if not args.skipLegacy:
+    start = time.perf_counter()
+    legacy = np.unique(checkAllReceptors(scenario.tree,receptors))
+    seconds['legacy'] = time.perf_counter() - start
+    result.update(legacyDropped = len(legacy),
+                  missedByLegacy = len(np.setdiff1d(bulk,legacy)),
+                  extraInLegacy = len(np.setdiff1d(legacy,bulk)))
+
+print(f'{result["numSources"]} sources, {result["numReceptors"]} '
+      f'receptors, {result["bulkDropped"]} dropped, sample of '
+      f'{len(sample)} correct {correct}')
+for name,value in seconds.items():
+    print(f'{name}: {value:.2f} s')
+if 'legacy' in seconds:
+    print(f'speedup {seconds["legacy"]/seconds["bulk"]:.0f}, the nearest '
+          f'buffer check keeps {result["missedByLegacy"]} receptors inside '
+          f'overlapping buffers')
+
+if args.output:
+    with open(args.output,'w') as f:
+        json.dump(dict(result,seconds = seconds,cpuCount = os.cpu_count()),
+                  f,indent = 1)
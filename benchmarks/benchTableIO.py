@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+'''benchmark the load time and peak memory of linkVMT stored as CSV,
+Parquet and Arrow IPC; every load runs in a fresh process'''
+
+import os
+import sys
+import json
+import time
+import resource
+import tempfile
+import subprocess
+from argparse import ArgumentParser
+
+home = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(home)
+sys.path.append(os.path.join(home,'..','common'))
+from tableIO import readTable,writeTable
+
+parser = ArgumentParser()
+parser.add_argument('--numLinks',type = int,default = 100000)
+parser.add_argument('--load',
+                    help = 'load this table and report (used internally)')
+parser.add_argument('--output',help = 'optional path of the JSON results')
+args = parser.parse_args()
+
+def peakRSS():
+    # peak RSS in MB; ru_maxrss survives exec on Linux and would
+    # report the peak of the parent, VmHWM does not
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])/1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024
+
+
+if args.load:
+    # runs in the child process
+    baseRSS = peakRSS()
+    start = time.perf_counter()
+    table = readTable(args.load)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({
+        'seconds':elapsed,
+        'frameMB':table.memory_usage(deep = True).sum()/2**20,
+        'peakRSSMB':peakRSS(),
+        'baseRSSMB':baseRSS
+    }))
+    sys.exit(0)
+
+import synthetic
+results = []
+with tempfile.TemporaryDirectory() as tmp:
+    vmt = synthetic.makeLinkVMT(synthetic.makeLinks(args.numLinks))
+    print('linkVMT rows:',len(vmt))
+    for ext in ['csv','parquet','arrow']:
+        path = os.path.join(tmp,f'linkVMT.{ext}')
+        writeTable(vmt,path)
+        child = subprocess.run(
+            [sys.executable,__file__,'--load',path],
+            capture_output = True,text = True,check = True
+        )
+        result = json.loads(child.stdout)
+        result['format'] = ext
+        result['fileMB'] = os.path.getsize(path)/2**20
+        results.append(result)
+        print(f'{ext:8s} load {result["seconds"]:8.3f} s '
+              f'file {result["fileMB"]:8.1f} MB '
+              f'frame {result["frameMB"]:8.1f} MB '
+              f'peak RSS {result["peakRSSMB"]:8.1f} MB '
+              f'(+{result["peakRSSMB"] - result["baseRSSMB"]:.1f} MB)')
+
+if args.output:
+    with open(args.output,'w') as f:
+        json.dump({'numLinks':args.numLinks,'results':results},f,
+                  indent = 1)
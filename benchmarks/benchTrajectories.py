@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+'''benchmark the NumPy DynusT parser (DynusTparser/volumes.py) against
+volumes.exe on synthetic DynusT outputs and check that their outputs
+are identical up to the order of the rows'''
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import subprocess
+from argparse import ArgumentParser
+
+home = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(home)
+import synthetic
+
+parser = ArgumentParser()
+parser.add_argument('--numVehicles',type = int,default = 100000)
+parser.add_argument('--numLinks',type = int,default = 10000)
+parser.add_argument('--aggInt',default = '60')
+parser.add_argument('--speedBin',default = '5')
+parser.add_argument('--chunkMB',default = '32')
+parser.add_argument('--volumesExe',
+                    default = os.path.join(home,'..','DynusTparser',
+                                           'volumes.exe'),
+                    help = 'path to the compiled volumes.exe; it is '
+                    'skipped if it does not exist')
+parser.add_argument('--output',help = 'optional path of the JSON results')
+args = parser.parse_args()
+
+outputs = ['linkVMT.csv','linkData.csv','numberOfTrips.csv']
+commands = {'numpy':[sys.executable,
+                     os.path.join(home,'..','DynusTparser','volumes.py'),
+                     args.aggInt,args.speedBin,'--chunkMB',args.chunkMB,
+                     '--quiet']}
+if os.path.exists(args.volumesExe):
+    commands['exe'] = [os.path.abspath(args.volumesExe),args.aggInt,
+                       args.speedBin]
+else:
+    print(f'{args.volumesExe} not found, timing the NumPy parser only')
+
+seconds = {}
+rows = {}
+with tempfile.TemporaryDirectory() as tmp:
+    inputs = os.path.join(tmp,'inputs')
+    os.makedirs(inputs)
+    synthetic.makeDynusT(inputs,args.numVehicles,args.numLinks,
+                         tolls = True)
+    inputBytes = sum(os.path.getsize(os.path.join(inputs,name))
+                     for name in os.listdir(inputs))
+    for name,command in commands.items():
+        directory = os.path.join(tmp,name)
+        shutil.copytree(inputs,directory)
+        start = time.perf_counter()
+        subprocess.run(command,cwd = directory,check = True,
+                       stdout = subprocess.DEVNULL,
+                       stderr = subprocess.DEVNULL)
+        seconds[name] = time.perf_counter() - start
+        # the rows of both are written in a different order
+        rows[name] = {}
+        for output in outputs:
+            with open(os.path.join(directory,output)) as f:
+                rows[name][output] = sorted(f)
+    identical = all(rows['numpy'] == other for other in rows.values())
+
+print(f'{args.numVehicles} vehicles, {inputBytes/2**20:.1f} MB of '
+      f'compressed inputs, {len(rows["numpy"]["linkVMT.csv"]) - 1} '
+      f'linkVMT rows')
+for name,value in seconds.items():
+    print(f'{name}: {value:.2f} s')
+if 'exe' in seconds:
+    print(f'speedup {seconds["exe"]/seconds["numpy"]:.2f}, '
+          f'identical {identical}')
+
+if args.output:
+    with open(args.output,'w') as f:
+        json.dump({
+            'numVehicles':args.numVehicles,'inputBytes':inputBytes,
+            'seconds':seconds,'identical':identical
+        },f,indent = 1)
@@ -0,0 +1,356 @@
+'''functions that generate synthetic inputs of configurable size for
+benchmarking the PATHS pipeline offline'''
+
+import numpy as np
+import pandas as pd
+
+vehTypeMap = {1:[11,21,31,32],2:[51,52,53,54],3:[61,62]}
+pollutants = [90,91,98,100,110,112,115,116,117]
+
+def counties(numCounties):
+    return [48001 + 2*i for i in range(numCounties)]
+
+
+def makeLinks(numLinks,numCounties = 2,seed = 0):
+    # links.csv as produced by makeLinks.py
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'linkID':[f'{i}-{i + 1}' for i in range(numLinks)],
+        'roadTypeID':rng.choice([2,3,4,5],numLinks),
+        'countyID':rng.choice(counties(numCounties),numLinks),
+        'length':rng.uniform(0.01,1.,numLinks),
+        'speedLimit':rng.choice([30,45,65],numLinks),
+        'numLanes':rng.integers(1,5,numLinks)
+    })
+
+
+def makeLinkVMT(links,rowsPerLink = 20,speedBinSize = 5,seed = 0):
+    # linkVMT.csv as produced by the DynusT parser, every interval
+    # is present at least once
+    rng = np.random.default_rng(seed)
+    numRows = len(links)*rowsPerLink
+    vmt = pd.DataFrame({
+        'linkID':links.linkID.values[rng.integers(0,len(links),numRows)],
+        'vehType':rng.choice(list(vehTypeMap),numRows),
+        'timeIntervalID':np.resize(np.arange(1,25),numRows),
+        'avgSpeedBinID':rng.integers(1,1 + 80//speedBinSize,numRows),
+        'vmt':rng.random(numRows)
+    })
+    return vmt.groupby(
+        ['linkID','vehType','timeIntervalID','avgSpeedBinID']
+    ).vmt.sum().reset_index()
+
+
+def makeRates(years,numCounties = 2,speedBinSize = 5,
+              fuelTypes = (1,2),seed = 0):
+    # the emission rates CSV read by computeEmissions.py
+    rng = np.random.default_rng(seed)
+    sourceTypes = sorted(sum(vehTypeMap.values(),[]))
+    index = pd.MultiIndex.from_product(
+        [pollutants,range(1,1 + 80//speedBinSize),[1],range(1,25),
+         [2,3,4,5],sourceTypes,fuelTypes,counties(numCounties),years],
+        names = ['pollutantID','avgSpeedBinID','processID','hourID',
+                 'roadTypeID','sourceTypeID','fuelTypeID','countyID',
+                 'yearID']
+    )
+    rates = index.to_frame(index = False)
+    rates['ratePerDistance'] = rng.random(len(rates))
+    return rates
+
+
+def makeVMX(years,numCounties = 2,fuelTypes = (1,2),seed = 0):
+    # the on-road vehicle mix CSV read by computeEmissions.py
+    rng = np.random.default_rng(seed)
+    sourceTypes = sorted(sum(vehTypeMap.values(),[]))
+    index = pd.MultiIndex.from_product(
+        [years,['WK','FR','SA','SU'],range(1,25),[2,3,4,5],
+         sourceTypes,fuelTypes,counties(numCounties)],
+        names = ['yearID','dayOfTheWeek','timeIntervalID','roadTypeID',
+                 'sourceTypeID','fuelTypeID','countyID']
+    )
+    vmx = index.to_frame(index = False)
+    vmx['VMTmix'] = rng.random(len(vmx))
+    return vmx
+
+
+def writeEmissionsInputs(directory,numLinks,numCounties = 2,
+                         years = (2020,),seed = 0):
+    # write links.csv, linkVMT.csv, rates.csv, vmx.csv and
+    # vehTypeMap.yaml into the directory
+    import os
+    import yaml
+    links = makeLinks(numLinks,numCounties,seed)
+    links.to_csv(os.path.join(directory,'links.csv'),index = False)
+    makeLinkVMT(links,seed = seed).to_csv(
+        os.path.join(directory,'linkVMT.csv'),index = False
+    )
+    makeRates(list(years),numCounties,seed = seed).to_csv(
+        os.path.join(directory,'rates.csv'),index = False
+    )
+    makeVMX(list(years),numCounties,seed = seed).to_csv(
+        os.path.join(directory,'vmx.csv'),index = False
+    )
+    with open(os.path.join(directory,'vehTypeMap.yaml'),'w') as f:
+        yaml.dump(vehTypeMap,f)
+
+
+def makeLinkShapes(numLinks,spacing = 400.,epsg = 3665,seed = 0):
+    # the DynusT links shapefile: numLinks edges of a square grid of
+    # nodes with a random direction and a jittered middle vertex so
+    # that every link has two straight segments
+    import geopandas as gpd
+    from shapely import linestrings
+    rng = np.random.default_rng(seed)
+    side = int(np.ceil(np.sqrt(numLinks/2))) + 1
+    nodes = np.arange(side*side).reshape(side,side)
+    aNodes = np.concatenate((nodes[:,:-1].ravel(),nodes[:-1,:].ravel()))
+    bNodes = np.concatenate((nodes[:,1:].ravel(),nodes[1:,:].ravel()))
+    aNodes,bNodes = aNodes[:numLinks],bNodes[:numLinks]
+    flip = rng.random(len(aNodes)) < 0.5
+    aNodes,bNodes = np.where(flip,bNodes,aNodes),np.where(flip,aNodes,bNodes)
+    # projected node coordinates in meters
+    x0,y0 = 1500000.,7300000.
+    xy = np.stack((x0 + spacing*(nodes.ravel() % side),
+                   y0 + spacing*(nodes.ravel()//side)),axis = 1)
+    start = xy[aNodes]
+    end = xy[bNodes]
+    middle = 0.5*(start + end) + rng.uniform(-0.1,0.1,(len(aNodes),2))*spacing
+    coords = np.stack((start,middle,end),axis = 1)
+    # DynusT node IDs start at 1
+    return gpd.GeoDataFrame({
+        'A_NODE':aNodes + 1,
+        'B_NODE':bNodes + 1,
+        '#LANES':rng.integers(1,5,len(aNodes)),
+        '#LTYPE':rng.choice([1,2,3,4,5,6,7],len(aNodes)),
+        '#SPEED':rng.choice([30,45,65],len(aNodes))
+    },geometry = linestrings(coords),crs = f'epsg:{epsg}')
+
+
+def makeCounties(shapes,size = 30000.,numCounties = 3000,
+                 verticesPerSide = 100,holes = 0.02,seed = 0):
+    # a Census like county layer in geographic coordinates: a grid of
+    # about numCounties square counties of size meters in the CRS of
+    # the shapes whose lower left part covers the shapes, with a few
+    # counties missing as holes; the sides of the counties are split
+    # into verticesPerSide segments like real county boundaries
+    import geopandas as gpd
+    from shapely import box,segmentize
+    rng = np.random.default_rng(seed)
+    x0,y0,x1,y1 = shapes.total_bounds
+    numX = max(int(np.ceil(np.sqrt(numCounties))),
+               int(np.ceil((x1 - x0)/size)) + 1)
+    numY = max(numCounties//numX,int(np.ceil((y1 - y0)/size)) + 1)
+    x,y = np.meshgrid(x0 - size/2 + size*np.arange(numX),
+                      y0 - size/2 + size*np.arange(numY))
+    x,y = x.ravel(),y.ravel()
+    keep = rng.random(len(x)) >= holes
+    geometry = segmentize(box(x[keep],y[keep],x[keep] + size,
+                              y[keep] + size),size/verticesPerSide)
+    return gpd.GeoDataFrame({
+        'GEOID':[f'{48001 + 2*i:05d}' for i in np.flatnonzero(keep)]
+    },geometry = geometry,crs = shapes.crs).to_crs(epsg = 4269)
+
+
+def makeEmissions(shapes,seed = 0):
+    # the emissions CSV written by computeEmissions.py for the links
+    # of the shapefile, aggregated to the source types
+    rng = np.random.default_rng(seed)
+    linkIDs = shapes.A_NODE.astype(str) + '-' + shapes.B_NODE.astype(str)
+    sourceTypes = sorted(sum(vehTypeMap.values(),[]))
+    index = pd.MultiIndex.from_product(
+        [linkIDs,pollutants,[0],sourceTypes],
+        names = ['linkID','pollutantID','fuelTypeID','sourceTypeID']
+    )
+    emissions = index.to_frame(index = False)
+    # log normal emissions so that the fluxes span orders of magnitude
+    emissions['emquant'] = rng.lognormal(0.,2.,len(emissions))
+    return emissions
+
+
+# the running exhaust operating modes of the MOVES matrices
+opModes = [0,1,11,12,13,14,15,16,21,22,23,24,25,27,28,29,30,
+           33,35,37,38,39,40]
+linkAvgSpeeds = [2.5] + list(range(5,80,5))
+
+def makeMovesRoot(directory,fipsList,year,month,numAges = 31,
+                  pollutantIDs = pollutants,seed = 0):
+    # the MOVES directory read by TransformMovesMatrix/moves.py: the
+    # reference tables and the matrices of a single fuel/IM region for
+    # the (T,H) of every county hour; every fourth matrix is written
+    # at the next humidity to exercise the missing matrix search; year
+    # and month can also be lists
+    import os
+    rng = np.random.default_rng(seed)
+    years = list(np.atleast_1d(year))
+    months = list(np.atleast_1d(month))
+    sourceTypes = sorted(sum(vehTypeMap.values(),[]))
+    ages = pd.MultiIndex.from_product(
+        [fipsList,sourceTypes,years,range(numAges)],
+        names = ['countyID','sourceTypeID','yearID','ageID']
+    ).to_frame(index = False)
+    ages['ageFraction'] = rng.random(len(ages))
+    ages['ageFraction'] /= ages.groupby(
+        ['countyID','sourceTypeID','yearID']
+    ).ageFraction.transform('sum')
+    ages.to_csv(os.path.join(directory,'age_distribution.csv'),
+                index = False)
+
+    meteo = pd.MultiIndex.from_product(
+        [[10*fips for fips in fipsList],range(1,13),range(1,25)],
+        names = ['zoneID','monthID','hourID']
+    ).to_frame(index = False)
+    meteo['temperature'] = rng.uniform(60.,95.,len(meteo))
+    meteo['relHumidity'] = rng.uniform(30.,90.,len(meteo))
+    meteo.to_csv(
+        os.path.join(directory,'MOVES20181022_zoneMonthHour.csv'),
+        index = False
+    )
+
+    pd.DataFrame({
+        'countyID':fipsList,'fuelID':10,'imID':0
+    }).to_excel(
+        os.path.join(directory,'moves_matrix_coverage_04-15-2020.xlsx'),
+        sheet_name = 'IM_fuel',index = False
+    )
+
+    opmode = pd.MultiIndex.from_product(
+        [sourceTypes,[2,3,4,5],linkAvgSpeeds,opModes],
+        names = ['sourceTypeID','roadTypeID','linkAvgSpeed','opModeID']
+    ).to_frame(index = False)
+    opmode['opModeFraction'] = rng.random(len(opmode))
+    opmode['opModeFraction'] /= opmode.groupby(
+        ['sourceTypeID','roadTypeID','linkAvgSpeed']
+    ).opModeFraction.transform('sum')
+    opmode.to_csv(os.path.join(directory,'default_opmode_project.csv'),
+                  index = False)
+
+    # the matrices of the (T,H) used in the months of the scenarios;
+    # the months that share a MOVES month share its matrices
+    import sys
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 '..','TransformMovesMatrix'))
+    from moves import monthMap,round5
+    numKeys = 0
+    for year in years:
+        prefix = os.path.join(directory,'f10i0',str(year))
+        os.makedirs(prefix,exist_ok = True)
+        matrix = pd.MultiIndex.from_product(
+            [opModes,pollutantIDs,sourceTypes,year - np.arange(numAges)],
+            names = ['opModeID','pollutantID','sourceTypeID','modelYearID']
+        ).to_frame(index = False)
+        for movesMonth in sorted(set(monthMap[m] for m in months)):
+            used = meteo[meteo.monthID.isin(
+                [m for m in months if monthMap[m] == movesMonth]
+            )]
+            keys = set(zip(used.temperature.apply(round5),
+                           used.relHumidity.apply(round5)))
+            for idx,(T,H) in enumerate(sorted(keys)):
+                if idx % 4 == 3: H += 5
+                matrix['emRate'] = rng.random(len(matrix))
+                matrix.to_csv(
+                    os.path.join(prefix,f'{movesMonth}_{T}_{H}.csv'),
+                    header = False,index = False
+                )
+            numKeys += len(keys)
+    return numKeys
+
+
+def makeAermodOuts(directory,numReceptors,numFiles,seed = 0):
+    # AERMOD plot files of numFiles source groups that share the same
+    # numReceptors receptors as read by AERMOD/combineOuts.py
+    import os
+    rng = np.random.default_rng(seed)
+    x = 1500000. + rng.uniform(0.,1e5,numReceptors)
+    y = 7300000. + rng.uniform(0.,1e5,numReceptors)
+    header = '* AERMOD synthetic plot file\n' \
+             '*         X             Y      AVERAGE CONC    ZELEV\n'
+    for idx in range(numFiles):
+        conc = rng.lognormal(-3.,1.,numReceptors)
+        lines = [f'{a:14.5f}{b:14.5f}{c:14.5f}{0.:9.2f}\n'
+                 for a,b,c in zip(x,y,conc)]
+        with open(os.path.join(directory,f'group_{idx}.out'),'w') as f:
+            f.write(header)
+            f.writelines(lines)
+
+
+def makeDynusT(directory,numVehicles,numLinks = 1000,maxNodes = 30,
+               tolls = False,seed = 0):
+    # links.csv, output_vehicle.dat.bz2 and VehTrajectory.dat.bz2 as
+    # read by the DynusT parser; the links form a chain of nodes along
+    # which every vehicle drives from a random link, the trajectories
+    # are written in a shuffled order, a twentieth of them are still
+    # in the network, some vehicles have no trajectory and some
+    # trajectories have no vehicle
+    import os
+    import bz2
+    rng = np.random.default_rng(seed)
+    links = makeLinks(numLinks,seed = seed)
+    links.to_csv(os.path.join(directory,'links.csv'),index = False)
+    fft = (links.length/links.speedLimit*60).values
+
+    ids = np.arange(1,numVehicles + 1)
+    numNodes = rng.integers(1,maxNodes + 1,numVehicles)
+    upstream = rng.integers(0,numLinks - maxNodes,numVehicles)
+    startTimes = np.round(rng.uniform(0.,1440.,numVehicles),2)
+    vehTypes = rng.choice(list(vehTypeMap),numVehicles)
+    fracs = np.round(rng.uniform(0.,1.,numVehicles),4)
+
+    with bz2.open(os.path.join(directory,'output_vehicle.dat.bz2'),
+                  'wt') as f:
+        f.write('  synthetic DynusT vehicle roster\n')
+        f.write('    ID  UpNode\n')
+        for row in zip(ids,upstream,startTimes,vehTypes,fracs):
+            ID,node,start,vehType,frac = row
+            line = f'{ID:9d}{node:7d}{"":7}{start:8.2f}{"":6}{vehType:6d}'
+            f.write(f'{line:<95}{frac:12.4f}\n')
+            f.write(f'{"":9}{rng.integers(1,100):5d}\n')
+
+    def rows(values,fmt):
+        # wrap a row of values into lines of 10
+        return ''.join(
+            ''.join(format(v,fmt) for v in values[idx:idx + 10]) + '\n'
+            for idx in range(0,len(values),10)
+        )
+
+    order = rng.permutation(numVehicles)
+    # the trajectories of vehicles that are not in the roster
+    extra = np.arange(numVehicles + 1,numVehicles + 1 + numVehicles//50)
+    inNetwork = rng.random(numVehicles) < 0.05
+    noTrajectory = rng.random(numVehicles) < 0.01
+    blocks = {False:[],True:[]}
+    for idx in list(order) + list(range(-len(extra),0)):
+        ID = ids[idx] if idx >= 0 else extra[idx]
+        if idx >= 0 and noTrajectory[idx]: continue
+        incomplete = idx >= 0 and inNetwork[idx]
+        first,n = upstream[idx],numNodes[idx]
+        nodes = first + 1 + np.arange(n)
+        # travel times rounded to the DynusT time resolution, a few of
+        # them are zero; delays and signal delays are cumulative
+        times = np.round(
+            fft[first:first + n]*rng.uniform(0.5,3.,n)*
+            (rng.random(n) > 0.02),2
+        )
+        cumulative = np.cumsum(times)
+        delays = np.cumsum(np.round(
+            np.maximum(times - fft[first:first + n],0.)*rng.random(n),2
+        ))
+        if incomplete: times,cumulative,delays = \
+           times[:-1],cumulative[:-1],delays[:-1]
+        header = f'Veh #{ID:9d} Tag= 1'
+        block = f'{header:<161}{n:4d}\n' + rows(nodes,'8d') + \
+            rows(cumulative,'8.2f') + rows(times,'8.2f') + \
+            rows(delays,'8.2f')
+        if tolls:
+            block += rows(np.round(
+                rng.choice([0.,0.5,1.25],len(times)),2
+            ),'8.2f')
+        blocks[incomplete].append(block)
+
+    with bz2.open(os.path.join(directory,'VehTrajectory.dat.bz2'),
+                  'wt') as f:
+        for idx in range(6):
+            f.write(f'  synthetic DynusT vehicle trajectories {idx}\n')
+        f.writelines(blocks[False])
+        f.write(' ##### vehicles still in the network\n')
+        f.writelines(blocks[True])
+    return links
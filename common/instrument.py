@@ -0,0 +1,172 @@
+'''leveled logging with throttled progress reports and the wall time,
+CPU time, peak RSS and item counts of the stages of a script; with
+--profile the stages are written to a JSON run report and with
+--cProfile every top level stage is also profiled'''
+
+import os
+import sys
+import json
+import time
+import atexit
+import logging
+import resource
+from contextlib import contextmanager
+
+log = logging.getLogger('paths')
+
+# the stages keyed by their path, e.g. "computeEmissions/readRates";
+# repeated runs of a stage are accumulated into the same record
+stages = {}
+# the records of the stages that are running, outermost first
+running = []
+# the total item counts of the run
+items = {}
+settings = {'progressInterval':5.,'profileDir':None,'start':time.time(),
+            'peakRSSMB':0.}
+profilers = {}
+lastProgress = {}
+
+def addArguments(parser):
+    parser.add_argument('--logLevel',default = 'INFO',
+                        choices = ['DEBUG','INFO','WARNING','ERROR'])
+    parser.add_argument('--quiet',action = 'store_true',
+                        help = 'only log warnings and errors')
+    parser.add_argument('--progressInterval',type = float,default = 5.,
+                        help = 'seconds between progress reports')
+    parser.add_argument('--profile',metavar = 'PATH',
+                        help = 'write the JSON run report with the time, '
+                        'memory and item counts of every stage to PATH')
+    parser.add_argument('--cProfile',metavar = 'DIR',
+                        help = 'dump the cProfile statistics of every top '
+                        'level stage into DIR')
+
+
+def configure(args = None):
+    # set up the logging and the run report from the parsed arguments
+    level = 'INFO' if args is None else args.logLevel
+    if args is not None and args.quiet: level = 'WARNING'
+    logging.basicConfig(stream = sys.stdout,format = '%(message)s')
+    log.setLevel(level)
+    if args is None: return
+    settings['progressInterval'] = args.progressInterval
+    if args.cProfile:
+        os.makedirs(args.cProfile,exist_ok = True)
+        settings['profileDir'] = args.cProfile
+        atexit.register(dumpProfiles)
+    if args.profile:
+        atexit.register(writeReport,args.profile)
+
+
+def peakRSS():
+    # peak RSS in MB since the last reset; ru_maxrss survives exec on
+    # Linux and would report the peak of the parent, VmHWM does not
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])/1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024
+
+
+def resetPeakRSS():
+    # reset VmHWM to the current RSS (Linux 4.0+); elsewhere the peaks
+    # of the stages are the peaks of the process up to their end
+    try:
+        with open('/proc/self/clear_refs','w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def foldPeak(records):
+    peak = peakRSS()
+    settings['peakRSSMB'] = max(settings['peakRSSMB'],peak)
+    for record in records:
+        record['peakRSSMB'] = max(record['peakRSSMB'],peak)
+
+
+def processPeakRSS():
+    # the peak RSS of the run including the peaks before the resets
+    foldPeak([])
+    return settings['peakRSSMB']
+
+
+@contextmanager
+def stage(name):
+    # time a stage of the script; can also be used as a decorator
+    path = '/'.join([r['path'] for r in running[-1:]] + [name])
+    record = stages.setdefault(path,{
+        'path':path,'calls':0,'seconds':0.,'cpuSeconds':0.,
+        'peakRSSMB':0.,'items':{}
+    })
+    # credit the peak so far to the enclosing stages before resetting
+    foldPeak(running)
+    resetPeakRSS()
+    running.append(record)
+    profiler = None
+    if settings['profileDir'] and len(running) == 1:
+        import cProfile
+        profiler = profilers.setdefault(path,cProfile.Profile())
+        profiler.enable()
+    start = time.perf_counter()
+    cpuStart = time.process_time()
+    try:
+        yield record
+    finally:
+        elapsed = time.perf_counter() - start
+        record['seconds'] += elapsed
+        record['cpuSeconds'] += time.process_time() - cpuStart
+        record['calls'] += 1
+        if profiler is not None: profiler.disable()
+        foldPeak(running)
+        running.pop()
+        log.debug(f'{path} took {elapsed:.3f} s')
+
+
+def count(name,number = 1):
+    # add to the item counts of the innermost stage and of the run
+    if running:
+        stageItems = running[-1]['items']
+        stageItems[name] = stageItems.get(name,0) + number
+    items[name] = items.get(name,0) + number
+
+
+def progress(message,done,total = None):
+    # log the progress at most every progressInterval seconds and
+    # always when the last item is done
+    now = time.monotonic()
+    last = lastProgress.get(message)
+    if done != total and last is not None and \
+       now - last < settings['progressInterval']:
+        return
+    lastProgress[message] = now
+    if total is None:
+        log.info(f'{message} {done}')
+    else:
+        log.info(f'{message} {done} out of {total}')
+        if done == total: del lastProgress[message]
+
+
+def writeReport(path):
+    foldPeak(running)
+    report = {
+        'script':os.path.basename(sys.argv[0]),
+        'argv':sys.argv[1:],
+        'started':settings['start'],
+        'seconds':time.time() - settings['start'],
+        'peakRSSMB':processPeakRSS(),
+        'items':items,
+        'stages':list(stages.values())
+    }
+    with open(path,'w') as f:
+        json.dump(report,f,indent = 1)
+    log.info(f'Wrote the run report to {path}')
+
+
+def dumpProfiles():
+    for path,profiler in profilers.items():
+        profiler.dump_stats(os.path.join(
+            settings['profileDir'],path.replace('/','_') + '.prof'
+        ))
@@ -0,0 +1,57 @@
+'''pack the (A_NODE,B_NODE) node IDs of a link into a single int64 key
+and convert the keys from and to the legacy "A-B" linkID strings; the
+string form is meant to be used only when reading and writing files'''
+
+import numpy as np
+import pandas as pd
+
+def packLinkKey(aNodes,bNodes):
+    aNodes = np.asarray(aNodes,dtype = np.int64)
+    bNodes = np.asarray(bNodes,dtype = np.int64)
+    if len(aNodes) and (min(aNodes.min(),bNodes.min()) < 0 or
+                        max(aNodes.max(),bNodes.max()) >= 2**31):
+        raise ValueError('node IDs must be in [0,2**31)')
+    return (aNodes << 32) | bNodes
+
+
+def unpackLinkKey(keys):
+    keys = np.asarray(keys,dtype = np.int64)
+    return keys >> 32,keys & 0xffffffff
+
+
+def linkKeyFromID(linkIDs):
+    # parse every distinct "A-B" string once
+    if isinstance(linkIDs.dtype,pd.CategoricalDtype):
+        codes = linkIDs.cat.codes.values
+        uniques = linkIDs.cat.categories
+    else:
+        codes,uniques = pd.factorize(linkIDs)
+    nodes = pd.Series(uniques).astype(str).str.split(
+        '-',n = 1,expand = True
+    ).astype(np.int64)
+    keys = packLinkKey(nodes[0].values,nodes[1].values)
+    return keys[codes]
+
+
+def uniqueLinkIDs(keys):
+    # the codes of the keys and the string form of the distinct keys
+    codes,uniques = pd.factorize(np.asarray(keys,dtype = np.int64))
+    aNodes,bNodes = unpackLinkKey(uniques)
+    linkIDs = pd.Series(aNodes).astype(str) + '-' + \
+              pd.Series(bNodes).astype(str)
+    return codes,linkIDs.values
+
+
+def linkIDFromKey(keys):
+    # format every distinct key once
+    codes,linkIDs = uniqueLinkIDs(keys)
+    return linkIDs[codes]
+
+
+def linkIDOrder(keys):
+    # the stable order of the rows that sorts them by the string form
+    # of their keys the way the legacy string linkIDs were sorted
+    codes,linkIDs = uniqueLinkIDs(keys)
+    rank = np.empty(len(linkIDs),dtype = np.int64)
+    rank[np.argsort(linkIDs,kind = 'stable')] = np.arange(len(linkIDs))
+    return np.argsort(rank[codes],kind = 'stable')
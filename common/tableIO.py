@@ -0,0 +1,106 @@
+'''read and write tables as CSV, Parquet or Arrow IPC (Feather)
+depending on the file extension; the key columns are stored as
+categorical or narrow integer types in the columnar formats'''
+
+import numpy as np
+import pandas as pd
+from smart_open import open
+
+# the key columns and the narrowest integer type that holds them
+keyTypes = {
+    'countyID':np.int32,
+    'zoneID':np.int32,
+    'yearID':np.int16,
+    'monthID':np.int8,
+    'hourID':np.int8,
+    'timeIntervalID':np.int16,
+    'dayOfTheWeek':'category',
+    'linkID':'category',
+    'vehType':np.int16,
+    'roadTypeID':np.int8,
+    'sourceTypeID':np.int16,
+    'fuelTypeID':np.int8,
+    'pollutantID':np.int16,
+    'processID':np.int16,
+    'opModeID':np.int16,
+    'avgSpeedBinID':np.int16,
+    'modelYearID':np.int16,
+    'ageID':np.int16
+}
+
+def tableFormat(path):
+    path = str(path).lower()
+    for ext in ('.gz','.bz2','.zst','.xz'):
+        if path.endswith(ext): path = path[:-len(ext)]
+    if path.endswith(('.parquet','.pq')): return 'parquet'
+    if path.endswith(('.arrow','.feather','.ipc')): return 'arrow'
+    return 'csv'
+
+
+def compactKeys(df):
+    # cast the key columns to categorical or narrow integer types;
+    # columns with missing values or out of range integers are left
+    # alone
+    df = df.infer_objects()
+    for column,dtype in keyTypes.items():
+        if column not in df.columns: continue
+        values = df[column]
+        if dtype == 'category':
+            df[column] = values.astype('category')
+            continue
+        if not pd.api.types.is_integer_dtype(values.dtype): continue
+        info = np.iinfo(dtype)
+        if len(values) and (values.min() < info.min or
+                            values.max() > info.max):
+            continue
+        df[column] = values.astype(dtype)
+    return df
+
+
+def readTable(path,**kwargs):
+    # the keyword arguments are passed to pandas.read_csv
+    fmt = tableFormat(path)
+    if fmt == 'parquet':
+        with open(path,'rb') as f:
+            return pd.read_parquet(f)
+    if fmt == 'arrow':
+        with open(path,'rb') as f:
+            return pd.read_feather(f)
+    with open(path) as f:
+        return pd.read_csv(f,**kwargs)
+
+
+def readChunks(path,chunksize):
+    # iterate over the table in dataframes of at most chunksize rows
+    fmt = tableFormat(path)
+    if fmt == 'csv':
+        with open(path) as f:
+            yield from pd.read_csv(f,chunksize = chunksize)
+        return
+    import pyarrow.parquet as pq
+    import pyarrow.ipc as ipc
+    with open(path,'rb') as f:
+        if fmt == 'parquet':
+            batches = pq.ParquetFile(f).iter_batches(batch_size = chunksize)
+        else:
+            reader = ipc.open_file(f)
+            batches = (reader.get_batch(idx)
+                       for idx in range(reader.num_record_batches))
+        for batch in batches:
+            for start in range(0,batch.num_rows,chunksize):
+                yield batch.slice(start,chunksize).to_pandas()
+
+
+def writeTable(df,path,**kwargs):
+    # the keyword arguments are passed to DataFrame.to_csv
+    fmt = tableFormat(path)
+    if fmt == 'csv':
+        with open(path,'w') as f:
+            df.to_csv(f,index = False,**kwargs)
+        return
+    df = compactKeys(df.reset_index(drop = True))
+    with open(path,'wb') as f:
+        if fmt == 'parquet':
+            df.to_parquet(f,index = False)
+        else:
+            df.to_feather(f)